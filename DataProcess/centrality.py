@@ -0,0 +1,166 @@
+# This file contains the centrality stage, it finds the most central members of every community
+# How it works
+# Degree centrality inside the communities is computed for all nodes at once from the edge arrays
+# of NetworkData/graph_store.py: an edge counts when both ends are in the same community
+# PageRank and sampled betweenness need one computation per community, communities of at least
+# min_parallel_size nodes are spread over a process pool, the small ones run in this process
+# The top ratio of every community is picked with np.partition instead of sorting the whole community
+# Output centrality.csv has one row per center: Community Num, Rank, ID, Score
+# tweets_crawler.py reads the ID column in file order
+
+import os
+import sys
+import math
+import multiprocessing
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join("..", "NetworkData"))
+from graph_store import CSRGraph
+
+CENTRALITY_PATH = "centrality.csv"
+
+def community_of_nodes(graph, membership):
+    """Community number of every node of the graph by dense index, -1 for nodes without one"""
+    index = graph.index(membership["ID"].to_numpy())
+    if (index < 0).any():
+        print("Warning: {} members are not in the graph".format(int((index < 0).sum())))
+    communities = np.full(graph.number_of_nodes(), -1, dtype=np.int64)
+    communities[index[index >= 0]] = membership["Community Num"].to_numpy()[index >= 0]
+    return communities
+
+def intra_edges(graph, communities):
+    """Edges with both ends in the same community, every edge once as dense (rows, cols)"""
+    rows, cols = graph.edge_index()
+    same = (communities[rows] == communities[cols]) & (communities[rows] >= 0)
+    return rows[same], cols[same]
+
+def degree_centrality(graph, communities):
+    """Degree inside the community divided by community size - 1, like nx.degree_centrality of the subgraph"""
+    rows, cols = intra_edges(graph, communities)
+    num = graph.number_of_nodes()
+    degree = np.bincount(rows, minlength=num) + np.bincount(cols, minlength=num)
+    sizes = np.bincount(communities[communities >= 0])[np.maximum(communities, 0)]
+    return np.where(sizes > 1, degree / np.maximum(sizes - 1, 1), 1.0)
+
+def split_communities(graph, communities):
+    """One job per community: (dense node indices, local rows, local cols) with local indices into the nodes"""
+    rows, cols = intra_edges(graph, communities)
+    members = np.flatnonzero(communities >= 0)
+    members = members[np.argsort(communities[members], kind="stable")]
+    local = np.empty(graph.number_of_nodes(), dtype=np.int64)
+    bounds = np.r_[0, np.flatnonzero(np.diff(communities[members])) + 1, len(members)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        local[members[start:end]] = np.arange(end - start)
+    order = np.argsort(communities[rows], kind="stable")
+    rows, cols = rows[order], cols[order]
+    edge_bounds = np.searchsorted(communities[rows], communities[members[bounds[:-1]]]) if len(members) else []
+    edge_bounds = np.r_[edge_bounds, len(rows)]
+    return [(members[bounds[i]:bounds[i + 1]], local[rows[edge_bounds[i]:edge_bounds[i + 1]]], local[cols[edge_bounds[i]:edge_bounds[i + 1]]])
+            for i in range(len(bounds) - 1)]
+
+def _local_csr(size, rows, cols):
+    """Both directions of the edges of one community as CSR"""
+    sources, targets = np.r_[rows, cols], np.r_[cols, rows]
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+    return indptr, targets[order]
+
+def pagerank_block(job, alpha=0.85, max_iter=100, tolerance=1e-10):
+    """PageRank of one community, nodes without edges inside it share their rank with the whole community"""
+    size, rows, cols = job
+    sources, targets = np.r_[rows, cols], np.r_[cols, rows]
+    degree = np.bincount(sources, minlength=size).astype(np.float64)
+    dangling = degree == 0
+    rank = np.full(size, 1.0 / size)
+    for _ in range(max_iter):
+        spread = np.divide(rank, degree, out=np.zeros(size), where=~dangling)
+        new_rank = alpha * np.bincount(targets, weights=spread[sources], minlength=size)
+        new_rank += (alpha * rank[dangling].sum() + 1 - alpha) / size
+        done = np.abs(new_rank - rank).sum() < size * tolerance
+        rank = new_rank
+        if done:
+            break
+    return rank
+
+def _expand(indptr, indices, frontier):
+    """All edges out of the frontier as (sources, targets)"""
+    counts = indptr[frontier + 1] - indptr[frontier]
+    offsets = np.repeat(indptr[frontier] - np.r_[0, np.cumsum(counts)[:-1]], counts)
+    return np.repeat(frontier, counts), indices[offsets + np.arange(counts.sum())]
+
+def betweenness_block(job, samples=64, seed=0):
+    """Betweenness of one community from breadth first searches of up to samples source nodes (Brandes)
+    Normalized like nx.betweenness_centrality, exact when samples >= community size"""
+    size, rows, cols = job
+    indptr, indices = _local_csr(size, rows, cols)
+    sources = np.random.default_rng(seed).permutation(size)[:samples]
+    result = np.zeros(size)
+    for source in sources:
+        distance = np.full(size, -1)
+        distance[source] = 0
+        paths = np.zeros(size)
+        paths[source] = 1
+        levels = []
+        frontier = np.array([source])
+        while len(frontier) > 0:
+            a, b = _expand(indptr, indices, frontier)
+            b_new = np.unique(b[distance[b] < 0])
+            distance[b_new] = distance[frontier[0]] + 1
+            forward = distance[b] == distance[frontier[0]] + 1
+            a, b = a[forward], b[forward]
+            np.add.at(paths, b, paths[a])
+            levels.append((a, b))
+            frontier = b_new
+        dependency = np.zeros(size)
+        for a, b in reversed(levels):
+            np.add.at(dependency, a, paths[a] / paths[b] * (1 + dependency[b]))
+        dependency[source] = 0
+        result += dependency
+    if size > 2:
+        result *= size / len(sources) / ((size - 1) * (size - 2)) # every pair is counted from both ends
+    return result
+
+def _run_job(args):
+    method, job, options = args
+    return METHODS[method](job, **options)
+
+METHODS = {"pagerank": pagerank_block, "betweenness": betweenness_block}
+
+def community_centrality(graph, communities, method="pagerank", workers=1, min_parallel_size=5000, **options):
+    """PageRank or betweenness of every node inside its community
+    Communities of at least min_parallel_size nodes run in a pool of workers processes"""
+    scores = np.zeros(graph.number_of_nodes())
+    jobs = [(nodes, (len(nodes), rows, cols)) for nodes, rows, cols in split_communities(graph, communities)]
+    large = [x for x in jobs if len(x[0]) >= min_parallel_size] if workers > 1 else []
+    small = [x for x in jobs if not (workers > 1 and len(x[0]) >= min_parallel_size)]
+    if len(large) > 0:
+        with multiprocessing.Pool(min(workers, len(large))) as pool:
+            for (nodes, _), result in zip(large, pool.imap(_run_job, [(method, job, options) for _, job in large])):
+                scores[nodes] = result
+    for nodes, job in small:
+        scores[nodes] = METHODS[method](job, **options)
+    return scores
+
+def top_share(graph, communities, scores, ratio=0.2):
+    """The ceil(size * ratio) highest scores of every community, best first, ties by smaller ID
+    Return the centers table: Community Num, Rank, ID, Score"""
+    members = np.flatnonzero(communities >= 0)
+    members = members[np.argsort(communities[members], kind="stable")] # by community, then ID as ids are sorted
+    bounds = np.r_[0, np.flatnonzero(np.diff(communities[members])) + 1, len(members)]
+    picked, ranks = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        nodes = members[start:end]
+        k = math.ceil(len(nodes) * ratio)
+        if k < len(nodes): # partial selection, the k-th score splits the community
+            kth = -np.partition(-scores[nodes], k - 1)[k - 1]
+            equal = scores[nodes] == kth
+            nodes = nodes[(scores[nodes] > kth) | (equal & (np.cumsum(equal) <= k - (scores[nodes] > kth).sum()))]
+        picked.append(nodes[np.argsort(-scores[nodes], kind="stable")])
+        ranks.append(np.arange(len(nodes)))
+    picked, ranks = np.concatenate(picked), np.concatenate(ranks)
+    return pd.DataFrame({"Community Num": communities[picked], "Rank": ranks, "ID": np.asarray(graph.ids)[picked], "Score": scores[picked]})
+
+def read_centers(path=CENTRALITY_PATH):
+    """Centers table in file order, community by community, best first"""
+    return pd.read_csv(path, dtype={"Community Num": np.int64, "Rank": np.int64, "ID": np.int64})
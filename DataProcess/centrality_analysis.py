@@ -1,29 +1,31 @@
 import os
-import math
-import itertools
-import pandas as pd
-import networkx as nx
+import sys
+import argparse
+sys.path.append(os.path.join("..", "NetworkData"))
+from graph_store import load_graph, GRAPH_PATH, EDGES_PATH
+from communities import read_membership
+from centrality import community_of_nodes, degree_centrality, community_centrality, top_share, CENTRALITY_PATH
 
-graph = nx.from_pandas_edgelist(pd.read_csv(os.path.join("..", "NetworkData", "fetchcontent.csv")))
-communities = pd.read_csv("community.csv")
+if __name__ == "__main__": # the pool may start fresh interpreters that import this file
+    parser = argparse.ArgumentParser(description="Find the most central members of every community, see centrality.py")
+    parser.add_argument("--method", choices=["degree", "pagerank", "betweenness"], default="degree")
+    parser.add_argument("--ratio", type=float, default=0.2, help="share of every community to keep")
+    parser.add_argument("--workers", type=int, default=1, help="processes for pagerank and betweenness")
+    parser.add_argument("--min-parallel-size", type=int, default=5000, help="smaller communities run in this process")
+    parser.add_argument("--samples", type=int, default=64, help="source nodes per community for betweenness")
+    args = parser.parse_args()
 
-centrality = []
-counter = 0
+    graph = load_graph(os.path.join("..", "NetworkData", GRAPH_PATH), os.path.join("..", "NetworkData", EDGES_PATH))
+    communities = community_of_nodes(graph, read_membership())
 
-ratio = 0.2
+    if args.method == "degree":
+        scores = degree_centrality(graph, communities)
+    else:
+        options = {"samples": args.samples} if args.method == "betweenness" else {}
+        scores = community_centrality(graph, communities, args.method, workers=args.workers,
+                                      min_parallel_size=args.min_parallel_size, **options)
 
-for subgraphlist in communities["Members"]:
-    subgraphnodes = [int(x) for x in subgraphlist.split(" | ")]
-    subgraph = graph.subgraph(subgraphnodes)
-    totalcentra = nx.degree_centrality(subgraph)
-    totalcentra = [[k, v] for k, v in sorted(totalcentra.items(), key=lambda item: item[1])]
-    result_len = math.ceil(len(totalcentra) * ratio)
-    result = list(reversed(totalcentra))[:result_len]
-    result_str = " | ".join([str(x) for (x, y) in result])
-    centrality.append(result_str)
-    print("Community {}: {}".format(counter, result))
-    counter += 1
-
-df = pd.DataFrame(centrality, columns=["Centers ID"])
-df.index.rename("Commnuity Num", inplace=True)
-df.to_csv("centrality.csv")
\ No newline at end of file
+    df = top_share(graph, communities, scores, ratio=args.ratio)
+    df.to_csv(CENTRALITY_PATH, index=False)
+    for community_num, centers in df.groupby("Community Num"):
+        print("Community {}: {} centers".format(community_num, len(centers)))
@@ -0,0 +1,236 @@
+# This file contains the community detection stage over the compact graph of NetworkData/graph_store.py
+# How it works
+# The graph is kept as CSR arrays (indptr, indices, weights) over dense node indices
+# Every sweep scores all (node, neighbour community) pairs at once with NumPy:
+#   louvain            gain = k_in - degree * total_degree_of_community / 2m
+#   label propagation  gain = k_in
+# and moves a random share of the nodes to their best community, so two neighbours rarely swap places
+# Louvain then merges every community into one node and runs again on the smaller graph
+# Sweeps are synchronous, so blocks of rows can be scored in parallel threads and the result
+# only depends on the seed, never on the number of workers
+# Membership is written as a table with one row per node: ID, Community Num
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.join("..", "NetworkData"))
+from graph_store import CSRGraph
+
+COMMUNITY_PATH = "community.csv"
+
+class LevelGraph:
+    """Weighted undirected graph over dense indices, a self loop holds the weight inside a merged node"""
+    def __init__(self, indptr, indices, weights):
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        self.degree = np.bincount(self.rows, weights=weights, minlength=len(indptr) - 1)
+        self.total_weight = self.degree.sum() # 2m
+
+    @classmethod
+    def from_csr(cls, graph):
+        indptr = np.asarray(graph.indptr, dtype=np.int64)
+        indices = np.asarray(graph.indices, dtype=np.int64)
+        return cls(indptr, indices, np.ones(len(indices)))
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def aggregate(self, labels, num_labels):
+        """Graph with one node per label, edge weights summed"""
+        keys, inverse = np.unique(labels[self.rows] * num_labels + labels[self.indices], return_inverse=True)
+        rows, cols = np.divmod(keys, num_labels)
+        indptr = np.zeros(num_labels + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_labels), out=indptr[1:])
+        return LevelGraph(indptr, cols, np.bincount(inverse, weights=self.weights, minlength=len(keys)))
+
+def modularity(graph, labels):
+    """Newman modularity of a partition of a LevelGraph"""
+    if graph.total_weight == 0:
+        return 0.0
+    inside = graph.weights[labels[graph.rows] == labels[graph.indices]].sum()
+    totals = np.bincount(labels, weights=graph.degree)
+    return (inside - np.dot(totals, totals) / graph.total_weight) / graph.total_weight
+
+def best_moves(graph, labels, start, end, totals=None, salt=0):
+    """Best community of every node in rows [start, end)
+    With totals the gain is the louvain modularity gain, without it the weight towards the community
+    Ties are broken by a hash of (node, community, salt), so no community wins every tie
+    Return (nodes, communities, gains) for nodes that gain by moving"""
+    lo, hi = graph.indptr[start], graph.indptr[end]
+    rows, cols = graph.rows[lo:hi], graph.indices[lo:hi]
+    loop = rows == cols # weight inside a merged node never moves with it
+    rows, cols, weights = rows[~loop], cols[~loop], graph.weights[lo:hi][~loop]
+    num_labels = len(labels)
+    keys, inverse = np.unique(rows * num_labels + labels[cols], return_inverse=True)
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    nodes, candidates = np.divmod(keys, num_labels)
+    gains = np.bincount(inverse, weights=weights)
+    own = candidates == labels[nodes]
+    stay = np.zeros(end - start)
+    if totals is not None:
+        degree = graph.degree[nodes]
+        gains -= degree * (totals[candidates] - own * degree) / graph.total_weight
+        stay -= graph.degree[start:end] * (totals[labels[start:end]] - graph.degree[start:end]) / graph.total_weight
+    stay[nodes[own] - start] = gains[own]
+    ranked = gains + (((keys.astype(np.uint64) + np.uint64(salt)) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(40)) * 2.0**-24 * 1e-9
+    groups = np.flatnonzero(np.r_[True, nodes[1:] != nodes[:-1]]) # keys are sorted by node
+    best = np.repeat(np.maximum.reduceat(ranked, groups), np.diff(np.r_[groups, len(nodes)]))
+    pairs = np.flatnonzero(ranked >= best)
+    pairs = pairs[np.r_[True, nodes[pairs][1:] != nodes[pairs][:-1]]]
+    moving = gains[pairs] > stay[nodes[pairs] - start] + 1e-12
+    pairs = pairs[moving]
+    return nodes[pairs], candidates[pairs], gains[pairs] - stay[nodes[pairs] - start]
+
+def local_moves(graph, labels, rng, louvain=True, move_share=0.5, max_sweeps=100, tolerance=1e-7, workers=1):
+    """Move nodes between communities until the partition stops improving, labels are changed in place
+    Return the number of sweeps"""
+    num = len(graph)
+    # blocks with about the same number of edges, scored in parallel
+    bounds = np.unique(np.searchsorted(graph.indptr, np.linspace(0, graph.indptr[-1], workers + 1)[1:-1]))
+    blocks = list(zip(np.r_[0, bounds], np.r_[bounds, num]))
+    executor = ThreadPoolExecutor(workers) if workers > 1 and len(blocks) > 1 else None
+    score = modularity(graph, labels) if louvain else 0.0
+    try:
+        for sweep in range(max_sweeps):
+            totals = np.bincount(labels, weights=graph.degree, minlength=num) if louvain else None
+            salt = int(rng.integers(2**62))
+            jobs = [(graph, labels, start, end, totals, salt) for start, end in blocks]
+            results = list(executor.map(lambda x: best_moves(*x), jobs)) if executor else [best_moves(*x) for x in jobs]
+            nodes, targets, gains = (np.concatenate(x) for x in zip(*results))
+            # a random share moves, the rest keep their community so neighbours do not swap forever
+            chosen = rng.random(num)[nodes] < move_share
+            sizes = np.bincount(labels, minlength=num)
+            # two single nodes merge only one way
+            swap = (sizes[labels[nodes]] == 1) & (sizes[targets] == 1) & (targets > labels[nodes])
+            nodes, targets = nodes[chosen & ~swap], targets[chosen & ~swap]
+            if len(nodes) == 0:
+                if len(gains) == 0 or move_share >= 1.0:
+                    return sweep
+                move_share = min(1.0, move_share * 2) # only unlucky draws left, let more nodes move
+                continue
+            old = labels[nodes]
+            labels[nodes] = targets
+            if louvain:
+                new_score = modularity(graph, labels)
+                if new_score < score: # too many simultaneous moves, undo and move fewer nodes
+                    labels[nodes] = old
+                    move_share /= 2
+                    if move_share < 1e-3:
+                        return sweep
+                    continue
+                improved, score = new_score - score, new_score
+                if improved < tolerance:
+                    return sweep + 1
+        return max_sweeps
+    finally:
+        if executor:
+            executor.shutdown()
+
+def louvain(graph, seed=0, workers=1, max_levels=20, tolerance=1e-7):
+    """Louvain communities of a CSRGraph, dense community number of every node"""
+    rng = np.random.default_rng(seed)
+    level = LevelGraph.from_csr(graph)
+    membership = np.arange(len(level))
+    for _ in range(max_levels):
+        labels = np.arange(len(level))
+        local_moves(level, labels, rng, louvain=True, tolerance=tolerance, workers=workers)
+        _, labels = np.unique(labels, return_inverse=True)
+        num_labels = labels.max() + 1 if len(labels) else 0
+        membership = labels[membership]
+        if num_labels == len(level): # nothing merged
+            break
+        level = level.aggregate(labels, num_labels)
+    return renumber(membership)
+
+def label_propagation(graph, seed=0, workers=1, max_iter=100):
+    """Label propagation communities of a CSRGraph, dense community number of every node"""
+    level = LevelGraph.from_csr(graph)
+    labels = np.arange(len(level))
+    local_moves(level, labels, np.random.default_rng(seed), louvain=False, max_sweeps=max_iter, workers=workers)
+    return renumber(labels)
+
+def renumber(labels):
+    """Community 0 is the largest, ties by smallest member"""
+    _, first, inverse, sizes = np.unique(labels, return_index=True, return_inverse=True, return_counts=True)
+    order = np.lexsort((first, -sizes))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[inverse]
+
+def membership_table(graph, labels):
+    """One row per node: ID, Community Num, sorted by community"""
+    table = pd.DataFrame({"ID": np.asarray(graph.ids), "Community Num": labels})
+    return table.sort_values(["Community Num", "ID"], kind="stable").reset_index(drop=True)
+
+def read_membership(path=COMMUNITY_PATH):
+    return pd.read_csv(path, dtype={"ID": np.int64, "Community Num": np.int64})
+
+def planted_partition(num_nodes, num_communities, avg_degree=12, mixing=0.1, seed=0):
+    """Random graph with known communities, return (CSRGraph, community of every node in graph order)"""
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(2**62, size=num_nodes, replace=False))
+    truth = rng.integers(0, num_communities, num_nodes)
+    members = np.argsort(truth, kind="stable")
+    starts = np.searchsorted(truth[members], np.arange(num_communities))
+    sizes = np.bincount(truth, minlength=num_communities)
+    num_edges = num_nodes * avg_degree // 2
+    sources = rng.integers(0, num_nodes, num_edges)
+    community = truth[sources]
+    targets = members[starts[community] + (rng.random(num_edges) * sizes[community]).astype(np.int64)]
+    mixed = rng.random(num_edges) < mixing
+    targets[mixed] = rng.integers(0, num_nodes, mixed.sum())
+    graph = CSRGraph.from_edges(ids[sources], ids[targets])
+    return graph, truth[np.searchsorted(ids, graph.ids)]
+
+def legacy_detection(graph):
+    """community_detection.py before this stage: python-louvain on networkx and ' | ' joined strings"""
+    import community
+    partition = community.best_partition(graph.to_networkx())
+    dict_nodes = {}
+    for node, community_num in partition.items():
+        if community_num in dict_nodes.keys():
+            dict_nodes.update({community_num: dict_nodes.get(community_num) + ' | ' + str(node)})
+        else:
+            dict_nodes.update({community_num: str(node)})
+    return dict_nodes
+
+def benchmark(name, graph, methods, truth=None):
+    level = LevelGraph.from_csr(graph)
+    print("{}: {} nodes, {} edges".format(name, graph.number_of_nodes(), graph.number_of_edges()))
+    for method, run in methods.items():
+        start = time.perf_counter()
+        try:
+            labels = run(graph)
+        except ImportError as e:
+            print("{:>12}: skipped, {}".format(method, e))
+            continue
+        elapsed = time.perf_counter() - start
+        if isinstance(labels, dict): # legacy output
+            print("{:>12}: {:.2f}s, {} communities".format(method, elapsed, len(labels)))
+            continue
+        result = "{:>12}: {:.2f}s, {} communities, modularity {:.4f}".format(method, elapsed, labels.max() + 1, modularity(level, labels))
+        if truth is not None:
+            result += ", planted modularity {:.4f}".format(modularity(level, truth))
+        print(result)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark community detection")
+    parser.add_argument("--scale", type=int, default=100, help="size of the synthetic graph relative to the crawled one")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    methods = {"louvain": lambda g: louvain(g, seed=args.seed, workers=args.workers),
+               "propagation": lambda g: label_propagation(g, seed=args.seed, workers=args.workers),
+               "legacy": legacy_detection}
+    crawled = CSRGraph.from_csv(os.path.join("..", "NetworkData", "fetchcontent.csv"))
+    benchmark("crawled graph", crawled, methods)
+    num_nodes = crawled.number_of_nodes() * args.scale
+    synthetic, truth = planted_partition(num_nodes, num_nodes // 500, avg_degree=max(2, 2 * crawled.number_of_edges() // crawled.number_of_nodes()), seed=args.seed)
+    benchmark("synthetic graph x{}".format(args.scale), synthetic, methods, truth)
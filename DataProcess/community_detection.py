@@ -1,34 +1,25 @@
 import os
-import community
-import pandas as pd
-import networkx as nx
-
-graphdf = pd.read_csv(os.path.join("..", "NetworkData", "fetchcontent.csv"))
-G = nx.from_pandas_edgelist(graphdf)
-
-partition = community.best_partition(G)
-
-# following code comes from https://medium.com/@adityagandhi.7/network-analysis-and-community-structure-for-market-surveillance-using-python-networkx-65413e7b7fee
-
-values=[partition.get(node) for node in G.nodes()]
-list_com=partition.values()
-
-# Creating a dictionary like {community_number:list_of_participants}
-dict_nodes={}
-
-# Populating the dictionary with items
-for each_item in partition.items():
-    community_num=each_item[1]
-    community_node=str(each_item[0])
-    if community_num in dict_nodes.keys():
-        value=dict_nodes.get(community_num) + ' | ' + community_node
-        dict_nodes.update({community_num:value})
-    else:
-        dict_nodes.update({community_num:community_node})
-
-# Creating a dataframe from the diet, and getting the output into excel
-community_df=pd.DataFrame.from_dict(dict_nodes, orient='index',columns=['Members'])
-community_df.index.rename('Community Num' , inplace=True)
-community_df.to_csv('community.csv')
-
-print("Number of communities: {}".format(len(community_df.index)))
\ No newline at end of file
+import sys
+import argparse
+sys.path.append(os.path.join("..", "NetworkData"))
+from graph_store import load_graph, GRAPH_PATH, EDGES_PATH
+from communities import louvain, label_propagation, membership_table, COMMUNITY_PATH
+
+parser = argparse.ArgumentParser(description="Detect communities of the crawled graph, see communities.py")
+parser.add_argument("--method", choices=["louvain", "propagation"], default="louvain")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--workers", type=int, default=1, help="threads scoring the local moves")
+args = parser.parse_args()
+
+graph = load_graph(os.path.join("..", "NetworkData", GRAPH_PATH), os.path.join("..", "NetworkData", EDGES_PATH))
+
+if args.method == "louvain":
+    labels = louvain(graph, seed=args.seed, workers=args.workers)
+else:
+    labels = label_propagation(graph, seed=args.seed, workers=args.workers)
+
+# one row per node: ID, Community Num
+community_df = membership_table(graph, labels)
+community_df.to_csv(COMMUNITY_PATH, index=False)
+
+print("Number of communities: {}".format(labels.max() + 1 if len(labels) else 0))
@@ -0,0 +1,96 @@
+# Tests for the centrality stage, compared against per community loops like the old centrality_analysis.py
+# run with: python -m pytest test_centrality.py
+
+import math
+import numpy as np
+import pytest
+from centrality import (CSRGraph, community_of_nodes, degree_centrality, pagerank_block, betweenness_block,
+                        community_centrality, top_share, read_centers)
+from communities import louvain, membership_table, planted_partition
+
+def two_triangles():
+    """Triangles 1-2-3 and 4-5-6 joined by the edge 3-4, node 7 hangs off 6"""
+    graph = CSRGraph.from_edges([1, 2, 3, 4, 5, 6, 3, 6], [2, 3, 1, 5, 6, 4, 4, 7])
+    return graph, np.array([0, 0, 0, 1, 1, 1, 1])
+
+def planted():
+    graph, _ = planted_partition(1500, 6, mixing=0.1, seed=0)
+    return graph, community_of_nodes(graph, membership_table(graph, louvain(graph)))
+
+def test_degree_centrality_counts_only_edges_inside_the_community():
+    graph, communities = two_triangles()
+    assert degree_centrality(graph, communities).tolist() == pytest.approx([1, 1, 1, 2 / 3, 2 / 3, 1, 1 / 3])
+
+def test_degree_centrality_matches_networkx():
+    nx = pytest.importorskip("networkx")
+    graph, communities = planted()
+    scores = degree_centrality(graph, communities)
+    whole = graph.to_networkx()
+    for community in range(communities.max() + 1):
+        members = graph.ids[communities == community]
+        expected = nx.degree_centrality(whole.subgraph(members.tolist()))
+        assert scores[communities == community] == pytest.approx([expected[x] for x in members.tolist()])
+
+def test_community_of_nodes_skips_unknown_members():
+    graph, _ = two_triangles()
+    membership = membership_table(graph, np.zeros(7, dtype=np.int64))
+    membership.loc[len(membership)] = [99, 0]
+    assert community_of_nodes(graph, membership.iloc[1:]).tolist() == [-1, 0, 0, 0, 0, 0, 0]
+
+def test_top_share_matches_full_sort():
+    graph, communities = planted()
+    scores = np.round(np.random.default_rng(1).random(len(communities)), 2) # many ties
+    table = top_share(graph, communities, scores, ratio=0.2)
+    for community in range(communities.max() + 1):
+        members = np.flatnonzero(communities == community)
+        order = members[np.lexsort((graph.ids[members], -scores[members]))] # best first, ties by smaller ID
+        expected = graph.ids[order[:math.ceil(len(members) * 0.2)]]
+        found = table[table["Community Num"] == community]
+        assert found["ID"].tolist() == expected.tolist()
+        assert found["Rank"].tolist() == list(range(len(expected)))
+    assert table["Community Num"].is_monotonic_increasing
+
+def test_pagerank_matches_networkx():
+    nx = pytest.importorskip("networkx")
+    graph, communities = planted()
+    scores = community_centrality(graph, communities, "pagerank")
+    whole = graph.to_networkx()
+    members = graph.ids[communities == 0]
+    expected = nx.pagerank(whole.subgraph(members.tolist()), tol=1e-12)
+    assert scores[communities == 0] == pytest.approx([expected[x] for x in members.tolist()], abs=1e-8)
+
+def test_pagerank_of_a_star():
+    rank = pagerank_block((5, np.zeros(3, dtype=np.int64), np.array([1, 2, 3]))) # node 4 has no edges
+    assert rank.sum() == pytest.approx(1)
+    assert rank[0] > rank[1] > rank[4]
+    assert rank[1] == pytest.approx(rank[3])
+
+def test_betweenness_of_a_path_and_a_star():
+    path = betweenness_block((4, np.array([0, 1, 2]), np.array([1, 2, 3])), samples=4)
+    assert path.tolist() == pytest.approx([0, 2 / 3, 2 / 3, 0]) # nx.betweenness_centrality(nx.path_graph(4))
+    star = betweenness_block((5, np.zeros(4, dtype=np.int64), np.array([1, 2, 3, 4])), samples=5)
+    assert star.tolist() == pytest.approx([1, 0, 0, 0, 0])
+
+def test_betweenness_matches_networkx():
+    nx = pytest.importorskip("networkx")
+    graph, communities = planted()
+    size = int((communities == 1).sum())
+    scores = community_centrality(graph, communities, "betweenness", samples=size)
+    members = graph.ids[communities == 1]
+    expected = nx.betweenness_centrality(graph.to_networkx().subgraph(members.tolist()))
+    assert scores[communities == 1] == pytest.approx([expected[x] for x in members.tolist()])
+
+def test_process_pool_gives_the_same_scores():
+    graph, communities = planted()
+    for method in ("pagerank", "betweenness"):
+        serial = community_centrality(graph, communities, method)
+        parallel = community_centrality(graph, communities, method, workers=2, min_parallel_size=200)
+        assert np.allclose(serial, parallel)
+
+def test_centers_table_round_trip(tmp_path):
+    graph, communities = two_triangles()
+    table = top_share(graph, communities, degree_centrality(graph, communities), ratio=0.5)
+    assert table["ID"].tolist() == [1, 2, 6, 4]
+    path = str(tmp_path / "centrality.csv")
+    table.to_csv(path, index=False)
+    assert read_centers(path)["ID"].tolist() == [1, 2, 6, 4]
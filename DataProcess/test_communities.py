@@ -0,0 +1,73 @@
+# Tests for the community detection stage on small graphs with known communities
+# run with: python -m pytest test_communities.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from communities import (CSRGraph, LevelGraph, modularity, louvain, label_propagation, renumber,
+                         membership_table, read_membership, planted_partition)
+
+def two_triangles():
+    """Triangles 1-2-3 and 4-5-6 joined by the edge 3-4"""
+    return CSRGraph.from_edges([1, 2, 3, 4, 5, 6, 3], [2, 3, 1, 5, 6, 4, 4])
+
+def purity(labels, truth):
+    """Share of nodes in the most common found community of their planted community"""
+    return pd.crosstab(truth, labels).to_numpy().max(axis=1).sum() / len(labels)
+
+def test_modularity_of_two_triangles():
+    level = LevelGraph.from_csr(two_triangles())
+    assert modularity(level, np.array([0, 0, 0, 1, 1, 1])) == pytest.approx(5 / 14)
+    assert modularity(level, np.zeros(6, dtype=np.int64)) == pytest.approx(0)
+
+def test_modularity_matches_networkx():
+    nx = pytest.importorskip("networkx")
+    graph, truth = planted_partition(300, 6, seed=1)
+    communities = [set(graph.ids[truth == c].tolist()) for c in range(6)]
+    expected = nx.algorithms.community.modularity(graph.to_networkx(), communities)
+    assert modularity(LevelGraph.from_csr(graph), truth) == pytest.approx(expected)
+
+def test_louvain_splits_two_triangles():
+    labels = louvain(two_triangles())
+    assert labels.tolist() == [0, 0, 0, 1, 1, 1]
+
+def test_louvain_finds_planted_communities():
+    graph, truth = planted_partition(3000, 12, mixing=0.05, seed=2)
+    labels = louvain(graph, seed=0)
+    level = LevelGraph.from_csr(graph)
+    assert purity(labels, truth) > 0.95
+    assert modularity(level, labels) >= modularity(level, truth) - 0.01
+
+def test_label_propagation_finds_planted_communities():
+    graph, truth = planted_partition(3000, 12, mixing=0.05, seed=3)
+    labels = label_propagation(graph, seed=0)
+    assert purity(labels, truth) > 0.9
+
+def test_same_seed_same_partition_for_any_number_of_workers():
+    graph, _ = planted_partition(2000, 10, mixing=0.2, seed=4)
+    labels = louvain(graph, seed=7)
+    assert np.array_equal(labels, louvain(graph, seed=7, workers=3))
+    assert np.array_equal(label_propagation(graph, seed=7), label_propagation(graph, seed=7, workers=3))
+
+def test_aggregate_keeps_modularity():
+    graph, truth = planted_partition(500, 5, mixing=0.3, seed=5)
+    level = LevelGraph.from_csr(graph)
+    merged = level.aggregate(truth, 5)
+    assert merged.total_weight == pytest.approx(level.total_weight)
+    assert modularity(merged, np.arange(5)) == pytest.approx(modularity(level, truth))
+
+def test_empty_graph():
+    graph = CSRGraph.from_edges([], [])
+    assert len(louvain(graph)) == 0 and len(label_propagation(graph)) == 0
+
+def test_renumber_largest_first():
+    assert renumber(np.array([5, 9, 9, 2, 9, 5])).tolist() == [1, 0, 0, 2, 0, 1]
+
+def test_membership_table_round_trip(tmp_path):
+    graph = two_triangles()
+    table = membership_table(graph, np.array([1, 1, 1, 0, 0, 0]))
+    assert table.columns.tolist() == ["ID", "Community Num"]
+    assert table["ID"].tolist() == [4, 5, 6, 1, 2, 3]
+    path = str(tmp_path / "community.csv")
+    table.to_csv(path, index=False)
+    assert read_membership(path).equals(table)
@@ -0,0 +1,91 @@
+# Tests for the concurrent timeline fetcher and the tweet sink against the local fake Twitter api
+# run with: python -m pytest test_timeline_fetcher.py
+
+import os
+import sys
+import threading
+sys.path.append(os.path.join("..", "NetworkData"))
+from ratelimit import Credential, CredentialScheduler
+from fake_twitter import FakeTwitter, FakeRateLimitError, FakeTweepError
+from timeline_fetcher import TimelineFetcher
+from tweet_sink import TweetSink, read_tweets
+
+def make_scheduler(twitter, num, latency=0.0):
+    credentials = [Credential(twitter.client(latency=latency), name=str(i), limits={"user_timeline": 10**6}) for i in range(num)]
+    return CredentialScheduler(credentials, rate_limit_error=FakeRateLimitError)
+
+def timeline(scheduler):
+    return lambda userid: [x.full_text for x in scheduler.call("user_timeline", user_id=userid, count=50)]
+
+def run_in_thread(fetcher, userids, timeout=10):
+    """Run the fetcher, fail instead of hanging the test suite"""
+    result = {}
+    def target():
+        try:
+            result["left"] = fetcher.run(userids)
+        except Exception as e:
+            result["error"] = e
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "fetch hangs"
+    return result
+
+def test_every_user_is_fetched_once_across_credentials():
+    twitter = FakeTwitter(num_users=300, protected=0.05, seed=1)
+    scheduler = make_scheduler(twitter, 4, latency=0.001)
+    results = {}
+    def on_result(userid, tweets, error):
+        assert userid not in results
+        results[userid] = (tweets, error)
+    fetcher = TimelineFetcher(scheduler, timeline(scheduler), on_result=on_result, api_error=FakeTweepError)
+    assert run_in_thread(fetcher, twitter.ids) == {"left": []}
+    assert set(results) == set(twitter.ids)
+    api = twitter.client()
+    for userid, (tweets, error) in results.items():
+        if userid in twitter.protected:
+            assert tweets is None and isinstance(error, FakeTweepError)
+        else:
+            assert tweets == [x.full_text for x in api.user_timeline(user_id=userid, count=50)]
+    assert fetcher.stats()["errors"] == len(twitter.protected)
+    assert all(c.api.calls.get("user_timeline", 0) > 0 for c in scheduler.credentials)
+
+def test_unexpected_error_stops_and_keeps_the_user():
+    twitter = FakeTwitter(num_users=200, protected=0, seed=2)
+    scheduler = make_scheduler(twitter, 3, latency=0.001)
+    fetch = timeline(scheduler)
+    seen = []
+    def failing(userid):
+        if userid == twitter.ids[20]:
+            raise ConnectionError("connection reset")
+        return fetch(userid)
+    fetcher = TimelineFetcher(scheduler, failing, on_result=lambda userid, *_: seen.append(userid), api_error=FakeTweepError)
+    result = run_in_thread(fetcher, twitter.ids)
+    assert isinstance(result.get("error"), ConnectionError)
+    left = list(fetcher.queue)
+    assert twitter.ids[20] in left and twitter.ids[20] not in seen
+    assert sorted(seen + left) == sorted(twitter.ids) # nothing lost, nothing twice
+
+def test_sink_round_trip_and_crash_repair(tmp_path):
+    path = str(tmp_path / "tweets.jsonl")
+    sink = TweetSink(path)
+    sink.write_user(123456789012345678, ["first tweet", "12345", 'quote " and ü'])
+    sink.write_user(7, ["only one"])
+    sink.close()
+    with open(path, "a") as outFile:
+        outFile.write('{"User ID": 9, "Twe') # crash in the middle of a line
+    sink = TweetSink(path)
+    assert sink.users() == {123456789012345678, 7}
+    sink.write_user(9, ["after the crash"])
+    sink.close()
+    tweets = read_tweets(path)
+    assert tweets.columns.tolist() == ["User ID", "Tweet"]
+    assert tweets["User ID"].tolist() == [123456789012345678] * 3 + [7, 9]
+    assert tweets["Tweet"].tolist() == ["first tweet", "12345", 'quote " and ü', "only one", "after the crash"]
+
+def test_empty_sink(tmp_path):
+    path = str(tmp_path / "tweets.jsonl")
+    sink = TweetSink(path)
+    assert sink.users() == set()
+    sink.close()
+    assert len(read_tweets(path)) == 0
@@ -0,0 +1,93 @@
+# Tests for the tweet quality stage, compared against the per tweet loop TweetCrawler.run used before
+# run with: python -m pytest test_tweet_quality.py
+
+import os
+import sys
+import random
+import pandas as pd
+sys.path.append(os.path.join("..", "NetworkData"))
+sys.path.append(os.path.join("..", "Recommender"))
+from preprocessing import count_words
+from fake_twitter import FakeTwitter
+from tweet_quality import score_tweets, select_tweets, refilter
+from tweet_sink import TweetSink, read_tweets
+
+def original_filter(tweets, min_words_per_tweet, num_per_user, min_per_user):
+    """Tweets the crawler kept for one user before the quality stage"""
+    tweets_with_length = [[text, count_words(text)] for text in tweets]
+    tweets_with_length.sort(key=lambda x: x[1], reverse=True) # sort by number of words
+    final_tweets = [x[0] for x in tweets_with_length if x[1] >= min_words_per_tweet][:num_per_user]
+    return final_tweets if len(final_tweets) >= min_per_user else []
+
+def make_timelines(num_users=40, seed=0):
+    twitter = FakeTwitter(num_users=num_users, seed=seed)
+    api = twitter.client()
+    rows = [(userid, x.full_text, x.lang) for userid in twitter.ids for x in api.user_timeline(user_id=userid, count=100)]
+    return pd.DataFrame(rows, columns=["User ID", "Tweet", "Lang"])
+
+def kept_by_user(tweets, keep):
+    return {userid: group["Tweet"].tolist() for userid, group in tweets[keep].groupby("User ID", sort=False)}
+
+def test_selection_matches_the_original_loop():
+    tweets = make_timelines()
+    scored = score_tweets(tweets)
+    scored["Duplicate"] = False # the old loop kept everything but short tweets
+    scored["Retweet"] = False
+    keep = select_tweets(scored, min_words_per_tweet=5, num_per_user=10, min_per_user=5)
+    found = kept_by_user(scored, keep)
+    for userid, group in tweets.groupby("User ID", sort=False):
+        expected = original_filter(group["Tweet"].tolist(), 5, 10, 5)
+        # same tweets, longest first, equal lengths in timeline order
+        assert sorted(found.get(userid, []), key=lambda x: -count_words(x)) == expected
+
+def test_scores():
+    tweets = pd.DataFrame({"User ID": [1, 1, 1, 1, 2, 2],
+                           "Tweet": ["Hello big world of mine", "RT @bob_1: hello  BIG world of mine http://t.co/x",
+                                     "hello big world of MINE", "a b", "Hello big world of mine", "RT @x: other"]})
+    scored = score_tweets(tweets)
+    assert scored["Words"].tolist() == [5, 6, 5, 2, 5, 2] # "RT" counts, as in count_words
+    assert scored["Retweet"].tolist() == [False, True, False, False, False, True]
+    assert scored["Duplicate"].tolist() == [False, True, True, False, False, False] # per user only
+    assert tweets.columns.tolist() == ["User ID", "Tweet"] # input is not changed
+
+def test_select_drops_duplicates_retweets_and_other_languages():
+    tweets = pd.DataFrame({"User ID": [1] * 5, "Lang": ["en", "en", "en", "fr", "en"],
+                           "Tweet": ["one two three", "one two three", "RT @a: four five six", "sept huit neuf", "ten eleven twelve"]})
+    scored = score_tweets(tweets)
+    assert select_tweets(scored, 3, 10, 1, limit_lan="en").tolist() == [True, False, False, False, True]
+    assert select_tweets(scored, 3, 10, 1, drop_retweets=False).tolist() == [True, False, True, True, True]
+    assert not select_tweets(scored, 3, 10, 3, limit_lan="en").any() # only 2 good tweets
+
+def test_empty_timeline():
+    tweets = score_tweets(pd.DataFrame({"User ID": 5, "Tweet": [], "Lang": []}))
+    assert len(select_tweets(tweets)) == 0
+
+def test_refilter_at_a_lower_threshold(tmp_path):
+    tweets = make_timelines(seed=1)
+    path = str(tmp_path / "tweets.jsonl")
+    sink = TweetSink(path)
+    for userid, group in tweets.groupby("User ID", sort=False):
+        scored = score_tweets(group)
+        keep = select_tweets(scored, 10, 20, 3, "en")
+        sink.write_user(userid, scored["Tweet"].tolist(), Lang=scored["Lang"].tolist(), Words=scored["Words"].tolist(), Keep=keep.tolist())
+    sink.close()
+    strict = read_tweets(path)
+    assert strict.columns.tolist() == ["User ID", "Tweet"]
+    num_users, num_tweets = refilter(path, min_words_per_tweet=3, num_per_user=20, min_per_user=3, limit_lan="en")
+    loose = read_tweets(path)
+    assert len(loose) == num_tweets > len(strict) and loose["User ID"].nunique() == num_users
+    assert len(read_tweets(path, kept_only=False)) == len(tweets) # nothing fetched is lost
+    scored = score_tweets(tweets)
+    assert len(loose) == select_tweets(scored, 3, 20, 3, "en").sum()
+
+def test_refilter_csv(tmp_path):
+    rng = random.Random(0)
+    path = str(tmp_path / "tweets.csv")
+    pd.DataFrame({"User ID": [rng.randint(1, 5) for _ in range(200)],
+                  "Tweet": [" ".join("word{}".format(rng.randint(0, 50)) for _ in range(rng.randint(1, 12))) for _ in range(200)]}).to_csv(path, index=False)
+    refilter(path, str(tmp_path / "out.csv"), min_words_per_tweet=6, num_per_user=5, min_per_user=1)
+    out = read_tweets(str(tmp_path / "out.csv"), kept_only=False)
+    kept = out[out["Keep"]]
+    assert len(out) == 200 and kept["User ID"].value_counts().max() <= 5
+    assert kept["Words"].min() >= 6
+    assert read_tweets(str(tmp_path / "out.csv")).columns.tolist() == ["User ID", "Tweet"]
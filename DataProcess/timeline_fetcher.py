@@ -0,0 +1,82 @@
+# This file contains the concurrent timeline fetcher used by tweets_crawler.py
+# How it works
+# One worker thread per credential takes user ids from a shared queue and calls fetch(userid),
+# every call inside goes to the credential with quota available soonest (see NetworkData/ratelimit.py)
+# Each result is passed to on_result outside the lock, so writing one user never holds up the others
+# A user whose fetch raises api_error is reported with result None and not tried again
+# Any other error stops all workers, its user goes back to the queue and run() raises it
+
+import threading
+from collections import deque
+
+class TimelineFetcher:
+    def __init__(self, scheduler, fetch, on_result=None, api_error=Exception, num_workers=None):
+        self.scheduler = scheduler # ratelimit.CredentialScheduler
+        self.fetch = fetch # userid -> result, called from the worker threads
+        self.on_result = on_result # called with (userid, result or None, api error or None)
+        self.api_error = api_error
+        self.num_workers = num_workers or len(scheduler.credentials) # one worker per credential by default
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.done = False
+        self.num_fetched = 0
+        self.num_errors = 0
+        self.error = None
+
+    def run(self, userids):
+        """Fetch all users, return the ids left when an unexpected error stopped the workers"""
+        assert self.num_workers >= 1
+        self.queue.extend(userids)
+        self.done = False
+        self.error = None
+        workers = [threading.Thread(target=self._worker, name="timeline-{}".format(i), daemon=True)
+                   for i in range(min(self.num_workers, max(len(self.queue), 1)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if self.error is not None:
+            raise self.error
+        return list(self.queue)
+
+    def stats(self):
+        with self.lock:
+            return {"fetched": self.num_fetched,
+                    "errors": self.num_errors,
+                    "queue": len(self.queue),
+                    "apis": self.scheduler.stats()}
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                if self.done or len(self.queue) == 0:
+                    return
+                userid = self.queue.popleft()
+            result, api_error = None, None
+            try:
+                result = self.fetch(userid)
+            except self.api_error as e:
+                api_error = e
+            except Exception as e: # stops the fetch, raised again by run()
+                self._fail(e, userid)
+                return
+            with self.lock:
+                if api_error is None:
+                    self.num_fetched += 1
+                else:
+                    self.num_errors += 1
+            if self.on_result is not None:
+                try:
+                    self.on_result(userid, result, api_error)
+                except Exception as e:
+                    self._fail(e, userid)
+                    return
+
+    def _fail(self, error, userid):
+        """Stop all workers on an unexpected error, the user is kept for the next run"""
+        print("Fetch stopped by error: {!r}".format(error))
+        with self.lock:
+            if self.error is None:
+                self.error = error
+            self.done = True
+            self.queue.appendleft(userid)
@@ -0,0 +1,68 @@
+# This file contains the tweet quality stage of tweets_crawler.py, it also re-filters a tweets file offline
+# How it works
+# Whole timelines are scored at once: word counts go through the batch preprocessing of Recommender/preprocessing.py,
+# retweets and repeated tweets are found from the same pass and pandas string ops
+# select_tweets marks the tweets to keep: the num_per_user longest good tweets of every user
+# with at least min_per_user of them
+# The crawler writes every fetched tweet with its Keep flag (see tweet_sink.py), so refilter can apply
+# new settings, a lower min_words_per_tweet too, without fetching again
+# run with: python tweet_quality.py tweets_200.jsonl --min-words 8
+
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join("..", "Recommender"))
+from preprocessing import letters_only_texts
+from tweet_sink import read_tweets, write_tweets
+
+RETWEET_PREFIX = "RT @"
+
+def score_tweets(tweets):
+    """Copy of a User ID, Tweet table with Words, Retweet and Duplicate columns
+    A duplicate repeats an earlier tweet of the same user, ignoring case, tags, urls, punctuation and the retweet prefix"""
+    scored = tweets.copy()
+    texts = scored["Tweet"].astype(str)
+    words = [x.split() for x in letters_only_texts(texts)] # one pass over all texts, see preprocessing.py
+    scored["Words"] = np.array([len(x) for x in words], dtype=np.int64)
+    scored["Retweet"] = texts.str.startswith(RETWEET_PREFIX).to_numpy(dtype=bool)
+    key = [" ".join(x[1:] if retweet else x) for x, retweet in zip(words, scored["Retweet"])] # without the leading "rt"
+    scored["Duplicate"] = pd.DataFrame({"User ID": scored["User ID"].to_numpy(), "Key": key}).duplicated().to_numpy()
+    return scored
+
+def select_tweets(scored, min_words_per_tweet=5, num_per_user=50, min_per_user=5, limit_lan=None, drop_retweets=True):
+    """Boolean Series, True for the tweets to keep, the longest first like the crawler always did"""
+    good = (scored["Words"] >= min_words_per_tweet) & ~scored["Duplicate"]
+    if drop_retweets:
+        good &= ~scored["Retweet"]
+    if limit_lan is not None and "Lang" in scored:
+        good &= scored["Lang"] == limit_lan
+    ranked = scored[good].sort_values("Words", ascending=False, kind="stable")
+    keep = pd.Series(False, index=scored.index)
+    keep[ranked.index[(ranked.groupby("User ID").cumcount() < num_per_user).to_numpy()]] = True
+    return keep & (keep.groupby(scored["User ID"]).transform("sum") >= min_per_user)
+
+def refilter(input_path, output_path=None, **settings):
+    """Apply new select_tweets settings to a tweets file, written in place by default
+    Return the number of (users, tweets) kept"""
+    tweets = read_tweets(input_path, kept_only=False)
+    scored = score_tweets(tweets[["User ID", "Tweet"] + [x for x in ("Lang",) if x in tweets]])
+    scored["Keep"] = select_tweets(scored, **settings)
+    write_tweets(scored[["User ID", "Tweet"] + [x for x in ("Lang", "Words", "Keep") if x in scored]], output_path or input_path)
+    kept = scored[scored["Keep"]]
+    return kept["User ID"].nunique(), len(kept)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filter a tweets file again without fetching")
+    parser.add_argument("input", help="tweets .jsonl from tweets_crawler.py, or a csv with User ID and Tweet columns")
+    parser.add_argument("--output", default=None, help="defaults to the input file, a csv input is written as csv")
+    parser.add_argument("--min-words", type=int, default=5)
+    parser.add_argument("--per-user", type=int, default=200)
+    parser.add_argument("--min-per-user", type=int, default=5)
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--keep-retweets", action="store_true")
+    args = parser.parse_args()
+    num_users, num_tweets = refilter(args.input, args.output, min_words_per_tweet=args.min_words, num_per_user=args.per_user,
+                                     min_per_user=args.min_per_user, limit_lan=args.lang, drop_retweets=not args.keep_retweets)
+    print("Kept {} tweets of {} users".format(num_tweets, num_users))
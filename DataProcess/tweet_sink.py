@@ -0,0 +1,77 @@
+# This file contains the append-only tweet output of tweets_crawler.py
+# How it works
+# Every fetched user is appended as JSON Lines, one line per tweet: {"User ID": ..., "Tweet": ..., more columns}
+# tweets_crawler.py also writes Lang, Words and Keep, tweets with Keep false are only there for tweet_quality.refilter
+# All lines of a user are written and flushed with one write, so a crash can only cut the last line,
+# which is dropped the next time the file is opened
+# pandas reads the file as it is (see read_tweets), so there is no separate conversion to csv
+
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+
+class TweetSink:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock() # workers of the timeline fetcher write from their own threads
+        self._repair()
+        self.file = open(path, "a", encoding="utf-8")
+        self.num_users = 0
+        self.num_tweets = 0
+
+    def write_user(self, userid, tweets, **columns):
+        """Append all tweets of one user, columns are lists with one value per tweet"""
+        names = ["User ID", "Tweet"] + list(columns.keys())
+        lines = "".join(json.dumps(dict(zip(names, (userid,) + row))) + "\n" for row in zip(tweets, *columns.values()))
+        with self.lock:
+            self.file.write(lines)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.num_users += 1
+            self.num_tweets += len(tweets)
+
+    def users(self):
+        """Ids of all users in the file, from this run or earlier ones"""
+        with self.lock:
+            self.file.flush()
+        return set(read_tweets(self.path, kept_only=False)["User ID"].tolist())
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def _repair(self):
+        """Drop a line cut by a crash"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as inFile:
+            data = inFile.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                print("Dropping an incomplete line at the end of {}".format(self.path))
+                inFile.truncate(end)
+
+def read_tweets(path, kept_only=True):
+    """Tweets from a JSON Lines sink, or from a csv with User ID and Tweet columns
+    With kept_only, only the User ID and Tweet of tweets kept by the quality stage"""
+    if not path.endswith(".jsonl"):
+        tweets = pd.read_csv(path)
+    elif os.path.getsize(path) == 0:
+        tweets = pd.DataFrame({"User ID": np.zeros(0, dtype=np.int64), "Tweet": np.zeros(0, dtype=object)})
+    else:
+        tweets = pd.read_json(path, lines=True, dtype={"User ID": np.int64, "Tweet": str})
+    if kept_only and "Keep" in tweets:
+        tweets = tweets.loc[tweets["Keep"].astype(bool), ["User ID", "Tweet"]].reset_index(drop=True)
+    return tweets
+
+def write_tweets(tweets, path):
+    """Replace a tweets file with a table, as JSON Lines or csv by the file extension"""
+    if path.endswith(".jsonl"):
+        with open(path + ".tmp", "w", encoding="utf-8") as outFile:
+            for row in tweets.to_dict("records"):
+                outFile.write(json.dumps({k: (v.item() if hasattr(v, "item") else v) for k, v in row.items()}) + "\n")
+    else:
+        tweets.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
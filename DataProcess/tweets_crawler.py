@@ -2,37 +2,28 @@
 # from specific users
 
 import os
-import re
 import sys
-import json
 import time
 import tweepy
-import pickle
+import threading
 import pandas as pd
-import networkx as nx
+sys.path.append(os.path.join("..", "Recommender"))
+sys.path.append(os.path.join("..", "NetworkData"))
+from ratelimit import load_scheduler, RateLimited
+from crawl_store import CrawlStore
+from centrality import read_centers
+from tweet_sink import TweetSink
+from timeline_fetcher import TimelineFetcher
+from tweet_quality import score_tweets, select_tweets
 
-class TwitterAPI:
-    def __init__(self, tweepy_api):
-        self.api = tweepy_api
-        self.remaining_time = 0
-        self.block_time = 0
-
-    def block(self):
-        """Block this api if rate limit exceeds"""
-        self.remaining_time = 15 * 60 + 5 # for how long to restart
-        self.block_time = time.time() # store block time
-    
-    def update(self):
-        """Refresh the api"""
-        if(self.remaining_time == 0):
-            return
-        self.remaining_time -= (time.time() - self.block_time)
-        self.remaining_time = 0 if self.remaining_time <= 0 else self.remaining_time
+STORE_PATH = "tweets_crawler.py.crawl.db"
 
 class TweetCrawler:
-    def __init__(self, userids, auth_path="auth.json", limit_lan="en", num_per_user=50, min_per_user=5, min_words_per_tweet=5, only_long_tweets=True, keep_cache=False):
+    def __init__(self, userids, auth_path="auth.json", limit_lan="en", num_per_user=50, min_per_user=5, min_words_per_tweet=5, only_long_tweets=True, keep_cache=False, store_path=STORE_PATH, output_path=None, drop_retweets=True):
         self.auth_path = auth_path
-        self.api_queue = []
+        self.store_path = store_path # crawl log, see NetworkData/crawl_store.py
+        self.store = None
+        self.scheduler = None
         self.num_per_user = num_per_user
         if only_long_tweets:
             assert num_per_user <= 1500 # max fetch less than 3000
@@ -41,131 +32,114 @@ class TweetCrawler:
         self.target_user_ids = userids
         self.min_per_user = min_per_user
         self.cursor = -1
-        self.current_userid_index = 0
-        self.tweets = {}
-        self.char_list = list(range(97, 123)) + list(range(65, 91)) + [ord(' '), ord('\'')]
         self.limit_lan = limit_lan
         self.min_words_per_tweet = min_words_per_tweet
+        self.drop_retweets = drop_retweets
+        self.output_path = output_path or "tweets_{}.jsonl".format(num_per_user) # see tweet_sink.py
+        self.num_finished = 0
 
     def load_auths(self):
         """Load auth apis from json"""
         assert os.path.exists(self.auth_path)
-        with open(self.auth_path, "r") as inFile:
-            data = json.load(inFile)
-        for api_info in data:
-            print("Loading api info from " + api_info["id"])
-            auth = tweepy.OAuthHandler(consumer_key=api_info["API_key"], consumer_secret=api_info["API_sec_key"])
-            auth.set_access_token(key=api_info["Access_token"], secret=api_info["Access_sec_token"])
-            tweepyapi = tweepy.API(auth)
-            if(tweepyapi is None):
-                print("Failed to init api for " + api_info["id"])
-                continue
-            api = TwitterAPI(tweepyapi)
-            self.api_queue.append(api)
-            print("Load complete")
+        self.scheduler = load_scheduler(self.auth_path)
 
-    def run(self, savefile=True):
-        """Get tweets from target users"""
+    def run(self):
+        """Get tweets from target users, one worker per api, every fetched user is appended to output_path"""
         assert len(self.target_user_ids) >= 1
-        num = len(self.target_user_ids) - self.current_userid_index - 1
-        print("Total num of ids to crawl: {}".format(num))
-        print("Max num of tweets per user: {}".format(self.num_per_user))
-        #num *= self.num_per_user
-        #if self.only_long_tweets: num *= 2
-        #print("Estimated running time: {:.2f}hr".format(num / (len(self.api_queue) * 1500) * 15 / 60)) # this estimated time is not accurate, in reality, there seems to be no rate limit on user_timeline call
+        assert self.scheduler is not None and len(self.scheduler.credentials) >= 1
         if not hasattr(self, "start_time") or self.start_time is None:
             self.start_time = time.time()
-        while self.current_userid_index < len(self.target_user_ids):
-            current_user = self.target_user_ids[self.current_userid_index]
-            percent = (self.current_userid_index+1)/len(self.target_user_ids)*100
-            print("{:.1f}% - Now crawling tweets from userid={}".format(percent, current_user))
-            try:
-                if self.only_long_tweets:
-                    tweets = self.api_queue[0].api.user_timeline(user_id=current_user, count=self.num_per_user*2, tweet_mode="extended", lang=self.limit_lan) # if only long tweets, need to fetch more
-                else:
-                    tweets = self.api_queue[0].api.user_timeline(user_id=current_user, count=self.num_per_user, tweet_mode="extended", lang=self.limit_lan)
-            except tweepy.RateLimitError:
-                self.api_queue[0].block() # block current api
-                remaining = self.recycle_apis() # recycle apis
-                self._tmp_save()
-                if(remaining > 0): # if all apis are blocked, then wait
-                    print("All APIs are blocked, sleeping for {:.2f}s".format(remaining))
-                    time.sleep(remaining + 1)
-                continue
-            except tweepy.TweepError as e:
-                print("Error: {}\nCurrent userid = {}\nIgnore and continue".format(e, current_user))
-                self._tmp_save()
-                self.current_userid_index += 1
-                continue
+        if self.store is None and os.path.exists(self.output_path): # a new crawl replaces the old output
+            os.remove(self.output_path)
+        store = self._open_store()
+        store.set_meta(target_user_ids=self.target_user_ids, limit_lan=self.limit_lan, num_per_user=self.num_per_user,
+                       min_per_user=self.min_per_user, min_words_per_tweet=self.min_words_per_tweet,
+                       only_long_tweets=self.only_long_tweets, keep_cache=self.keep_cache, start_time=self.start_time,
+                       output_path=self.output_path, drop_retweets=self.drop_retweets)
+        sink = TweetSink(self.output_path)
+        finished = set(store.finished_users()) | sink.users() # a user can be in the output before its log record
+        todo = [x for x in self.target_user_ids if x not in finished]
+        self.num_finished = len(self.target_user_ids) - len(todo)
+        print("Total num of ids to crawl: {}".format(len(todo)))
+        print("Max num of tweets per user: {}".format(self.num_per_user))
+        progress = threading.Lock()
+        def on_result(userid, tweets, error):
+            if error is not None:
+                print("Error: {}\nCurrent userid = {}\nIgnore and continue".format(error, userid))
+                status = "error"
             else:
-                tweets = [tweet.full_text for tweet in tweets]
-                tweets_with_length = [[text, self._tweet_length(text)] for text in tweets]
-                tweets_with_length.sort(key=lambda x: x[1], reverse=True) # sort by number of words
-                final_tweets = [x[0] for x in tweets_with_length if x[1] >= self.min_words_per_tweet] # get final tweets
-                final_tweets = final_tweets[:self.num_per_user]
-                if len(final_tweets) < self.min_per_user:
-                    print("Too few tweets: {}, skip".format(len(final_tweets)))
-                else:
-                    self.tweets[current_user] = final_tweets
-                    print("{:.1f}% - {} tweets fetched for userid={}".format(percent, len(final_tweets), current_user))
-            self.current_userid_index += 1
-        self._tmp_save()
-        print("Crawling finished\nNumber of users saved: {}".format(len(self.tweets.keys())))
-        if savefile:
-            with open("tweets_{}.json".format(self.num_per_user), "w") as outFile:
-                json.dump(self.tweets, outFile)
-            print("Json file saved")
+                # every fetched tweet is written, so the file can be filtered again offline (see tweet_quality.py)
+                sink.write_user(userid, tweets["Tweet"].tolist(), Lang=tweets["Lang"].tolist(),
+                                Words=tweets["Words"].tolist(), Keep=tweets["Keep"].tolist())
+                num_kept = int(tweets["Keep"].sum())
+                if num_kept == 0:
+                    print("Too few tweets: {} fetched, fewer than {} good ones, skip userid={}".format(len(tweets), self.min_per_user, userid))
+                status = "saved" if num_kept > 0 else "skipped"
+            store.finish_user(userid, status)
+            with progress:
+                self.num_finished += 1
+                percent = self.num_finished / len(self.target_user_ids) * 100
+            if status == "saved":
+                print("{:.1f}% - {} tweets fetched for userid={}".format(percent, num_kept, userid))
+        fetcher = TimelineFetcher(self.scheduler, self._fetch_user, on_result=on_result, api_error=tweepy.TweepError)
+        try:
+            fetcher.run(todo)
+        finally:
+            store.flush()
+            sink.close()
+        print("Crawling finished\nNumber of users fetched into {}: {}".format(self.output_path, sink.num_users))
         if not self.keep_cache:
             self._tmp_delete()
         print("Total running time: {:.2f}min".format((time.time() - self.start_time) / 60))
         self.start_time = None
-    
-    def recycle_apis(self):
-        """Put the current api to the end of queue, and start using the next one"""
-        assert len(self.api_queue) >= 1
-        print("Recycling APIs")
-        self._refresh()
-        first = self.api_queue[0]
-        self.api_queue = self.api_queue[1:] + [first]
-        return self.api_queue[0].remaining_time
 
-    def _refresh(self):
-        """Refresh all api block time"""
-        for api in self.api_queue:
-            api.update()
+    def _fetch_user(self, userid):
+        """Scored timeline of one user with its Keep column, called from the fetcher threads"""
+        count = self.num_per_user * 2 if self.only_long_tweets else self.num_per_user # if only long tweets, need to fetch more
+        try:
+            tweets = self.scheduler.call("user_timeline", block=False, user_id=userid, count=count, tweet_mode="extended", lang=self.limit_lan)
+        except RateLimited: # all apis are blocked, save progress before waiting for the first reset
+            self.store.flush()
+            tweets = self.scheduler.call("user_timeline", user_id=userid, count=count, tweet_mode="extended", lang=self.limit_lan)
+        tweets = score_tweets(pd.DataFrame({"User ID": userid, "Tweet": [x.full_text for x in tweets],
+                                            "Lang": [getattr(x, "lang", None) for x in tweets]}))
+        tweets["Keep"] = select_tweets(tweets, self.min_words_per_tweet, self.num_per_user, self.min_per_user, self.limit_lan, self.drop_retweets)
+        return tweets
 
-    def _tmp_save(self):
-        with open("tweets_crawler.py.tmp.pickle", "wb") as outFile:
-            pickle.dump(self, outFile)
+    def _open_store(self):
+        """Crawl log of this run, a new crawl starts from an empty one"""
+        if self.store is None:
+            self._tmp_delete()
+            self.store = CrawlStore(self.store_path)
+        return self.store
 
     def _tmp_delete(self):
-        if os.path.exists("tweets_crawler.py.tmp.pickle"):
-            os.remove("tweets_crawler.py.tmp.pickle")
-
-    def _tweet_length(self, tweet_text):
-        """Get actual length (num of words) of a tweet"""
-        tweet_text = re.sub(r"(@|#)([A-Z]|[a-z]|[0-9]|_)+", "", tweet_text) # remove @username
-        tweet_text = re.sub(r"(http|https)://([A-Z]|[a-z]|[0-9]|/|\.)+", "", tweet_text) # remove urls
-        tweet_text = "".join([ch.lower() if ord(ch) in self.char_list else ' ' for ch in list(tweet_text)]) # remove non-english or number chars
-        tweet_text = tweet_text.strip() # remove space at front or end
-        return len(tweet_text.split())
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.store_path + suffix):
+                os.remove(self.store_path + suffix)
 
-def recover():
-    """Recover running app from temp pickle file"""
-    if os.path.exists("tweets_crawler.py.tmp.pickle"):
-        with open("tweets_crawler.py.tmp.pickle", "rb") as inFile:
-            app = pickle.load(inFile)
-        return app
-    else:
-        print("No tmp pickle found\nFailed to recover")
+def recover(store_path=STORE_PATH, auth_path=os.path.join("..", "NetworkData", "auth.json")):
+    """Recover running app by replaying its crawl log"""
+    if not os.path.exists(store_path):
+        print("No crawl log found\nFailed to recover")
         sys.exit()
+    store = CrawlStore(store_path)
+    meta = store.meta()
+    app = TweetCrawler(userids=meta["target_user_ids"], auth_path=auth_path, limit_lan=meta["limit_lan"], num_per_user=meta["num_per_user"],
+                       min_per_user=meta["min_per_user"], min_words_per_tweet=meta["min_words_per_tweet"],
+                       only_long_tweets=meta["only_long_tweets"], keep_cache=meta["keep_cache"], store_path=store_path,
+                       output_path=meta["output_path"], drop_retweets=meta["drop_retweets"])
+    app.store = store # finished users are skipped by run
+    app.start_time = meta["start_time"]
+    app.load_auths()
+    return app
 
 if __name__ == "__main__":
-    df = pd.read_csv("centrality.csv")
-    userids = []
-    for community in df["Centers ID"]:
-        userids += [int(x) for x in community.split(" | ")]
+    userids = read_centers()["ID"].tolist() # community by community, most central first
     app = TweetCrawler(userids=userids, auth_path=os.path.join("..", "NetworkData", "auth.json"),
                        limit_lan="en", num_per_user=200, only_long_tweets=True, keep_cache=True)
     app.load_auths()
-    app.run(savefile=True)
\ No newline at end of file
+    app.run()
\ No newline at end of file
@@ -0,0 +1,137 @@
+# This file contains the concurrent crawl engine used by fetch.py
+# How it works
+# One worker thread per credential takes nodes from a shared breadth-first frontier
+# fetches followers and friends, looks them up in chunks of 100 and keeps the max_leaves
+# most connected users with the target language, same as the sequential crawler did
+# Every call goes to the credential with quota available soonest (see ratelimit.py),
+# so workers only wait when all credentials are out of quota
+# Results are added to the graph under one lock, the crawl stops once the graph has max_nodes nodes
+# (the last node may add up to max_leaves more, as before)
+# Every expanded node is passed to log outside the lock, with the edges and frontier nodes it added (see crawl_store.py)
+# Any error other than api_error stops all workers, its node goes back to the frontier and run() raises it
+
+import threading
+from collections import deque
+
+class CrawlEngine:
+    def __init__(self, scheduler, graph, max_nodes=100000, max_leaves=10, limit_lan="en", api_error=Exception, log=None, num_workers=None):
+        self.scheduler = scheduler # ratelimit.CredentialScheduler
+        self.num_workers = num_workers or len(scheduler.credentials) # one worker per credential by default
+        self.graph = graph # anything with has_node, has_edge, add_edge and number_of_nodes, like nx.Graph
+        self.max_nodes = max_nodes
+        self.max_leaves = max_leaves
+        self.limit_lan = limit_lan
+        self.api_error = api_error # errors that skip the current node
+        self.log = log # called with (nodeid, new edges, newly queued ids) for every expanded or skipped node
+        self.frontier = deque()
+        self.in_frontier = set()
+        self.cond = threading.Condition()
+        self.active = 0
+        self.done = False
+        self.num_expanded = 0
+        self.num_errors = 0
+        self.error = None
+
+    def run(self, frontier):
+        """Crawl from the frontier node ids until max_nodes or no node is left, return what is left to crawl"""
+        assert self.num_workers >= 1
+        for nodeid in frontier:
+            if nodeid not in self.in_frontier:
+                self.frontier.append(nodeid)
+                self.in_frontier.add(nodeid)
+        self.done = self.graph.number_of_nodes() >= self.max_nodes
+        self.error = None
+        workers = [threading.Thread(target=self._worker, name="crawler-{}".format(i), daemon=True) for i in range(self.num_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if self.error is not None:
+            raise self.error
+        return list(self.frontier)
+
+    def stats(self):
+        with self.cond:
+            return {"expanded": self.num_expanded,
+                    "errors": self.num_errors,
+                    "frontier": len(self.frontier),
+                    "nodes": self.graph.number_of_nodes(),
+                    "apis": self.scheduler.stats()}
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.done and len(self.frontier) == 0 and self.active > 0:
+                    self.cond.wait() # others may still add nodes
+                if self.done or len(self.frontier) == 0:
+                    self.done = True
+                    self.cond.notify_all()
+                    return
+                nodeid = self.frontier.popleft()
+                self.in_frontier.discard(nodeid)
+                self.active += 1
+            leaves, error, added = None, None, None
+            try:
+                leaves = self._expand(nodeid)
+            except self.api_error as e:
+                print("Error for id={}: {}\nIgnore and continue".format(nodeid, e))
+            except Exception as e: # stops the crawl, raised again by run()
+                error = e
+            finally: # other workers wait for active to reach 0
+                with self.cond:
+                    self.active -= 1
+                    if error is not None:
+                        self._fail(error, nodeid)
+                    elif leaves is None:
+                        self.num_errors += 1
+                        added = [], [] # skipped, not tried again after recover
+                    elif not self.done:
+                        added = self._commit(nodeid, leaves)
+                    self.cond.notify_all()
+            if added is not None and self.log is not None:
+                try:
+                    self.log(nodeid, *added)
+                except Exception as e:
+                    with self.cond:
+                        self._fail(e)
+                        self.cond.notify_all()
+
+    def _expand(self, nodeid):
+        """Candidate leaves of a node, most followers + friends first"""
+        follower_ids = self.scheduler.call("followers_ids", user_id=nodeid)
+        friends_ids = self.scheduler.call("friends_ids", user_id=nodeid)
+        ids = list(set(follower_ids + friends_ids))
+        result = []
+        for i in range(0, len(ids), 100):
+            result += [[u.id, u.followers_count + u.friends_count]
+                for u in self.scheduler.call("lookup_users", user_ids=ids[i:i+100])
+                if hasattr(u, "status") and u.status.lang == self.limit_lan] # only users with target language will be accepted
+        result.sort(key=lambda m: m[1], reverse=True)
+        return [x[0] for x in result]
+
+    def _commit(self, nodeid, leaves):
+        """Add the edges of an expanded node, called under the lock
+        Return (new edges, newly queued ids)"""
+        leaves = [x for x in leaves if not self.graph.has_edge(nodeid, x)][:self.max_leaves]
+        queued = []
+        for leafid in leaves:
+            if not self.graph.has_node(leafid) and leafid not in self.in_frontier:
+                self.frontier.append(leafid)
+                self.in_frontier.add(leafid)
+                queued.append(leafid)
+            self.graph.add_edge(nodeid, leafid)
+        self.num_expanded += 1
+        if self.graph.number_of_nodes() >= self.max_nodes:
+            self.done = True
+        print("Retrieve complete for id={} - Current graph size: {} - Num of edges: {}".format(nodeid, self.graph.number_of_nodes(), self.graph.number_of_edges()))
+        return [(nodeid, x) for x in leaves], queued
+
+    def _fail(self, error, nodeid=None):
+        """Stop all workers on an unexpected error, called under the lock"""
+        print("Crawl stopped by error: {!r}".format(error))
+        if self.error is None:
+            self.error = error
+        self.done = True
+        if nodeid is not None and nodeid not in self.in_frontier: # not expanded, keep it for the next run
+            self.frontier.appendleft(nodeid)
+            self.in_frontier.add(nodeid)
@@ -0,0 +1,113 @@
+# This file contains the crash-safe crawl state shared by fetch.py and DataProcess/tweets_crawler.py
+# How it works
+# Progress is appended to a SQLite database in WAL mode instead of pickling the whole crawler
+# new edges, queued and expanded nodes, fetched tweets and finished users are buffered in memory
+# and written in one transaction every flush_every records, so a crash loses at most the last batch
+# and never corrupts what was written before
+# recover() of both crawlers replays the log, in time proportional to the log not to a pickled object
+
+import json
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS edges (a INTEGER, b INTEGER);
+CREATE TABLE IF NOT EXISTS queued (seq INTEGER PRIMARY KEY AUTOINCREMENT, nodeid INTEGER);
+CREATE TABLE IF NOT EXISTS expanded (nodeid INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS tweets (userid INTEGER, text TEXT);
+CREATE TABLE IF NOT EXISTS users (userid INTEGER PRIMARY KEY, status TEXT);
+"""
+
+class CrawlStore:
+    def __init__(self, path, flush_every=500):
+        self.path = path
+        self.flush_every = flush_every
+        self.lock = threading.Lock() # workers of the crawl engine log from their own threads
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL") # every committed batch is on disk
+        self.conn.executescript(SCHEMA)
+        self.pending = {"edges": [], "queued": [], "expanded": [], "tweets": [], "users": []}
+        self.num_pending = 0
+
+    def set_meta(self, **values):
+        """Save settings of the crawl, written at once"""
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in values.items()])
+
+    def meta(self):
+        with self.lock:
+            return {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM meta")}
+
+    def log_expand(self, nodeid, edges, queued):
+        """A node was expanded (or skipped), with the edges it added and the nodes it queued"""
+        self._append(edges=edges, queued=[(x,) for x in queued], expanded=[(nodeid,)]) # one record, never split between batches
+
+    def queue(self, nodeids):
+        self._append(queued=[(x,) for x in nodeids])
+
+    def add_tweets(self, userid, texts):
+        self._append(tweets=[(userid, x) for x in texts])
+
+    def finish_user(self, userid, status):
+        """status is "saved", "skipped" or "error", finished users are not fetched again"""
+        self._append(users=[(userid, status)])
+
+    def flush(self):
+        """Write all buffered records in one transaction"""
+        with self.lock:
+            if self.num_pending == 0:
+                return
+            with self.conn: # BEGIN ... COMMIT, rolled back on error
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT INTO edges VALUES (?, ?)", self.pending["edges"])
+                self.conn.executemany("INSERT INTO queued (nodeid) VALUES (?)", self.pending["queued"])
+                self.conn.executemany("INSERT OR IGNORE INTO expanded VALUES (?)", self.pending["expanded"])
+                self.conn.executemany("INSERT INTO tweets VALUES (?, ?)", self.pending["tweets"])
+                self.conn.executemany("INSERT OR REPLACE INTO users VALUES (?, ?)", self.pending["users"])
+            for records in self.pending.values():
+                records.clear()
+            self.num_pending = 0
+
+    def edges(self):
+        """All logged edges, in the order they were added"""
+        self.flush()
+        with self.lock:
+            return self.conn.execute("SELECT a, b FROM edges ORDER BY rowid").fetchall()
+
+    def frontier(self):
+        """Queued nodes not expanded yet, in queue order"""
+        self.flush()
+        with self.lock:
+            rows = self.conn.execute("SELECT nodeid FROM queued WHERE nodeid NOT IN (SELECT nodeid FROM expanded) ORDER BY seq").fetchall()
+        return list(dict.fromkeys(x for (x,) in rows)) # a node queued twice is crawled once
+
+    def tweets(self):
+        """userid -> fetched tweets"""
+        self.flush()
+        result = {}
+        with self.lock:
+            for userid, text in self.conn.execute("SELECT userid, text FROM tweets ORDER BY rowid"):
+                result.setdefault(userid, []).append(text)
+        return result
+
+    def finished_users(self):
+        """userid -> status of every finished user"""
+        self.flush()
+        with self.lock:
+            return dict(self.conn.execute("SELECT userid, status FROM users"))
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+    def _append(self, **records):
+        with self.lock:
+            for table, rows in records.items():
+                self.pending[table].extend(rows)
+                self.num_pending += len(rows)
+            full = self.num_pending >= self.flush_every
+        if full:
+            self.flush()
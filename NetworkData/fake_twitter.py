@@ -0,0 +1,126 @@
+# This file contains a local stand-in for the Twitter API, used to test the crawlers without network
+# How it works
+# FakeTwitter holds a random follower network, client() returns one api object per credential
+# with the tweepy methods the crawlers call, its own per-endpoint quota and an optional latency per call
+# Timelines are made up from a small vocabulary, the same user always gets the same tweets
+
+import time
+import random
+import threading
+
+class FakeRateLimitError(Exception):
+    pass
+
+class FakeTweepError(Exception):
+    pass
+
+class FakeStatus:
+    def __init__(self, lang):
+        self.lang = lang
+
+class FakeTweet:
+    def __init__(self, full_text, lang):
+        self.full_text = full_text
+        self.lang = lang
+
+WORDS = "the a to of and in is it you that for on my this with be just have are not so but all at what".split() + \
+        "love great game today new music science news people time world vote team watch read week".split()
+
+class FakeUser:
+    def __init__(self, userid, followers_count, friends_count, lang):
+        self.id = userid
+        self.screen_name = "user{}".format(userid)
+        self.followers_count = followers_count
+        self.friends_count = friends_count
+        if lang is not None: # users without any tweet have no status
+            self.status = FakeStatus(lang)
+
+class FakeTwitter:
+    def __init__(self, num_users=2000, avg_degree=20, seed=0, langs=("en", "en", "en", "fr", None), protected=0.01):
+        rng = random.Random(seed)
+        ids = rng.sample(range(10**6, 10**9), num_users)
+        self.followers = {x: set() for x in ids}
+        self.friends = {x: set() for x in ids}
+        for follower in ids:
+            for friend in rng.sample(ids, min(num_users, rng.randint(0, 2 * avg_degree))):
+                if friend != follower:
+                    self.friends[follower].add(friend)
+                    self.followers[friend].add(follower)
+        self.users = {x: FakeUser(x, len(self.followers[x]), len(self.friends[x]), rng.choice(langs)) for x in ids}
+        self.protected = set(rng.sample(ids, int(num_users * protected))) # ids the api refuses to show
+        self.ids = ids
+        self.by_name = {u.screen_name: u for u in self.users.values()}
+
+    def client(self, limits=None, window=900, latency=0.0):
+        """One api object, like tweepy.API for one credential"""
+        return FakeAPI(self, limits or {}, window, latency)
+
+class FakeAPI:
+    def __init__(self, twitter, limits, window, latency):
+        self.twitter = twitter
+        self.limits = limits # endpoint -> requests per window, missing means unlimited
+        self.window = window
+        self.latency = latency
+        self.calls = {} # endpoint -> number of accepted calls
+        self.window_calls = {}
+        self.window_start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def followers_ids(self, user_id):
+        self._request("followers_ids")
+        return sorted(self._visible(user_id, self.twitter.followers))
+
+    def friends_ids(self, user_id):
+        self._request("friends_ids")
+        return sorted(self._visible(user_id, self.twitter.friends))
+
+    def lookup_users(self, user_ids):
+        self._request("lookup_users")
+        if len(user_ids) > 100:
+            raise FakeTweepError("Too many ids")
+        return [self.twitter.users[x] for x in user_ids if x in self.twitter.users]
+
+    def get_user(self, screen_name=None, user_id=None):
+        self._request("get_user")
+        user = self.twitter.by_name.get(screen_name) if screen_name is not None else self.twitter.users.get(user_id)
+        if user is None:
+            raise FakeTweepError("User not found")
+        return user
+
+    def user_timeline(self, user_id, count=20, **kwargs):
+        """Most recent tweets first, some short, some retweets or repeated, lang is not filtered like the real api"""
+        self._request("user_timeline")
+        if user_id in self.twitter.protected or user_id not in self.twitter.users:
+            raise FakeTweepError("Not authorized")
+        rng = random.Random(user_id)
+        tweets = []
+        for _ in range(min(count, rng.randint(0, 60))):
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 25)))
+            kind = rng.random()
+            if kind < 0.1:
+                text = "RT @user{}: {}".format(rng.choice(self.twitter.ids), text)
+            elif kind < 0.15 and len(tweets) > 0:
+                text = tweets[-1].full_text
+            tweets.append(FakeTweet(text, "en" if rng.random() < 0.9 else "fr"))
+        return tweets
+
+    def me(self):
+        return self.twitter.users[self.twitter.ids[0]]
+
+    def _visible(self, user_id, relation):
+        if user_id in self.twitter.protected or user_id not in relation:
+            raise FakeTweepError("Not authorized")
+        return relation[user_id]
+
+    def _request(self, endpoint):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.window:
+                self.window_start = now
+                self.window_calls = {}
+            if self.window_calls.get(endpoint, 0) >= self.limits.get(endpoint, float("inf")):
+                raise FakeRateLimitError(endpoint)
+            self.window_calls[endpoint] = self.window_calls.get(endpoint, 0) + 1
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        if self.latency > 0:
+            time.sleep(self.latency)
@@ -0,0 +1,201 @@
+# This file contains the compact follower graph shared by fetch.py and the DataProcess scripts
+# How it works
+# Twitter ids are int64 and sparse, so every node gets a dense index: its position in the sorted id array
+# CSRGraph keeps the undirected adjacency in NumPy arrays, neighbours of node i are indices[indptr[i]:indptr[i+1]]
+# It is saved as a folder of .npy files plus a small header, and loaded with mmap so it opens in milliseconds
+# and several processes share one copy in the page cache
+# EdgeListGraph is the growable graph used while crawling, it answers the has_node/has_edge/add_edge
+# calls of the crawl engine and converts to a CSRGraph when the crawl is saved
+
+import os
+import json
+import shutil
+import numpy as np
+from array import array
+
+GRAPH_FORMAT = "csr-graph"
+GRAPH_VERSION = 1
+GRAPH_PATH = "fetchcontent.graph"
+EDGES_PATH = "fetchcontent.csv"
+
+class CSRGraph:
+    def __init__(self, ids, indptr, indices):
+        self.ids = ids # sorted int64 twitter ids, position is the dense index
+        self.indptr = indptr # int64, len(ids) + 1
+        self.indices = indices # int32 dense neighbour indices, sorted within a row, both directions stored
+
+    @classmethod
+    def from_edges(cls, sources, targets):
+        """Build from two arrays of twitter ids, duplicate edges and self loops are dropped"""
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        ids, inverse = np.unique(np.concatenate([sources, targets]), return_inverse=True)
+        a, b = inverse[:len(sources)], inverse[len(sources):]
+        keep = a != b
+        a, b = a[keep], b[keep]
+        num = len(ids)
+        # both directions, sorted unique keys give rows in order and sorted neighbours
+        keys = np.unique(np.concatenate([a * num + b, b * num + a]))
+        rows, cols = np.divmod(keys, num)
+        indptr = np.zeros(num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num), out=indptr[1:])
+        return cls(ids, indptr, cols.astype(np.int32))
+
+    @classmethod
+    def from_csv(cls, path=EDGES_PATH):
+        """Build from an edge list csv with source and target columns, like fetchcontent.csv"""
+        import pandas as pd
+        edges = pd.read_csv(path, dtype=np.int64)
+        return cls.from_edges(edges["source"].to_numpy(), edges["target"].to_numpy())
+
+    @classmethod
+    def load(cls, path=GRAPH_PATH, mmap=True):
+        with open(os.path.join(path, "header.json"), "r") as inFile:
+            header = json.load(inFile)
+        if header.get("format") != GRAPH_FORMAT or header.get("version") != GRAPH_VERSION:
+            raise ValueError("{} is not a {} version {} folder".format(path, GRAPH_FORMAT, GRAPH_VERSION))
+        mode = "r" if mmap else None
+        return cls(*(np.load(os.path.join(path, name + ".npy"), mmap_mode=mode) for name in ("ids", "indptr", "indices")))
+
+    def save(self, path=GRAPH_PATH):
+        """Write the arrays next to path first, then swap the folder in"""
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        for name in ("ids", "indptr", "indices"):
+            np.save(os.path.join(tmp_path, name + ".npy"), getattr(self, name))
+        header = {"format": GRAPH_FORMAT, "version": GRAPH_VERSION,
+                  "num_nodes": self.number_of_nodes(), "num_edges": self.number_of_edges()}
+        with open(os.path.join(tmp_path, "header.json"), "w") as outFile:
+            json.dump(header, outFile)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    def number_of_nodes(self):
+        return len(self.ids)
+
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+    def degree(self):
+        """Degree of every node, by dense index"""
+        return np.diff(self.indptr)
+
+    def index(self, nodeids):
+        """Dense indices of twitter ids, -1 for ids not in the graph"""
+        nodeids = np.asarray(nodeids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.full(nodeids.shape, -1)
+        positions = np.minimum(np.searchsorted(self.ids, nodeids), len(self.ids) - 1)
+        return np.where(self.ids[positions] == nodeids, positions, -1)
+
+    def has_node(self, nodeid):
+        return self.index(nodeid) >= 0
+
+    def neighbors(self, nodeid):
+        """Twitter ids of the neighbours of one node"""
+        i = int(self.index(nodeid))
+        if i < 0:
+            raise KeyError(nodeid)
+        return self.ids[self.indices[self.indptr[i]:self.indptr[i + 1]]]
+
+    def has_edge(self, a, b):
+        i, j = int(self.index(a)), int(self.index(b))
+        if i < 0 or j < 0:
+            return False
+        row = self.indices[self.indptr[i]:self.indptr[i + 1]]
+        k = np.searchsorted(row, j)
+        return k < len(row) and row[k] == j
+
+    def edge_index(self):
+        """Every edge once as dense (rows, cols) with rows < cols"""
+        rows = np.repeat(np.arange(len(self.ids)), self.degree())
+        upper = rows < self.indices
+        return rows[upper], self.indices[upper].astype(np.int64)
+
+    def edges(self):
+        """Every edge once as two arrays of twitter ids"""
+        rows, cols = self.edge_index()
+        return self.ids[rows], self.ids[cols]
+
+    def to_edgelist(self):
+        """Edge list dataframe with source and target columns, the layout of fetchcontent.csv"""
+        import pandas as pd
+        sources, targets = self.edges()
+        return pd.DataFrame({"source": sources, "target": targets})
+
+    def to_networkx(self):
+        import networkx as nx
+        graph = nx.Graph()
+        graph.add_nodes_from(self.ids.tolist())
+        graph.add_edges_from(zip(*(x.tolist() for x in self.edges())))
+        return graph
+
+class EdgeListGraph:
+    """Growable graph for the crawl engine, edges are kept as two arrays of dense indices"""
+    def __init__(self, edges=()):
+        self.node_index = {} # twitter id -> dense index
+        self.ids = array("q")
+        self.sources = array("q")
+        self.targets = array("q")
+        self.edge_keys = set() # one int per undirected edge
+        self.add_edges_from(edges)
+
+    def has_node(self, nodeid):
+        return nodeid in self.node_index
+
+    def has_edge(self, a, b):
+        i, j = self.node_index.get(a), self.node_index.get(b)
+        return i is not None and j is not None and self._key(i, j) in self.edge_keys
+
+    def add_edge(self, a, b):
+        i, j = self._node(a), self._node(b)
+        if i == j:
+            return
+        key = self._key(i, j)
+        if key not in self.edge_keys:
+            self.edge_keys.add(key)
+            self.sources.append(i)
+            self.targets.append(j)
+
+    def add_edges_from(self, edges):
+        for a, b in edges:
+            self.add_edge(a, b)
+
+    def number_of_nodes(self):
+        return len(self.ids)
+
+    def number_of_edges(self):
+        return len(self.sources)
+
+    def edges(self):
+        """Every edge once as two arrays of twitter ids, in the order they were added"""
+        ids = np.frombuffer(self.ids, dtype=np.int64)
+        return ids[np.frombuffer(self.sources, dtype=np.int64)], ids[np.frombuffer(self.targets, dtype=np.int64)]
+
+    def to_csr(self):
+        return CSRGraph.from_edges(*self.edges())
+
+    def _node(self, nodeid):
+        i = self.node_index.get(nodeid)
+        if i is None:
+            i = self.node_index[nodeid] = len(self.ids)
+            self.ids.append(nodeid)
+        return i
+
+    @staticmethod
+    def _key(i, j):
+        return (min(i, j) << 32) | max(i, j)
+
+def load_graph(graph_path=GRAPH_PATH, edges_path=EDGES_PATH):
+    """The crawled graph from its binary folder, converted once from the edge list csv if the folder is missing or older"""
+    if os.path.exists(graph_path) and (not os.path.exists(edges_path) or os.path.getmtime(graph_path) >= os.path.getmtime(edges_path)):
+        return CSRGraph.load(graph_path)
+    graph = CSRGraph.from_csv(edges_path)
+    try:
+        graph.save(graph_path)
+    except OSError as e: # read only checkout, keep the graph in memory
+        print("Could not save {}: {}".format(graph_path, e))
+    return graph
@@ -0,0 +1,195 @@
+# This file contains the rate limit aware credential scheduler shared by
+# fetch.py, DataProcess/tweets_crawler.py and Recommender/system.py
+# How it works
+# Every credential keeps the remaining quota and reset time of each endpoint, like Twitter reports them
+# (taken from the x-rate-limit headers when the api exposes them, counted locally otherwise)
+# For each endpoint a heap orders credentials by when they can make the next call,
+# so a call always goes to the credential available soonest
+# When every credential is out of quota, crawlers wait for the earliest reset,
+# and callers that must not block (the web app) get RateLimited with the time to wait instead
+
+import os
+import json
+import time
+import heapq
+import threading
+
+WINDOW = 15 * 60 # Twitter rate limit window in seconds
+# requests per window for user auth, see https://developer.twitter.com/en/docs/basics/rate-limits
+ENDPOINT_LIMITS = {
+    "followers_ids": 15,
+    "friends_ids": 15,
+    "lookup_users": 900,
+    "user_timeline": 900,
+    "get_user": 900,
+}
+DEFAULT_LIMIT = 15
+
+class RateLimited(Exception):
+    def __init__(self, endpoint, wait):
+        super().__init__("All APIs are rate limited for {}, available in {:.0f}s".format(endpoint, wait))
+        self.endpoint = endpoint
+        self.wait = wait
+
+class Quota:
+    """Remaining calls of one endpoint in the current window"""
+    def __init__(self, limit, window=WINDOW):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset_at = 0.0 # a new window starts with the first call after this time
+
+    def available_at(self, now):
+        if self.remaining > 0 or now >= self.reset_at:
+            return now
+        return self.reset_at
+
+    def take(self, now):
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.window
+        self.remaining -= 1
+
+    def exhaust(self, now, reset_at=None):
+        """Twitter said the limit is hit"""
+        self.remaining = 0
+        self.reset_at = max(self.reset_at, reset_at if reset_at is not None else now + self.window)
+
+class Credential:
+    def __init__(self, api, name="", limits=ENDPOINT_LIMITS, window=WINDOW):
+        self.api = api # tweepy.API, or anything with the same methods
+        self.name = name
+        self.window = window
+        self.quotas = {endpoint: Quota(limit, window) for endpoint, limit in limits.items()}
+        self.num_calls = 0
+        self.num_rate_limited = 0
+
+    def quota(self, endpoint):
+        if endpoint not in self.quotas:
+            self.quotas[endpoint] = Quota(DEFAULT_LIMIT, self.window)
+        return self.quotas[endpoint]
+
+    def sync(self, endpoint):
+        """Take remaining quota and reset time from the last response headers, if the api keeps them"""
+        response = getattr(self.api, "last_response", None)
+        headers = getattr(response, "headers", None) or {}
+        if "x-rate-limit-remaining" in headers and "x-rate-limit-reset" in headers:
+            quota = self.quota(endpoint)
+            quota.remaining = int(headers["x-rate-limit-remaining"])
+            quota.reset_at = float(headers["x-rate-limit-reset"])
+            if "x-rate-limit-limit" in headers:
+                quota.limit = int(headers["x-rate-limit-limit"])
+
+class CredentialScheduler:
+    def __init__(self, credentials, rate_limit_error=None, clock=time.time):
+        self.credentials = credentials
+        self.rate_limit_error = rate_limit_error # exception class raised by the api when the limit is hit
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.heaps = {} # endpoint -> heap of (available at, credential index)
+        self.num_waits = 0
+        self.wait_seconds = 0.0
+        self.num_rejected = 0
+
+    def acquire(self, endpoint, block=True):
+        """Credential that can call endpoint now, taking one call from its quota
+        waits for the earliest reset if block, raises RateLimited otherwise"""
+        if len(self.credentials) == 0:
+            raise RateLimited(endpoint, float("inf"))
+        with self.cond:
+            while True:
+                now = self.clock()
+                heap = self._heap(endpoint, now)
+                at, index = heap[0]
+                credential = self.credentials[index]
+                actual = credential.quota(endpoint).available_at(now)
+                if max(actual, now) != max(at, now): # entry is stale, fix it and look again
+                    heapq.heapreplace(heap, (actual, index))
+                    continue
+                if at <= now:
+                    credential.quota(endpoint).take(now)
+                    credential.num_calls += 1
+                    heapq.heapreplace(heap, (credential.quota(endpoint).available_at(now), index))
+                    return credential
+                if not block:
+                    self.num_rejected += 1
+                    raise RateLimited(endpoint, at - now)
+                print("All APIs are blocked for {}, sleeping for {:.2f}s".format(endpoint, at - now))
+                self.num_waits += 1
+                self.wait_seconds += at - now
+                self.cond.wait(at - now)
+
+    def call(self, endpoint, *args, block=True, **kwargs):
+        """Call api.endpoint(*args, **kwargs) on the credential available soonest, retry if it was rate limited"""
+        while True:
+            credential = self.acquire(endpoint, block)
+            try:
+                result = getattr(credential.api, endpoint)(*args, **kwargs)
+            except Exception as e:
+                if self.rate_limit_error is None or not isinstance(e, self.rate_limit_error):
+                    raise
+                with self.cond:
+                    credential.num_rate_limited += 1
+                    credential.sync(endpoint)
+                    credential.quota(endpoint).exhaust(self.clock())
+                continue
+            with self.cond:
+                credential.sync(endpoint)
+            return result
+
+    def stats(self):
+        """Quota of every credential, and how often callers waited or were turned away"""
+        with self.cond:
+            now = self.clock()
+            return {"waits": self.num_waits,
+                    "wait_seconds": self.wait_seconds,
+                    "rejected": self.num_rejected,
+                    "credentials": {c.name: {"calls": c.num_calls,
+                                             "rate_limited": c.num_rate_limited,
+                                             "endpoints": {k: {"remaining": q.remaining if now < q.reset_at else q.limit,
+                                                               "reset_in": max(0.0, q.reset_at - now)}
+                                                           for k, q in c.quotas.items()}}
+                                    for c in self.credentials}}
+
+    def status(self):
+        """Status string of all apis, an api is blocked when any endpoint is out of quota"""
+        with self.cond:
+            now = self.clock()
+            num_working = sum(all(q.available_at(now) <= now for q in c.quotas.values()) for c in self.credentials)
+        if len(self.credentials) == 0:
+            return "No API found"
+        elif len(self.credentials) == num_working:
+            return "Total {} APIs, all working".format(len(self.credentials))
+        elif num_working <= 0:
+            return "Total {} APIs, all blocked".format(len(self.credentials))
+        return "Total {} APIs, {} working, {} blocked".format(len(self.credentials), num_working, len(self.credentials) - num_working)
+
+    def _heap(self, endpoint, now):
+        if endpoint not in self.heaps:
+            self.heaps[endpoint] = [(c.quota(endpoint).available_at(now), i) for i, c in enumerate(self.credentials)]
+            heapq.heapify(self.heaps[endpoint])
+        return self.heaps[endpoint]
+
+def load_credentials(auth_path):
+    """Credentials for every api in auth.json"""
+    import tweepy
+    with open(auth_path, "r") as inFile:
+        data = json.load(inFile)
+    credentials = []
+    for api_info in data:
+        print("Loading api info from " + api_info["id"])
+        auth = tweepy.OAuthHandler(consumer_key=api_info["API_key"], consumer_secret=api_info["API_sec_key"])
+        auth.set_access_token(key=api_info["Access_token"], secret=api_info["Access_sec_token"])
+        tweepyapi = tweepy.API(auth)
+        if(tweepyapi is None):
+            print("Failed to init api for " + api_info["id"])
+            continue
+        credentials.append(Credential(tweepyapi, name=api_info["id"]))
+        print("Load complete")
+    return credentials
+
+def load_scheduler(auth_path):
+    """Scheduler over every api in auth.json, an empty one if the file is missing"""
+    import tweepy
+    credentials = load_credentials(auth_path) if os.path.exists(auth_path) else []
+    return CredentialScheduler(credentials, rate_limit_error=tweepy.RateLimitError)
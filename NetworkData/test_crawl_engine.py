@@ -0,0 +1,199 @@
+# Tests for the concurrent crawl engine and the credential scheduler against the local fake Twitter api
+# run with: python -m pytest test_crawl_engine.py
+
+import time
+import pytest
+import threading
+from ratelimit import Credential, CredentialScheduler, RateLimited
+from crawl_engine import CrawlEngine
+from fake_twitter import FakeTwitter, FakeRateLimitError, FakeTweepError
+
+class EdgeGraph:
+    """The part of nx.Graph the engine uses"""
+    def __init__(self):
+        self.adj = {}
+
+    def has_node(self, a):
+        return a in self.adj
+
+    def has_edge(self, a, b):
+        return b in self.adj.get(a, ())
+
+    def add_edge(self, a, b):
+        self.adj.setdefault(a, set()).add(b)
+        self.adj.setdefault(b, set()).add(a)
+
+    def number_of_nodes(self):
+        return len(self.adj)
+
+    def number_of_edges(self):
+        return sum(len(x) for x in self.adj.values()) // 2
+
+    def edges(self):
+        return {(min(a, b), max(a, b)) for a in self.adj for b in self.adj[a]}
+
+def sequential_crawl(twitter, start, max_nodes, max_leaves, limit_lan="en"):
+    """The original breadth-first loop of Crawler.run, without rate limits"""
+    api = twitter.client()
+    graph = EdgeGraph()
+    nodes_in_search = [start]
+    while graph.number_of_nodes() < max_nodes and len(nodes_in_search) > 0:
+        new_nodes_in_search = []
+        for nodeid in nodes_in_search:
+            if graph.number_of_nodes() >= max_nodes:
+                break
+            try:
+                ids = list(set(api.followers_ids(user_id=nodeid) + api.friends_ids(user_id=nodeid)))
+            except FakeTweepError:
+                continue
+            result = []
+            for i in range(0, len(ids), 100):
+                result += [[u.id, u.followers_count + u.friends_count] for u in api.lookup_users(user_ids=ids[i:i+100])
+                           if not graph.has_edge(nodeid, u.id) and hasattr(u, "status") and u.status.lang == limit_lan]
+            for leafid in [x[0] for x in sorted(result, key=lambda m: m[1], reverse=True)][:max_leaves]:
+                if not graph.has_node(leafid):
+                    new_nodes_in_search.append(leafid)
+                graph.add_edge(nodeid, leafid)
+        nodes_in_search = new_nodes_in_search
+    return graph
+
+def make_scheduler(twitter, num, limits=None, window=900, latency=0.0, quota_limits=None):
+    credentials = [Credential(twitter.client(limits, window, latency), name=str(i), window=window,
+                              limits=quota_limits or {"followers_ids": 10**6, "friends_ids": 10**6, "lookup_users": 10**6}) for i in range(num)]
+    return CredentialScheduler(credentials, rate_limit_error=FakeRateLimitError)
+
+def test_single_worker_matches_sequential_crawl():
+    twitter = FakeTwitter(num_users=500, seed=1)
+    expected = sequential_crawl(twitter, twitter.ids[0], max_nodes=200, max_leaves=5)
+    graph = EdgeGraph()
+    engine = CrawlEngine(make_scheduler(twitter, 1), graph, max_nodes=200, max_leaves=5, api_error=FakeTweepError)
+    engine.run([twitter.ids[0]])
+    assert graph.edges() == expected.edges()
+
+def test_workers_share_the_frontier():
+    twitter = FakeTwitter(num_users=1000, seed=2)
+    scheduler = make_scheduler(twitter, 4, latency=0.002)
+    graph = EdgeGraph()
+    engine = CrawlEngine(scheduler, graph, max_nodes=200, max_leaves=8, api_error=FakeTweepError)
+    engine.run([twitter.ids[0]])
+    assert 200 <= graph.number_of_nodes() <= 200 + 8
+    assert all(c.api.calls.get("followers_ids", 0) > 0 for c in scheduler.credentials)
+    for a, b in graph.edges(): # every edge is a follow relation with an english speaking leaf
+        assert b in twitter.followers[a] | twitter.friends[a] or a in twitter.followers[b] | twitter.friends[b]
+
+def test_rate_limited_credentials_wait_and_retry():
+    twitter = FakeTwitter(num_users=300, seed=3)
+    # quotas allow more than the fake api, so the api raises and the credential waits for its reset
+    scheduler = make_scheduler(twitter, 2, limits={"followers_ids": 3}, window=0.2,
+                               quota_limits={"followers_ids": 10, "friends_ids": 1000, "lookup_users": 1000})
+    graph = EdgeGraph()
+    engine = CrawlEngine(scheduler, graph, max_nodes=30, max_leaves=5, api_error=FakeTweepError)
+    engine.run([twitter.ids[0]])
+    assert graph.number_of_nodes() >= 30
+    assert sum(c.num_rate_limited for c in scheduler.credentials) > 0
+    assert engine.stats()["apis"]["waits"] > 0
+
+def test_stops_when_frontier_is_empty():
+    twitter = FakeTwitter(num_users=50, avg_degree=2, seed=4)
+    graph = EdgeGraph()
+    engine = CrawlEngine(make_scheduler(twitter, 3), graph, max_nodes=10**6, max_leaves=3, api_error=FakeTweepError)
+    assert engine.run([twitter.ids[0]]) == []
+    assert engine.stats()["frontier"] == 0
+
+class FlakyAPI:
+    """Api whose fail_at-th call raises an error the engine does not expect"""
+    def __init__(self, api, fail_at):
+        self.api = api
+        self.fail_at = fail_at
+        self.num_calls = 0
+
+    def __getattr__(self, name):
+        method = getattr(self.api, name)
+        def call(*args, **kwargs):
+            self.num_calls += 1
+            if self.num_calls == self.fail_at:
+                raise ConnectionError("connection reset")
+            return method(*args, **kwargs)
+        return call
+
+def run_in_thread(engine, frontier, timeout=10):
+    """Run the engine, fail instead of hanging the test suite"""
+    result = {}
+    def target():
+        try:
+            result["frontier"] = engine.run(frontier)
+        except Exception as e:
+            result["error"] = e
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "crawl hangs"
+    return result
+
+def test_unexpected_error_stops_the_crawl():
+    twitter = FakeTwitter(num_users=500, seed=5)
+    scheduler = make_scheduler(twitter, 3, latency=0.001)
+    scheduler.credentials[1].api = FlakyAPI(scheduler.credentials[1].api, fail_at=4)
+    graph = EdgeGraph()
+    engine = CrawlEngine(scheduler, graph, max_nodes=400, max_leaves=5, api_error=FakeTweepError)
+    result = run_in_thread(engine, [twitter.ids[0]])
+    assert isinstance(result.get("error"), ConnectionError)
+    assert engine.active == 0 and engine.done
+    assert graph.number_of_nodes() < 400
+    assert engine.stats()["frontier"] > 0 # the failed node is kept for the next run
+
+def test_log_is_written_outside_the_lock():
+    twitter = FakeTwitter(num_users=500, seed=6)
+    graph = EdgeGraph()
+    records = []
+    def log(nodeid, edges, queued):
+        # another thread can take the lock while the log is written
+        locked = []
+        probe = threading.Thread(target=lambda: locked.append(engine.cond.acquire(timeout=1) and engine.cond.release() is None))
+        probe.start()
+        probe.join()
+        records.append((nodeid, edges, queued, locked == [True]))
+    engine = CrawlEngine(make_scheduler(twitter, 2), graph, max_nodes=100, max_leaves=5, api_error=FakeTweepError, log=log)
+    result = run_in_thread(engine, [twitter.ids[0]])
+    assert "error" not in result
+    assert len(records) == engine.num_expanded + engine.num_errors and all(free for *_, free in records)
+    assert {(min(a, b), max(a, b)) for _, edges, _, _ in records for a, b in edges} == graph.edges()
+    queued = [x for _, _, nodes, _ in records for x in nodes]
+    assert len(queued) == len(set(queued)) # every node is queued once
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_scheduler_hands_out_soonest_available_credential():
+    clock = Clock()
+    credentials = [Credential(None, name=str(i), limits={"get_user": 2}, window=60) for i in range(3)]
+    scheduler = CredentialScheduler(credentials, clock=clock)
+    used = [scheduler.acquire("get_user").name for _ in range(6)]
+    assert sorted(used) == ["0", "0", "1", "1", "2", "2"]
+    with pytest.raises(RateLimited) as error: # web requests must not sleep
+        scheduler.acquire("get_user", block=False)
+    assert error.value.wait == pytest.approx(60)
+    assert scheduler.status() == "Total 3 APIs, all blocked"
+    clock.now += 60
+    assert scheduler.acquire("get_user", block=False).name in ("0", "1", "2")
+    assert scheduler.stats()["rejected"] == 1
+
+def test_scheduler_follows_rate_limit_headers():
+    class Response:
+        headers = {"x-rate-limit-remaining": "0", "x-rate-limit-reset": "1030", "x-rate-limit-limit": "15"}
+    class Api:
+        last_response = Response()
+        def get_user(self, screen_name):
+            return screen_name
+    clock = Clock()
+    scheduler = CredentialScheduler([Credential(Api(), name="a"), Credential(Api(), name="b")], clock=clock)
+    assert scheduler.call("get_user", screen_name="x") == "x"
+    assert scheduler.call("get_user", screen_name="y") == "y"
+    with pytest.raises(RateLimited) as error: # both say no calls left until 1030
+        scheduler.call("get_user", block=False, screen_name="z")
+    assert error.value.wait == pytest.approx(30)
+    assert scheduler.status() == "Total 2 APIs, all blocked"
@@ -0,0 +1,60 @@
+# Tests for the crawl log, replayed into a graph and frontier like fetch.recover does
+# run with: python -m pytest test_crawl_store.py
+
+import pytest
+from crawl_store import CrawlStore
+from crawl_engine import CrawlEngine
+from fake_twitter import FakeTwitter, FakeTweepError
+from test_crawl_engine import EdgeGraph, FlakyAPI, make_scheduler, sequential_crawl
+
+def test_replay_restores_edges_frontier_and_tweets(tmp_path):
+    path = str(tmp_path / "crawl.db")
+    store = CrawlStore(path, flush_every=4)
+    store.set_meta(start=5, max_nodes=100)
+    store.queue([5])
+    store.log_expand(5, [(5, 6), (5, 7)], [6, 7])
+    store.log_expand(6, [(6, 8)], [8])
+    store.add_tweets(11, ["first tweet", "second tweet"])
+    store.finish_user(11, "saved")
+    store.finish_user(12, "skipped")
+    store.close()
+    store = CrawlStore(path)
+    assert store.meta() == {"start": 5, "max_nodes": 100}
+    assert store.edges() == [(5, 6), (5, 7), (6, 8)]
+    assert store.frontier() == [7, 8]
+    assert store.tweets() == {11: ["first tweet", "second tweet"]}
+    assert store.finished_users() == {11: "saved", 12: "skipped"}
+
+def test_crash_loses_only_the_unflushed_batch(tmp_path):
+    path = str(tmp_path / "crawl.db")
+    store = CrawlStore(path, flush_every=5)
+    store.queue([1])
+    for i in range(1, 10):
+        store.log_expand(i, [(i, i + 1)], [i + 1]) # 3 records each, a batch is written every second node
+    # no close, like a killed process
+    replay = CrawlStore(path)
+    edges = replay.edges()
+    assert edges == [(i, i + 1) for i in range(1, len(edges) + 1)] and len(edges) == 8
+    assert replay.frontier() == [len(edges) + 1] # every logged node comes with its edges and queued leaves
+
+def test_resume_after_crash_matches_uninterrupted_crawl(tmp_path):
+    twitter = FakeTwitter(num_users=500, seed=7)
+    expected = sequential_crawl(twitter, twitter.ids[0], max_nodes=150, max_leaves=5)
+    path = str(tmp_path / "crawl.db")
+    store = CrawlStore(path, flush_every=20)
+    store.queue([twitter.ids[0]])
+    scheduler = make_scheduler(twitter, 1)
+    scheduler.credentials[0].api = FlakyAPI(scheduler.credentials[0].api, fail_at=60)
+    engine = CrawlEngine(scheduler, EdgeGraph(), max_nodes=150, max_leaves=5, api_error=FakeTweepError, log=store.log_expand)
+    with pytest.raises(ConnectionError):
+        engine.run([twitter.ids[0]])
+    store.flush()
+
+    store = CrawlStore(path, flush_every=20) # recover
+    graph = EdgeGraph()
+    for a, b in store.edges():
+        graph.add_edge(a, b)
+    assert 0 < graph.number_of_nodes() < 150
+    engine = CrawlEngine(make_scheduler(twitter, 1), graph, max_nodes=150, max_leaves=5, api_error=FakeTweepError, log=store.log_expand)
+    engine.run(store.frontier())
+    assert graph.edges() == expected.edges()
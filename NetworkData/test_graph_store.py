@@ -0,0 +1,97 @@
+# Tests for the compact graph, compared against plain sets of edges
+# run with: python -m pytest test_graph_store.py
+
+import os
+import time
+import numpy as np
+import pytest
+from graph_store import CSRGraph, EdgeListGraph, load_graph
+from crawl_engine import CrawlEngine
+from fake_twitter import FakeTwitter, FakeTweepError
+from test_crawl_engine import make_scheduler, sequential_crawl
+
+def random_edges(num_nodes=300, num_edges=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(2**62, size=num_nodes, replace=False) # sparse twitter like ids
+    return ids[rng.integers(0, num_nodes, num_edges)], ids[rng.integers(0, num_nodes, num_edges)]
+
+def edge_set(sources, targets):
+    return {(min(a, b), max(a, b)) for a, b in zip(sources.tolist(), targets.tolist()) if a != b}
+
+def test_csr_matches_edge_set():
+    sources, targets = random_edges()
+    graph = CSRGraph.from_edges(sources, targets)
+    expected = edge_set(sources, targets) # duplicates and self loops dropped
+    assert edge_set(*graph.edges()) == expected
+    assert graph.number_of_edges() == len(expected)
+    assert graph.number_of_nodes() == len(set(sources.tolist()) | set(targets.tolist()))
+    adjacency = {}
+    for a, b in expected:
+        adjacency.setdefault(a, set()).add(b)
+        adjacency.setdefault(b, set()).add(a)
+    for nodeid in list(adjacency)[:50]:
+        assert set(graph.neighbors(nodeid).tolist()) == adjacency[nodeid]
+    a, b = next(iter(expected))
+    assert graph.has_edge(a, b) and graph.has_edge(b, a)
+    assert not graph.has_edge(a, a)
+    assert graph.degree().sum() == 2 * len(expected)
+
+def test_index_of_missing_ids():
+    graph = CSRGraph.from_edges([10, 30], [20, 40])
+    assert graph.index([10, 15, 40, 50, 5]).tolist() == [0, -1, 3, -1, -1]
+    assert not graph.has_node(15) and graph.has_node(30)
+    assert not graph.has_edge(10, 15)
+    with pytest.raises(KeyError):
+        graph.neighbors(15)
+    assert CSRGraph.from_edges([], []).index([1]).tolist() == [-1]
+
+def test_save_and_mmap_load(tmp_path):
+    graph = CSRGraph.from_edges(*random_edges())
+    path = str(tmp_path / "test.graph")
+    graph.save(path)
+    graph.save(path) # replaces the old folder
+    loaded = CSRGraph.load(path)
+    assert isinstance(loaded.indices, np.memmap)
+    for name in ("ids", "indptr", "indices"):
+        assert np.array_equal(getattr(loaded, name), getattr(graph, name))
+    assert not os.path.exists(path + ".tmp")
+
+def test_load_graph_converts_csv_once(tmp_path):
+    sources, targets = random_edges(seed=1)
+    edges_path, graph_path = str(tmp_path / "edges.csv"), str(tmp_path / "edges.graph")
+    CSRGraph.from_edges(sources, targets).to_edgelist().to_csv(edges_path, index=False)
+    graph = load_graph(graph_path, edges_path)
+    assert os.path.exists(graph_path) and edge_set(*graph.edges()) == edge_set(sources, targets)
+    assert isinstance(load_graph(graph_path, edges_path).ids, np.memmap) # binary is newer now
+    time.sleep(0.01)
+    CSRGraph.from_edges([1, 2], [2, 3]).to_edgelist().to_csv(edges_path, index=False) # a new crawl
+    assert edge_set(*load_graph(graph_path, edges_path).edges()) == {(1, 2), (2, 3)}
+
+def test_edge_list_graph_matches_csr():
+    sources, targets = random_edges(seed=2)
+    graph = EdgeListGraph(zip(sources.tolist(), targets.tolist()))
+    expected = edge_set(sources, targets)
+    assert graph.number_of_edges() == len(expected)
+    assert edge_set(*graph.edges()) == expected
+    a, b = next(iter(expected))
+    assert graph.has_edge(b, a) and graph.has_node(a)
+    assert not graph.has_edge(a, -1) and not graph.has_node(-1)
+    csr = graph.to_csr()
+    assert edge_set(*csr.edges()) == expected and csr.number_of_nodes() == graph.number_of_nodes()
+
+def test_crawl_engine_on_edge_list_graph():
+    twitter = FakeTwitter(num_users=500, seed=1)
+    expected = sequential_crawl(twitter, twitter.ids[0], max_nodes=200, max_leaves=5)
+    graph = EdgeListGraph()
+    engine = CrawlEngine(make_scheduler(twitter, 1), graph, max_nodes=200, max_leaves=5, api_error=FakeTweepError)
+    engine.run([twitter.ids[0]])
+    assert edge_set(*graph.edges()) == expected.edges()
+
+def test_to_networkx():
+    nx = pytest.importorskip("networkx")
+    sources, targets = random_edges(seed=3)
+    expected = nx.Graph(zip(sources.tolist(), targets.tolist()))
+    expected.remove_edges_from(nx.selfloop_edges(expected))
+    graph = CSRGraph.from_edges(sources, targets).to_networkx()
+    assert set(graph.nodes()) == set(expected.nodes())
+    assert {frozenset(x) for x in graph.edges()} == {frozenset(x) for x in expected.edges()}
@@ -0,0 +1,201 @@
+# This file contains an approximate nearest neighbour index for user topic vectors
+# How it works
+# The normalized vectors are clustered by spherical k-means (coarse quantizer)
+# every vector is stored in the inverted list of its nearest centroid
+# a query only scans the lists of its nprobe nearest centroids
+# nprobe is the recall-vs-latency knob, nprobe = nlist is an exact search
+# How to choose nprobe
+# recall depends on how clustered the data is, uniformly random vectors are the worst case
+# use measure_recall on a sample of real queries, or tune_nprobe to pick the smallest
+# nprobe that reaches a target recall, latency grows about linearly with nprobe
+
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from similarity import SimilarityEngine, row_lookup
+
+class IVFIndex:
+    def __init__(self, nlist=None, nprobe=16, train_size=256, n_iter=20, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size # training samples per centroid
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.assign = np.zeros(0, dtype=np.int64) # list number of every row
+        self.order = np.zeros(0, dtype=np.int64) # row indices sorted by list
+        self.offsets = np.zeros(1, dtype=np.int64) # list boundaries in order
+        self.pending = np.zeros(0, dtype=np.int64) # rows inserted since last compaction
+        self.fingerprint = None # fingerprint of the data the index was built from
+        self.row_map = None # id to row, built on first upsert
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, ids, vectors):
+        """Train the coarse quantizer and fill the inverted lists"""
+        vectors = SimilarityEngine._normalize(vectors)
+        if self.nlist is None:
+            self.nlist = max(1, min(4 * int(np.sqrt(len(vectors))), 65536))
+        self.nlist = min(self.nlist, len(vectors))
+        self.centroids = self._train(vectors)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = vectors
+        self.assign = self._nearest_list(vectors)
+        self.pending = np.zeros(0, dtype=np.int64)
+        self._compact()
+        return self
+
+    def add(self, ids, vectors):
+        """Insert new vectors without retraining the quantizer"""
+        assert self.centroids is not None
+        vectors = SimilarityEngine._normalize(vectors)
+        start = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.vectors = np.concatenate([self.vectors, vectors])
+        self.assign = np.concatenate([self.assign, self._nearest_list(vectors)])
+        self.pending = np.concatenate([self.pending, np.arange(start, len(self.ids))])
+        if self.row_map is not None:
+            self.row_map.update((int(x), start + i) for i, x in enumerate(self.ids[start:]))
+        if len(self.pending) > max(1024, len(self.ids) // 20): # merge into lists when pending grows large
+            self._compact()
+
+    def upsert(self, ids, vectors):
+        """Replace vectors of known ids and insert new ones, in place
+        A moved row stays in its old list until compaction, candidates are deduplicated meanwhile"""
+        vectors = SimilarityEngine._normalize(vectors)
+        if self.row_map is None:
+            self.row_map = row_lookup(self.ids)
+        rows = np.array([self.row_map.get(int(x), -1) for x in ids], dtype=np.int64)
+        known = rows >= 0
+        if known.any():
+            if not self.vectors.flags.writeable: # memory mapped, copy on first write
+                self.vectors = np.array(self.vectors)
+                self.assign = np.array(self.assign)
+            self.vectors[rows[known]] = vectors[known]
+            self.assign[rows[known]] = self._nearest_list(vectors[known])
+            self.pending = np.union1d(self.pending, rows[known])
+        if not known.all():
+            self.add(np.asarray(ids)[~known], vectors[~known])
+
+    def query(self, vectors, k=10):
+        """Find approximately the k most similar rows for one or a batch of query vectors
+        Return (indices, scores) sorted by descending cosine similarity"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        single = vectors.ndim == 1
+        queries = SimilarityEngine._normalize(vectors)
+        nprobe = min(self.nprobe, self.nlist)
+        probes = SimilarityEngine._top_k(queries @ self.centroids.T, nprobe)[0]
+        k = min(k, len(self.ids))
+        indices = np.zeros((len(queries), k), dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = self._candidates(lists)
+            if len(candidates) < k: # probed lists are too small, keep probing in order of centroid similarity
+                ranked = np.argsort(-(self.centroids @ query), kind="stable")
+                sizes = np.cumsum(self._list_sizes()[ranked])
+                candidates = self._candidates(ranked[:np.searchsorted(sizes, k) + 1])
+                if len(candidates) < k: # moved rows were counted twice, fall back to all lists
+                    candidates = self._candidates(ranked)
+            found, found_scores = SimilarityEngine._top_k((self.vectors[candidates] @ query)[np.newaxis, :], k)
+            indices[i, :found.shape[1]] = candidates[found[0]]
+            scores[i, :found.shape[1]] = found_scores[0]
+        if single:
+            return indices[0], scores[0]
+        return indices, scores
+
+    def query_ids(self, vectors, k=10):
+        """Same as query, but return user ids instead of row indices"""
+        indices, scores = self.query(vectors, k)
+        return self.ids[indices], scores
+
+    def save(self, path):
+        """Save index as a folder of npy files that can be memory mapped"""
+        self._compact()
+        if not os.path.exists(path):
+            os.makedirs(path)
+        for name in ["centroids", "ids", "vectors", "assign", "order", "offsets"]:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        with open(os.path.join(path, "meta.json"), "w") as outFile:
+            json.dump({"nlist": self.nlist, "nprobe": self.nprobe, "size": len(self.ids), "fingerprint": self.fingerprint}, outFile)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a saved index, memory mapped by default"""
+        with open(os.path.join(path, "meta.json"), "r") as inFile:
+            meta = json.load(inFile)
+        index = cls(nlist=meta["nlist"], nprobe=meta["nprobe"])
+        index.fingerprint = meta.get("fingerprint")
+        for name in ["centroids", "ids", "vectors", "assign", "order", "offsets"]:
+            setattr(index, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None))
+        return index
+
+    def _train(self, vectors):
+        """Spherical k-means on a sample of the vectors"""
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(vectors), self.nlist * self.train_size)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(self.n_iter):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=self.nlist)
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))] # reseed empty clusters
+            centroids = SimilarityEngine._normalize(sums)
+        return centroids
+
+    def _nearest_list(self, vectors, chunk=65536):
+        """Assign vectors to their nearest centroid, chunked to bound memory"""
+        result = np.zeros(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk):
+            result[start:start+chunk] = np.argmax(vectors[start:start+chunk] @ self.centroids.T, axis=1)
+        return result
+
+    def _compact(self):
+        """Rebuild the inverted lists, merging pending rows"""
+        self.order = np.argsort(self.assign, kind="stable")
+        self.offsets = np.searchsorted(self.assign[self.order], np.arange(self.nlist + 1))
+        self.pending = np.zeros(0, dtype=np.int64)
+
+    def _list_sizes(self):
+        """Number of rows in every list, including pending rows"""
+        return np.diff(self.offsets) + np.bincount(self.assign[self.pending], minlength=self.nlist)
+
+    def _candidates(self, lists):
+        """Collect row indices stored in the given lists"""
+        parts = [self.order[self.offsets[x]:self.offsets[x+1]] for x in lists]
+        if len(self.pending) > 0:
+            parts.append(self.pending[np.isin(self.assign[self.pending], lists)])
+            return np.unique(np.concatenate(parts)) # pending rows may also sit in their old list
+        return np.concatenate(parts)
+
+def measure_recall(index, exact, queries, k=10):
+    """Compare index against exact search, return (recall, seconds per query)"""
+    truth = exact.query(queries, k)[0]
+    time_start = time.time()
+    found = index.query(queries, k)[0]
+    elapsed = (time.time() - time_start) / len(queries)
+    hits = sum(len(np.intersect1d(x, y)) for x, y in zip(truth, found))
+    return hits / truth.size, elapsed
+
+def tune_nprobe(index, exact, queries, k=10, target=0.95):
+    """Double nprobe until recall on the sample queries reaches target, return the recall"""
+    index.nprobe = max(1, index.nprobe)
+    while True:
+        recall, _ = measure_recall(index, exact, queries, k)
+        if recall >= target or index.nprobe >= index.nlist:
+            return recall
+        index.nprobe = min(index.nprobe * 2, index.nlist)
+
+def data_fingerprint(ids, vectors):
+    """Hash of the ids and vectors, to detect a stale index on disk"""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+    return digest.hexdigest()
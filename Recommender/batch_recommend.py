@@ -0,0 +1,128 @@
+# This file contains the batch recommender, top k neighbours for many users at once (email digests)
+# How it works
+# Query vectors are taken from the user store (user_store.py) by user id, or given directly
+# they are scored against all users a block of rows at a time, one matrix-matrix product per block
+# The block size is picked so the score matrix and its top k selection stay under memory_mb
+# Top k of a block: the k-th best score among the first few thousand columns is a lower bound of the row's k-th best,
+# so one comparison against it leaves a few hundred candidates per row to sort, instead of a partition of every row
+# A user is never recommended to themself
+# Results go to a columnar file: .npz with ids, neighbours and scores arrays, or .parquet in long format
+# run with: python batch_recommend.py --users all --output recommendations.npz
+
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from similarity import SimilarityEngine
+from user_store import UserStore, STORE_PATH
+
+BYTES_PER_SCORE = 16 # float32 score, its negated copy and the int64 argpartition index
+SAMPLE_COLUMNS = 2048 # columns whose k-th best score bounds the k-th best of the whole row from below
+
+def block_size(num_users, memory_mb=256):
+    """Query rows per block, so a block of scores against num_users users fits in memory_mb"""
+    return max(1, int(memory_mb * 2**20 // (BYTES_PER_SCORE * max(num_users, 1))))
+
+def batch_top_k(engine, vectors, k=10, query_ids=None, memory_mb=256):
+    """Top k neighbour ids and scores for every row of vectors, blocked to stay under memory_mb
+    With query_ids, the neighbour with the same id as the query is left out
+    Return (neighbours, scores), arrays of shape (queries, k), -1 and nan pad when there are fewer users"""
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    extra = 0 if query_ids is None else 1
+    neighbours = np.full((len(vectors), k), -1, dtype=np.int64)
+    scores = np.full((len(vectors), k), np.nan, dtype=np.float32)
+    step = block_size(len(engine), memory_mb)
+    for start in range(0, len(vectors), step):
+        rows = slice(start, start + step)
+        if hasattr(engine, "matrix"): # exact engine, score the block here
+            top, found_scores = top_k_rows(engine._normalize(vectors[rows]) @ engine.matrix.T, k + extra)
+            found = engine.ids[top]
+        else:
+            found, found_scores = engine.query_ids(vectors[rows], k + extra)
+        if query_ids is not None: # move the user itself to the end and blank it, then cut to k
+            is_self = found == np.asarray(query_ids[rows])[:, np.newaxis]
+            order = np.argsort(is_self, axis=1, kind="stable")
+            found = np.take_along_axis(found, order, axis=1)
+            found_scores = np.take_along_axis(found_scores, order, axis=1)
+            is_self = np.take_along_axis(is_self, order, axis=1)
+            found[is_self] = -1
+            found_scores[is_self] = np.nan
+            found, found_scores = found[:, :k], found_scores[:, :k]
+        neighbours[rows, :found.shape[1]] = found
+        scores[rows, :found.shape[1]] = found_scores
+    return neighbours, scores
+
+def top_k_rows(scores, k):
+    """Top k columns of each row sorted by descending score, the same as SimilarityEngine._top_k
+    Return (columns, scores)"""
+    num_rows, num_columns = scores.shape
+    if num_columns < 4 * SAMPLE_COLUMNS or k > SAMPLE_COLUMNS:
+        return SimilarityEngine._top_k(scores, k)
+    # any columns give a valid bound, the first ones are cheaper to read than a random sample
+    threshold = np.partition(scores[:, :SAMPLE_COLUMNS], SAMPLE_COLUMNS - k, axis=1)[:, SAMPLE_COLUMNS - k]
+    rows, columns = np.divmod(np.flatnonzero(scores >= threshold[:, np.newaxis]), num_columns) # at least k per row, flatnonzero is much faster than nonzero
+    values = scores[rows, columns]
+    order = np.lexsort((columns, -values, rows)) # by row, then descending score
+    rows, columns, values = rows[order], columns[order], values[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, np.arange(num_rows))[rows]
+    keep = rank < k
+    top = np.zeros((num_rows, k), dtype=np.int64)
+    top_scores = np.zeros((num_rows, k), dtype=scores.dtype)
+    top[rows[keep], rank[keep]] = columns[keep]
+    top_scores[rows[keep], rank[keep]] = values[keep]
+    return top, top_scores
+
+def recommend_users(ids, vectors, userids=None, k=10, memory_mb=256, engine=None):
+    """Top k neighbours of users in the database (ids and vectors, as in the user store), all of them by default
+    ids not in the database are skipped, return (ids, neighbours, scores)"""
+    if engine is None:
+        engine = SimilarityEngine(ids, vectors)
+    rows = np.arange(len(ids)) if userids is None else pd.Index(ids).get_indexer(np.asarray(userids, dtype=np.int64))
+    if (rows < 0).any():
+        print("{} of {} users not in the database, skipped".format((rows < 0).sum(), len(rows)))
+        rows = rows[rows >= 0]
+    query_ids = np.asarray(ids)[rows]
+    neighbours, scores = batch_top_k(engine, np.asarray(vectors)[rows], k, query_ids=query_ids, memory_mb=memory_mb)
+    return query_ids, neighbours, scores
+
+def write_results(path, ids, neighbours, scores):
+    """Write recommendations atomically, as .npz arrays or a .parquet table with one row per neighbour"""
+    tmp_path = path + ".tmp"
+    if path.endswith(".parquet"): # needs pyarrow or fastparquet
+        k = neighbours.shape[1]
+        table = pd.DataFrame({"User ID": np.repeat(ids, k), "Rank": np.tile(np.arange(1, k + 1), len(ids)),
+                              "Neighbour ID": neighbours.reshape(-1), "Score": scores.reshape(-1)})
+        table[table["Neighbour ID"] >= 0].to_parquet(tmp_path, index=False)
+    else:
+        with open(tmp_path, "wb") as outFile:
+            np.savez(outFile, ids=ids, neighbours=neighbours, scores=scores)
+    os.replace(tmp_path, path)
+
+def read_results(path):
+    """Read recommendations written by write_results, return (ids, neighbours, scores) for .npz, a table for .parquet"""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    with np.load(path) as results:
+        return results["ids"], results["neighbours"], results["scores"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommend users to many users at once")
+    parser.add_argument("--data", default=STORE_PATH, help="user store folder, or a csv like data.csv")
+    parser.add_argument("--users", default="all", help="a file with one user id per line, or all")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--memory-mb", type=int, default=256, help="memory cap of the score blocks")
+    parser.add_argument("--output", default="recommendations.npz", help=".npz or .parquet")
+    args = parser.parse_args()
+    if os.path.isdir(args.data):
+        store = UserStore.load(args.data)
+        engine = SimilarityEngine.from_unit(store.ids, store.unit)
+    else:
+        store = UserStore.from_frame(pd.read_csv(args.data))
+        engine = None
+    userids = None if args.users == "all" else np.loadtxt(args.users, dtype=np.int64, ndmin=1)
+    start = time.perf_counter()
+    ids, neighbours, scores = recommend_users(store.ids, store.vectors, userids, args.k, args.memory_mb, engine)
+    write_results(args.output, ids, neighbours, scores)
+    print("{} users recommended in {:.2f}s, {} per block, written to {}".format(
+        len(ids), time.perf_counter() - start, block_size(len(store), args.memory_mb), args.output))
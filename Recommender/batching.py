@@ -0,0 +1,100 @@
+# This file contains an in-process inference worker with dynamic micro-batching
+# How it works
+# Concurrent requests put their texts on a queue and get a future back
+# one worker thread collects requests for up to max_wait_ms or max_batch texts
+# runs them through the model as one padded batch, and hands each request its slice of the output
+
+import time
+import queue
+import threading
+import numpy as np
+from concurrent.futures import Future
+
+class MicroBatcher:
+    def __init__(self, func, max_batch=256, max_wait_ms=5):
+        self.func = func # takes a list of texts, returns one output row per text
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.batch_sizes = {} # histogram, power of two bucket -> count
+        self.max_queue_depth = 0
+        self.num_batches = 0
+        self.num_requests = 0
+        self.running = True
+        self.worker = threading.Thread(target=self._loop, daemon=True)
+        self.worker.start()
+
+    def submit(self, texts):
+        """Queue a list of texts, return a future of the model output"""
+        future = Future()
+        self.queue.put((list(texts), future))
+        with self.lock:
+            self.num_requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return future
+
+    def run(self, data, timeout=None):
+        """Same as the model run, but batched with concurrent callers"""
+        if isinstance(data, str):
+            return self.submit([data]).result(timeout)[0]
+        return self.submit(data).result(timeout)
+
+    def stats(self):
+        """Queue depth and batch size histogram"""
+        with self.lock:
+            return {"queue_depth": self.queue.qsize(),
+                    "max_queue_depth": self.max_queue_depth,
+                    "requests": self.num_requests,
+                    "batches": self.num_batches,
+                    "batch_sizes": dict(sorted(self.batch_sizes.items()))}
+
+    def close(self):
+        """Stop the worker after the queued requests are done"""
+        self.running = False
+        self.queue.put(None)
+        self.worker.join()
+
+    def _collect(self, first):
+        """Collect requests until the batch is full or the wait time is up"""
+        batch = [first]
+        size = len(first[0])
+        deadline = time.time() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None: # closing, finish this batch first
+                self.queue.put(None)
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch, size
+
+    def _loop(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                if not self.running:
+                    return
+                continue
+            batch, size = self._collect(first)
+            texts = [text for texts, _ in batch for text in texts]
+            try:
+                outputs = np.asarray(self.func(texts)) if size > 0 else np.zeros((0, 1))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for texts, future in batch:
+                future.set_result(outputs[start:start+len(texts)])
+                start += len(texts)
+            with self.lock:
+                self.num_batches += 1
+                bucket = 1 << max(0, size - 1).bit_length() # round up to power of two
+                self.batch_sizes[bucket] = self.batch_sizes.get(bucket, 0) + 1
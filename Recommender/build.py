@@ -5,7 +5,15 @@
 # calculate a representative value for these features
 # store the result into a database (could be a csv file)
 
+import sys
+import json
+import argparse
+import multiprocessing
 from model import *
+from profiles import TOPIC_COLUMNS, user_profile, aggregate_users, make_user_table, fold_in, load_stats, save_stats
+from user_store import publish_table, STORE_PATH
+sys.path.append(os.path.join("..", "DataProcess"))
+from tweet_sink import read_tweets
 
 # define topic category map
 #            0            1          2         3            4           5
@@ -33,69 +41,223 @@ from model import *
 #     19: 3
 # }
 
+def build_per_user(tweets_data, model_senti, model_topic):
+    """Run both models user by user, return the user dataframe"""
+    # setup output data
+    output = []
+    # get all user ids
+    userids = tweets_data["User ID"].unique()
+    # groupby ids
+    data = tweets_data.groupby(["User ID"])
+    print("Number of IDs = {}".format(len(userids)))
+    for i, userid in enumerate(userids):
+        tweets = data.get_group(userid)["Tweet"].tolist()
+        print("Current ID = {} - With {} tweets".format(userid, len(tweets)), end="")
+        pos_neg = np.array(model_senti.run(tweets))
+        print("\tPostive Negative decided", end="")
+        topics = np.array(model_topic.run(tweets))
+        print("\tTopic extracted")
+        user_topics = user_profile(pos_neg, topics)
+        user_topics = user_topics.tolist()
+        output.append([userid] + user_topics) # store the data
+        print("Processed - {} IDs left".format(len(userids) - i - 1))
+    return pd.DataFrame(output, columns=['ID'] + TOPIC_COLUMNS)
+
+def run_batched(model, texts, batch_size):
+    """Run model over all texts in fixed size batches"""
+    outputs = []
+    for start in range(0, len(texts), batch_size):
+        outputs.append(np.asarray(model.run(texts[start:start+batch_size])))
+        print("Batch done - {}/{} tweets".format(min(start + batch_size, len(texts)), len(texts)))
+    if len(outputs) == 0:
+        return np.zeros((0, 0))
+    return np.concatenate(outputs)
+
+def profile_tweets(tweets_data, model_senti, model_topic, batch_size=4096):
+    """Run both models over the whole tweet table in batches
+    Return (userids, topic sums, tweet counts)"""
+    texts = tweets_data["Tweet"].tolist()
+    print("Number of tweets = {}".format(len(texts)))
+    pos_neg = run_batched(model_senti, texts, batch_size)
+    print("Postive Negative decided")
+    topics = run_batched(model_topic, texts, batch_size)
+    print("Topic extracted")
+    return aggregate_users(tweets_data["User ID"].to_numpy(), pos_neg, topics)
+
+def build_batched(tweets_data, model_senti, model_topic, batch_size=4096):
+    """Run both models over the whole tweet table in batches, return the user dataframe"""
+    return make_user_table(*profile_tweets(tweets_data, model_senti, model_topic, batch_size))
+
+def load_models():
+    """Both models, the default model factory of the workers"""
+    return ModelSentiment(), ModelTopic()
+
+class ShardedBuild:
+    def __init__(self, tweets_path, shard_dir="shards", num_shards=16, workers=None, batch_size=4096, model_factory=load_models):
+        self.tweets_path = tweets_path
+        self.model_factory = model_factory # picklable function returning (sentiment model, topic model)
+        self.shard_dir = shard_dir
+        self.num_shards = num_shards
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.manifest_path = os.path.join(shard_dir, "manifest.json")
+
+    def run(self):
+        """Build all unfinished shards in a process pool, then merge them"""
+        if not os.path.exists(self.shard_dir):
+            os.makedirs(self.shard_dir)
+        manifest = self._load_manifest()
+        for i in list(manifest["done"].keys()):
+            if not os.path.exists(self._path("shard", int(i), "npz")): # output lost, build it again
+                print("Shard {} output missing, rebuilding".format(i))
+                del manifest["done"][i]
+        todo = [i for i in range(self.num_shards) if str(i) not in manifest["done"]]
+        print("Shards done = {} - Shards to build = {}".format(self.num_shards - len(todo), len(todo)))
+        if len(todo) > 0:
+            self._partition(todo)
+            # spawn so that every worker initializes its own tensorflow
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(min(self.workers, len(todo)), initializer=_init_worker, initargs=(self.model_factory,)) as pool:
+                jobs = [(self._path("input", i, "pkl"), self._path("shard", i, "npz"), self.batch_size) for i in todo]
+                for i, num_users in zip(todo, pool.imap(_build_shard, jobs)):
+                    manifest["done"][str(i)] = num_users
+                    self._save_manifest(manifest) # checkpoint after every shard
+                    os.remove(self._path("input", i, "pkl"))
+                    print("Shard {} complete - {} users".format(i, num_users))
+        return self.merge(manifest)
+
+    def merge(self, manifest=None):
+        """Merge outputs of finished shards into one user table
+        Return (dataframe, topic sums, tweet counts)"""
+        manifest = manifest or self._load_manifest()
+        if len(manifest["done"]) < self.num_shards:
+            print("Warning: only {}/{} shards finished".format(len(manifest["done"]), self.num_shards))
+        userids, sums, counts = [np.zeros(0, dtype=np.int64)], [np.zeros((0, len(TOPIC_COLUMNS)))], [np.zeros(0, dtype=np.int64)]
+        for i in sorted(int(x) for x in manifest["done"].keys()):
+            with np.load(self._path("shard", i, "npz")) as shard:
+                userids.append(shard["ids"])
+                sums.append(shard["sums"])
+                counts.append(shard["counts"])
+        userids, sums, counts = np.concatenate(userids), np.concatenate(sums), np.concatenate(counts)
+        return make_user_table(userids, sums, counts), sums, counts
+
+    def _partition(self, todo):
+        """Split the tweets by user id hash, and save inputs of the shards to build"""
+        tweets_data = read_tweets(self.tweets_path)
+        shard = pd.util.hash_array(tweets_data["User ID"].to_numpy()) % self.num_shards
+        for i in todo:
+            tweets_data[shard == i].to_pickle(self._path("input", i, "pkl"))
+
+    def _load_manifest(self):
+        """Load manifest, start over if it was made for other input or shard count"""
+        stat = os.stat(self.tweets_path)
+        source = {"path": os.path.abspath(self.tweets_path), "size": stat.st_size, "mtime": stat.st_mtime}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as inFile:
+                manifest = json.load(inFile)
+            if manifest["source"] == source and manifest["num_shards"] == self.num_shards:
+                return manifest
+            print("Manifest outdated, rebuilding all shards")
+        return {"source": source, "num_shards": self.num_shards, "done": {}}
+
+    def _save_manifest(self, manifest):
+        """Write manifest atomically"""
+        with open(self.manifest_path + ".tmp", "w") as outFile:
+            json.dump(manifest, outFile)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def _path(self, kind, index, ext):
+        return os.path.join(self.shard_dir, "{}_{}.{}".format(kind, index, ext))
+
+_worker_models = None
+
+def _init_worker(model_factory):
+    """Load models once per worker process"""
+    global _worker_models
+    _worker_models = model_factory()
+
+def _build_shard(job):
+    """Build one shard, output is written atomically so a crash never leaves a partial shard"""
+    input_path, output_path, batch_size = job
+    tweets_data = pd.read_pickle(input_path)
+    if len(tweets_data) == 0: # no user hashed to this shard
+        userids, sums, counts = aggregate_users([], [], [])
+    else:
+        tweets_data["Tweet"] = clean_texts(tweets_data["Tweet"])
+        userids, sums, counts = profile_tweets(tweets_data, *_worker_models, batch_size=batch_size)
+    with open(output_path + ".tmp", "wb") as outFile:
+        np.savez(outFile, ids=userids, sums=sums, counts=counts)
+    os.replace(output_path + ".tmp", output_path)
+    return len(userids)
+
+UPDATES_PATH = "data_updates.csv" # log of rows changed by update, read by a running WebApp
+
+def publish(df, sums, counts, data_path="data.csv", stats_path="data_stats.npz", store_path=STORE_PATH):
+    """Write the user table and its running totals, replacing the old database
+    the binary store the web app maps (user_store.py) gets a new version too"""
+    df.to_csv(data_path + ".tmp", index=False)
+    save_stats(stats_path, df["ID"].to_numpy(), sums, counts)
+    os.replace(data_path + ".tmp", data_path)
+    publish_table(df, store_path)
+    if os.path.exists(UPDATES_PATH): # a fresh database includes all earlier updates
+        os.remove(UPDATES_PATH)
+
+def update(tweets_data, model_senti, model_topic, batch_size=4096, data_path="data.csv", stats_path="data_stats.npz", store_path=STORE_PATH):
+    """Fold new tweets into the database, only the new tweets are scored
+    Changed rows are also appended to the updates log, which a running WebApp applies in place"""
+    ids, sums, counts = load_stats(stats_path)
+    num_old = len(ids)
+    new_ids, new_sums, new_counts = profile_tweets(tweets_data, model_senti, model_topic, batch_size)
+    ids, sums, counts, changed = fold_in(ids, sums, counts, new_ids, new_sums, new_counts)
+    df = make_user_table(ids, sums, counts)
+    df.to_csv(data_path + ".tmp", index=False)
+    save_stats(stats_path, ids, sums, counts)
+    os.replace(data_path + ".tmp", data_path)
+    publish_table(df, store_path)
+    # data.csv and the store are written first, so every row in the log is already part of them
+    df.iloc[changed].to_csv(UPDATES_PATH, mode="a", header=not os.path.exists(UPDATES_PATH), index=False)
+    print("Updated {} users - {} of them new".format(len(changed), len(ids) - num_old))
+
 if __name__ == "__main__":
-    if not os.path.exists("data.csv"):
+    parser = argparse.ArgumentParser(description="Build the user database")
+    parser.add_argument("--mode", choices=["batched", "per-user", "sharded", "update"], default="batched")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--tweets", default=os.path.join("..", "DataProcess", "tweets_200_processed.csv"),
+                        help="tweets csv or .jsonl from tweets_crawler.py with User ID and Tweet columns, new tweets in update mode")
+    args = parser.parse_args()
+    if args.mode == "update":
+        if not os.path.exists("data_stats.npz"):
+            print("No running totals found, build the database first")
+            sys.exit()
+        # load models
+        model_senti = ModelSentiment()
+        model_topic = ModelTopic()
+        tweets_data = read_tweets(args.tweets)
+        tweets_data["Tweet"] = clean_texts(tweets_data["Tweet"])
+        update(tweets_data, model_senti, model_topic, batch_size=args.batch_size)
+        print("Complete")
+    elif args.mode == "sharded" and not os.path.exists("data.csv"):
+        build = ShardedBuild(args.tweets, num_shards=args.shards, workers=args.workers, batch_size=args.batch_size)
+        publish(*build.run())
+        print("Complete")
+    elif not os.path.exists("data.csv"):
         # load models
         model_senti = ModelSentiment()
         model_topic = ModelTopic()
         # load tweets dataframe
-        tweets_data = pd.read_csv(os.path.join("..", "DataProcess", "tweets_200_processed.csv"))
+        tweets_data = read_tweets(args.tweets)
         # preprocess all text
-        tweets_data["Tweet"] = tweets_data["Tweet"].apply(preprocess)
-        # setup output data
-        output = []
-        # get all user ids
-        userids = tweets_data["User ID"].unique()
-        # groupby ids
-        data = tweets_data.groupby(["User ID"])
-        print("Number of IDs = {}".format(len(userids)))
-        for i, userid in enumerate(userids):
-            user_topics = np.zeros(20)
-            tweets = data.get_group(userid)["Tweet"].tolist()
-            print("Current ID = {} - With {} tweets".format(userid, len(tweets)), end="")
-            pos_neg = np.array(model_senti.run(tweets))
-            print("\tPostive Negative decided", end="")
-            topics = np.array(model_topic.run(tweets))
-            print("\tTopic extracted")
-            pos_neg = pos_neg * 2 - 1 # convert from range [0, 1] to range [-1, 1]
-            topics = topics * 100 # convert probability from [0, 1] to [0, 100]
-            for sign, dist in zip(pos_neg, topics):
-                user_topics += sign * dist
-            user_topics /= len(tweets) # take average
-            # # process postive or negatives
-            # for sign, topic in zip(pos_neg, topics):
-            #     # if not strong, then ignore
-            #     # if sign > 0.6 and sign < 0.7:
-            #     #     continue
-            #     # else decide the sign
-            #     sign = -1 if sign <= 0.65 else 1
-            #     topic = topic_map[topic] # find target index
-            #     user_topics[topic] += sign
-            # # average the topics
-            # user_topics = [x / len(tweets) for x in user_topics]
-            user_topics = user_topics.tolist()
-            output.append([userid] + user_topics) # store the data
-            print("Processed - {} IDs left".format(len(userids) - i - 1))
-        df = pd.DataFrame(output, columns=['ID',
-                                           'alt.atheism',
-                                           'comp.graphics',
-                                           'comp.os.ms-windows.misc',
-                                           'comp.sys.ibm.pc.hardware',
-                                           'comp.sys.mac.hardware',
-                                           'comp.windows.x',
-                                           'misc.forsale',
-                                           'rec.autos',
-                                           'rec.motorcycles',
-                                           'rec.sport.baseball',
-                                           'rec.sport.hockey',
-                                           'sci.crypt',
-                                           'sci.electronics',
-                                           'sci.med',
-                                           'sci.space',
-                                           'soc.religion.christian',
-                                           'talk.politics.guns',
-                                           'talk.politics.mideast',
-                                           'talk.politics.misc',
-                                           'talk.religion.misc'])
-        df.to_csv("data.csv", index=False)
-        print("Complete")
\ No newline at end of file
+        tweets_data["Tweet"] = clean_texts(tweets_data["Tweet"])
+        if args.mode == "batched":
+            userids, sums, counts = profile_tweets(tweets_data, model_senti, model_topic, batch_size=args.batch_size)
+            df = make_user_table(userids, sums, counts)
+        else:
+            df = build_per_user(tweets_data, model_senti, model_topic)
+            counts = tweets_data["User ID"].value_counts().reindex(df["ID"]).to_numpy()
+            sums = df[TOPIC_COLUMNS].to_numpy() * counts[:, np.newaxis]
+        publish(df, sums, counts)
+        print("Complete")
+    else:
+        print("data.csv already exists, remove it to build again or use --mode update to add new tweets")
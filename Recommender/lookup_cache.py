@@ -0,0 +1,152 @@
+# This file contains the cache of Twitter lookups made by the web app (system.py)
+# How it works
+# Values live in namespaces ("userid" for screen name -> id, "timeline", "profile"), each with its own time to live
+# An OrderedDict keeps the most recently used maxsize entries in memory, the least recently used one is dropped first
+# With a path, every entry is also written to SQLite, so a restart of the server starts warm
+# a memory miss then looks in SQLite before the caller goes to Twitter
+# Values must be JSON serializable, so the web app caches ids, texts and profile dicts, never tweepy objects
+
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DEFAULT_TTL = {
+    "userid": 24 * HOUR, # screen names rarely change hands
+    "timeline": 15 * MINUTE, # the same window the rate limits use
+    "profile": 6 * HOUR,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, value TEXT, expires REAL, PRIMARY KEY (namespace, key));
+"""
+
+class LookupCache:
+    def __init__(self, path=None, maxsize=100000, ttl=DEFAULT_TTL, clock=time.time):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = dict(ttl)
+        self.clock = clock
+        self.entries = OrderedDict() # (namespace, key) -> (expires, value), least recently used first
+        self.lock = threading.Lock() # flask serves requests from several threads
+        self.counters = {}
+        self.conn = None
+        if path is not None:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            self.conn.execute("DELETE FROM cache WHERE expires <= ?", (self.clock(),))
+
+    def get(self, namespace, key, default=None):
+        """Cached value, or default if missing or expired"""
+        found = self._get_many(namespace, [key])
+        return found[key] if key in found else default
+
+    def put(self, namespace, key, value):
+        self.put_many(namespace, {key: value})
+
+    def put_many(self, namespace, values):
+        """Cache every key -> value of a dict"""
+        expires = self.clock() + self.ttl.get(namespace, HOUR)
+        with self.lock:
+            for key, value in values.items():
+                self._remember(namespace, key, value, expires)
+            if self.conn is not None and len(values) > 0:
+                with self.conn:
+                    self.conn.execute("BEGIN")
+                    self.conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                                          [(namespace, json.dumps(k), json.dumps(v), expires) for k, v in values.items()])
+
+    def lookup(self, namespace, key, fetch):
+        """Cached value of key, or fetch(key) cached for next time
+        errors of fetch are raised and nothing is cached"""
+        found = self._get_many(namespace, [key])
+        if key in found:
+            return found[key]
+        value = fetch(key)
+        self.put(namespace, key, value)
+        return value
+
+    def lookup_many(self, namespace, keys, fetch_many):
+        """Values of all keys in order, fetch_many(missing keys) returns a dict for the keys it found
+        keys it did not find are left out of the result"""
+        found = self._get_many(namespace, keys)
+        missing = list(OrderedDict.fromkeys(x for x in keys if x not in found))
+        if len(missing) > 0:
+            fetched = fetch_many(missing)
+            self.put_many(namespace, fetched)
+            found.update(fetched)
+        return [found[x] for x in keys if x in found]
+
+    def missing(self, namespace, keys):
+        """Keys without a live entry, in memory or on disk, without counting hits or misses"""
+        now = self.clock()
+        with self.lock:
+            left = [x for x in keys if not self._live((namespace, x), now)]
+            if self.conn is None or len(left) == 0:
+                return left
+            stored = set()
+            for i in range(0, len(left), 500): # stay below the SQLite variable limit
+                chunk = [json.dumps(x) for x in left[i:i + 500]]
+                stored.update(x for (x,) in self.conn.execute(
+                    "SELECT key FROM cache WHERE namespace = ? AND expires > ? AND key IN ({})".format(",".join("?" * len(chunk))),
+                    [namespace, now] + chunk))
+            return [x for x in left if json.dumps(x) not in stored]
+
+    def stats(self):
+        """Hits, disk hits, misses, expired entries and evictions per namespace, and the memory size"""
+        with self.lock:
+            return {"entries": len(self.entries), "namespaces": {k: dict(v) for k, v in self.counters.items()}}
+
+    def close(self):
+        if self.conn is not None:
+            with self.lock:
+                self.conn.close()
+                self.conn = None
+
+    def _get_many(self, namespace, keys):
+        """Live values of keys as a dict, counting a hit or a miss for every key"""
+        now = self.clock()
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in found:
+                    continue
+                entry = self.entries.get((namespace, key))
+                if entry is not None and entry[0] > now:
+                    self.entries.move_to_end((namespace, key))
+                    found[key] = entry[1]
+                    self._count(namespace, "hits")
+                    continue
+                if entry is not None:
+                    del self.entries[(namespace, key)]
+                    self._count(namespace, "expired")
+                row = None
+                if self.conn is not None:
+                    row = self.conn.execute("SELECT value, expires FROM cache WHERE namespace = ? AND key = ?",
+                                            (namespace, json.dumps(key))).fetchone()
+                if row is not None and row[1] > now:
+                    found[key] = json.loads(row[0])
+                    self._remember(namespace, key, found[key], row[1])
+                    self._count(namespace, "disk_hits")
+                else:
+                    self._count(namespace, "misses")
+        return found
+
+    def _live(self, item, now):
+        entry = self.entries.get(item)
+        return entry is not None and entry[0] > now
+
+    def _remember(self, namespace, key, value, expires):
+        self.entries[(namespace, key)] = (expires, value)
+        self.entries.move_to_end((namespace, key))
+        while len(self.entries) > self.maxsize:
+            (old_namespace, _), _ = self.entries.popitem(last=False)
+            self._count(old_namespace, "evictions")
+
+    def _count(self, namespace, name):
+        counters = self.counters.setdefault(namespace, {"hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0})
+        counters[name] += 1
@@ -0,0 +1,135 @@
+# This file contains the request metrics of the web app (system.py), served as Prometheus text at /metrics
+# How it works
+# Every stage of a request (twitter fetch, preprocess, sentiment, topic, similarity, profile lookup) is wrapped in
+# METRICS.span(stage), which adds its duration to a histogram with fixed buckets and to a ring of recent samples
+# p50/p95/p99 are taken from the recent samples, the buckets give Prometheus the full distribution
+# Counters count events such as answered requests by status
+# With RECOMMENDER_METRICS=0 span returns one shared no-op context manager, so a disabled span costs a method call
+
+import os
+import time
+import bisect
+import threading
+import numpy as np
+from contextlib import contextmanager, nullcontext
+
+# seconds, a twitter call is 100ms - 1s, a cached answer well under 1ms
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+NUM_RECENT = 2048 # samples per stage the quantiles are taken from
+
+_DISABLED = nullcontext()
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS, num_recent=NUM_RECENT):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = np.zeros(num_recent)
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.recent[self.count % len(self.recent)] = value
+            self.sum += value
+            self.count += 1
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Quantiles of the recent samples, nan before the first one"""
+        with self.lock:
+            recent = self.recent[:min(self.count, len(self.recent))].copy()
+        if len(recent) == 0:
+            return [float("nan")] * len(quantiles)
+        return np.quantile(recent, quantiles).tolist()
+
+class Metrics:
+    def __init__(self, enabled=True, prefix="recommender", clock=time.perf_counter):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.clock = clock
+        self.stages = {} # stage name -> Histogram
+        self.counters = {} # (name, sorted label items) -> value
+        self.lock = threading.Lock()
+
+    def span(self, stage):
+        """Context manager timing one stage"""
+        if not self.enabled:
+            return _DISABLED
+        return self._span(stage)
+
+    @contextmanager
+    def _span(self, stage):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(stage, self.clock() - start)
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.stages.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self):
+        """count, mean and quantiles of every stage, for logs and tests"""
+        with self.lock:
+            stages = dict(self.stages)
+        result = {}
+        for stage, histogram in sorted(stages.items()):
+            p50, p95, p99 = histogram.quantiles()
+            result[stage] = {"count": histogram.count, "mean": histogram.sum / max(histogram.count, 1), "p50": p50, "p95": p95, "p99": p99}
+        return result
+
+    def render(self, gauges=None):
+        """Prometheus text format, gauges is an optional dict of name -> {label tuple: value} read at scrape time"""
+        name = self.prefix + "_stage_seconds"
+        lines = ["# HELP {} Time spent in each stage of a request".format(name), "# TYPE {} histogram".format(name)]
+        with self.lock:
+            stages = sorted(self.stages.items())
+            counters = sorted(self.counters.items())
+        for stage, histogram in stages:
+            with histogram.lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = np.cumsum(counts)
+            for bound, value in zip(list(histogram.buckets) + ["+Inf"], cumulative):
+                lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(name, stage, bound, value))
+            lines.append('{}_sum{{stage="{}"}} {}'.format(name, stage, total))
+            lines.append('{}_count{{stage="{}"}} {}'.format(name, stage, count))
+        recent = self.prefix + "_stage_recent_seconds"
+        lines += ["# HELP {} Quantiles of the last {} samples of each stage".format(recent, NUM_RECENT), "# TYPE {} summary".format(recent)]
+        for stage, histogram in stages:
+            for quantile, value in zip(QUANTILES, histogram.quantiles()):
+                lines.append('{}{{stage="{}",quantile="{}"}} {}'.format(recent, stage, quantile, value))
+        seen = set()
+        for (counter, labels), value in counters:
+            full = "{}_{}_total".format(self.prefix, counter)
+            if full not in seen:
+                lines.append("# TYPE {} counter".format(full))
+                seen.add(full)
+            lines.append("{}{} {}".format(full, _labels(labels), value))
+        for gauge, values in sorted((gauges or {}).items()):
+            full = "{}_{}".format(self.prefix, gauge)
+            lines.append("# TYPE {} gauge".format(full))
+            for labels, value in values.items():
+                lines.append("{}{} {}".format(full, _labels(labels), value))
+        return "\n".join(lines) + "\n"
+
+def _labels(labels):
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels) + "}"
+
+METRICS = Metrics(enabled=os.environ.get("RECOMMENDER_METRICS", "1") != "0")
@@ -6,19 +6,19 @@ import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3' # disable tensorflow warnings
 import warnings
 warnings.filterwarnings('ignore') # ignore sklearn warnings
-import re
+import sys
 import shutil
 import string
 import pickle
 import numpy as np
 import pandas as pd
-import tensorflow as tf
-from nltk import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem.snowball import SnowballStemmer
-from sklearn.svm import LinearSVC
-from sklearn.pipeline import Pipeline
-from sklearn.feature_extraction.text import TfidfVectorizer
+# nltk, sklearn and tensorflow are imported only when a model needs them
+# unpickling the topic pipeline imports sklearn by itself
+from startup import STARTUP
+from batching import MicroBatcher
+from sentiment_numpy import NumpySentiment, NUMPY_SENTIMENT_PATH
+from topic_numpy import NumpyTopic, NUMPY_TOPIC_PATH
+from preprocessing import tokenize, clean_text, clean_texts, process_sentiment, process_sentiment_texts
 # from nltk.corpus import stopwords
 # from nltk.tokenize import RegexpTokenizer
 # from nltk.stem.wordnet import WordNetLemmatizer
@@ -28,55 +28,73 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 # from gensim.models.callbacks import PerplexityMetric
 # from operator import itemgetter
 
-tf.config.set_visible_devices([], 'GPU') # force use CPU, in case no GPU available
+_tf = None
+
+def load_tensorflow():
+    """Import tensorflow on first use, only the keras sentiment backend needs it"""
+    global _tf
+    if _tf is None:
+        with STARTUP.stage("import tensorflow"):
+            import tensorflow as tf
+        tf.config.set_visible_devices([], 'GPU') # force use CPU, in case no GPU available
+        _tf = tf
+    return _tf
 
 def tokenizer(text):
-    stemmer = SnowballStemmer('english')
-    return [stemmer.stem(x) for x in word_tokenize(text)]
+    # the pickled topic pipeline looks this function up by name, keep it here
+    return tokenize(text)
 
 def preprocess(text):
     """General method for preprocessing tweet text"""
-    # remove emojis
-    text = re.sub(r"(\u00a9|\u00ae|[\u2000-\u3300]|\ud83c[\ud000-\udfff]|\ud83d[\ud000-\udfff]|\ud83e[\ud000-\udfff])", "", text)
-    # remove non-ascii characters 
-    text = re.sub(r"[^\x00-\x7f]", "", text)
-    # remove @usernames or #tag
-    text = re.sub(r"(@|#)([A-Z]|[a-z]|[0-9]|_)+", "", text)
-    # remove urls
-    text = re.sub(r"(http|https)://([A-Z]|[a-z]|[0-9]|/|\.)+", "", text)
-    # remove spaces
-    text = text.strip()
-    # convert to lower format
-    text = text.lower()
-    # return
-    return text
+    return clean_text(text)
 
 class ModelSentiment:
-    def __init__(self):
+    def __init__(self, backend="auto"):
+        # "numpy" runs the exported weights without tensorflow, see sentiment_numpy.py
+        # "auto" picks numpy whenever the exported file exists
+        if backend == "auto":
+            backend = "numpy" if os.path.exists(NUMPY_SENTIMENT_PATH) else "keras"
+        self.backend = backend
+        if backend == "numpy":
+            self.init_numpy()
+            return
         if not os.path.exists("model_sentiment.pkl") or not os.path.exists("model_sentiment.h5"):
             self._first_init()
         self.init()
 
     def init(self):
         """Load settings and model from disk"""
-        with open("model_sentiment.pkl", "rb") as inFile:
+        tf = load_tensorflow()
+        with STARTUP.stage("unpickle sentiment settings"), open("model_sentiment.pkl", "rb") as inFile:
             settings = pickle.load(inFile)
         self.pad_len = settings["PAD_MAXLEN"]
         self.chr_range = settings["CHR_RANGE"]
         self.stemmer = settings["STEMMER"]
         self.tokenizer = settings["TOKENIZER"]
-        self.model = tf.keras.models.load_model("model_sentiment.h5")
+        with STARTUP.stage("build sentiment graph"):
+            self.model = tf.keras.models.load_model("model_sentiment.h5")
+        self.pad_sequences = tf.keras.preprocessing.sequence.pad_sequences
         print("Sentiment Analysis Model Initialized")
 
+    def init_numpy(self):
+        """Load the exported NumPy model, tokenizer and padding come with it"""
+        with STARTUP.stage("load sentiment weights (numpy)"):
+            model = NumpySentiment(NUMPY_SENTIMENT_PATH)
+        self.pad_len = model.pad_len
+        self.tokenizer = model
+        self.model = model
+        self.pad_sequences = model.pad_sequences
+        print("Sentiment Analysis Model Initialized (NumPy backend)")
+
     def run(self, data):
         """Run model on data, and return output"""
         islist = True
         if isinstance(data, str):
             data = [data] # put data in list if is string
             islist = False
-        data = [self._process_str(x) for x in data] # preprocess
+        data = process_sentiment_texts(data) # preprocess
         data = self.tokenizer.texts_to_sequences(data) # convert to sequences
-        data = tf.keras.preprocessing.sequence.pad_sequences(data, padding="post", maxlen=self.pad_len)
+        data = self.pad_sequences(data, padding="post", maxlen=self.pad_len)
         result = self.model.predict(data)
         # result = ["positive" if x >= 0.5 else "negative" for x in result]
         #text_result = "positive" if result >= 0.5 else "negative"
@@ -84,8 +102,13 @@ class ModelSentiment:
             result = result[0]
         return result
 
+    def serve(self, max_batch=256, max_wait_ms=5):
+        """Start an inference worker that batches concurrent run calls together"""
+        return MicroBatcher(self.run, max_batch=max_batch, max_wait_ms=max_wait_ms)
+
     def _first_init(self):
         """Initialize all required parts, and dump self"""
+        from nltk.stem.snowball import SnowballStemmer
         with open(os.path.join("..", "SentimentAnalysis", "models", "tokenizer.pkl"), "rb") as inFile:
             tokenizer = pickle.load(inFile)
         settings = {}
@@ -100,25 +123,32 @@ class ModelSentiment:
         shutil.copyfile(os.path.join("..", "SentimentAnalysis", "models", "cnn.h5"), "model_sentiment.h5")
 
     def _process_str(self, raw_string):
-        # first remove url, @username, etc
-        raw_string = re.sub(r"(@|#)([A-Z]|[a-z]|[0-9]|_)+", "", raw_string)
-        raw_string = re.sub(r"(http|https)://([A-Z]|[a-z]|[0-9]|/|\.)+", "", raw_string)
-        # remove characters other than [a-z][A-Z][0-9]['!?] or empty space
-        new_string = "".join([ch.lower() if ord(ch) in self.chr_range else ' ' for ch in list(raw_string)])
-        # remove extra space, and also convert plural form to singular
-        new_string = new_string.strip()
-        new_string = " ".join([self.stemmer.stem(word) for word in new_string.split()])
-        return new_string
+        return process_sentiment(raw_string)
 
 class ModelTopic:
-    def __init__(self):
+    def __init__(self, backend="auto"):
+        # "numpy" runs the exported vocabulary and log probabilities without sklearn, see topic_numpy.py
+        # "auto" picks numpy whenever the exported file exists
+        if backend == "auto":
+            backend = "numpy" if os.path.exists(NUMPY_TOPIC_PATH) else "sklearn"
+        self.backend = backend
+        if backend == "numpy":
+            self.init_numpy()
+            return
         if not os.path.exists("model_topic_dict.pkl"):
             self._first_init()
         self.init()
 
     def init(self):
         """load model and dictionary from disk"""
-        with open("model_topic_dict.pkl", "rb") as inFile:
+        # the pipeline was pickled from a script, so it looks for __main__.tokenizer
+        # entry points that do not import it themselves (flask run, gunicorn) get it here
+        main = sys.modules["__main__"]
+        if not hasattr(main, "tokenizer"):
+            main.tokenizer = tokenizer
+        with STARTUP.stage("import sklearn"):
+            import sklearn.pipeline, sklearn.feature_extraction.text, sklearn.naive_bayes
+        with STARTUP.stage("unpickle topic model"), open("model_topic_dict.pkl", "rb") as inFile:
             targets, model = pickle.load(inFile)
         self.targets = targets
         self.model = model
@@ -126,6 +156,14 @@ class ModelTopic:
         # self.model = LdaModel.load("model_topic.gensim")
         print("Topic Extraction Model Initialized")
 
+    def init_numpy(self):
+        """Load the exported sparse NumPy model"""
+        with STARTUP.stage("load topic model (numpy)"):
+            model = NumpyTopic(NUMPY_TOPIC_PATH)
+        self.targets = model.targets
+        self.model = model
+        print("Topic Extraction Model Initialized (NumPy backend)")
+
     def run(self, data):
         """Run model on data, and return output"""
         islist = True
@@ -0,0 +1,112 @@
+# This file contains the text preprocessing shared by all models and crawlers
+# How it works
+# All regex patterns are compiled once at import
+# character filtering uses str.translate instead of per-character membership tests
+# stemming goes through a bounded LRU cache, since tweets repeat the same words a lot
+# Batch versions join all texts with a separator and run every pass once over the joined text
+
+import re
+from functools import lru_cache
+
+STEM_CACHE_SIZE = 200000
+SEPARATOR = "\x00" # never matched by the patterns below, and kept by the batch translate table
+
+TAG_PATTERN = re.compile(r"(@|#)([A-Z]|[a-z]|[0-9]|_)+") # @username or #tag
+URL_PATTERN = re.compile(r"(http|https)://([A-Z]|[a-z]|[0-9]|/|\.)+")
+
+class _CharTable(dict):
+    """Translate table keeping [a-zA-Z ']  in lower case, every other character becomes a space"""
+    def __init__(self, keep=""):
+        super().__init__()
+        for ch in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ '" + keep:
+            self[ord(ch)] = ch.lower()
+
+    def __missing__(self, key):
+        self[key] = " " # cache so the next lookup is a plain dict hit
+        return " "
+
+CHAR_TABLE = _CharTable()
+BATCH_CHAR_TABLE = _CharTable(keep=SEPARATOR)
+
+_stemmer = None
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word):
+    """Snowball stem of a word, cached"""
+    global _stemmer
+    if _stemmer is None:
+        from nltk.stem.snowball import SnowballStemmer
+        _stemmer = SnowballStemmer("english")
+    return _stemmer.stem(word)
+
+def tokenize(text):
+    """Tokenizer of the topic model, nltk word_tokenize then stem"""
+    from nltk import word_tokenize
+    return [stem(x) for x in word_tokenize(text)]
+
+def clean_text(text):
+    """General method for preprocessing tweet text
+    remove emojis and non-ascii characters, @usernames, #tags and urls, then strip and lower"""
+    text = text.encode("ascii", "ignore").decode("ascii")
+    text = TAG_PATTERN.sub("", text)
+    text = URL_PATTERN.sub("", text)
+    return text.strip().lower()
+
+def letters_only(text, table=CHAR_TABLE):
+    """Remove @usernames, #tags and urls, then replace every character other than [a-zA-Z '] by a space"""
+    text = TAG_PATTERN.sub("", text)
+    text = URL_PATTERN.sub("", text)
+    return text.translate(table)
+
+def process_sentiment(text):
+    """Preprocessing of the sentiment model, letters only and every word stemmed"""
+    return " ".join([stem(word) for word in letters_only(text).split()])
+
+def count_words(text):
+    """Actual length (num of words) of a tweet"""
+    return len(letters_only(text).split())
+
+def clean_texts(texts):
+    """Batch version of clean_text, takes a list or a pandas Series and returns the same type"""
+    joined = _join(texts)
+    if joined is None:
+        return _map(texts, clean_text)
+    joined = joined.encode("ascii", "ignore").decode("ascii")
+    joined = URL_PATTERN.sub("", TAG_PATTERN.sub("", joined))
+    return _wrap(texts, [x.strip().lower() for x in joined.split(SEPARATOR)])
+
+def process_sentiment_texts(texts):
+    """Batch version of process_sentiment, takes a list or a pandas Series and returns the same type"""
+    joined = _join(texts)
+    if joined is None:
+        return _map(texts, process_sentiment)
+    parts = letters_only(joined, BATCH_CHAR_TABLE).split(SEPARATOR)
+    return _wrap(texts, [" ".join([stem(word) for word in x.split()]) for x in parts])
+
+def count_words_texts(texts):
+    """Batch version of count_words, returns a list of word counts"""
+    return [len(x.split()) for x in letters_only_texts(texts)]
+
+def letters_only_texts(texts):
+    """Batch version of letters_only, returns a list"""
+    joined = _join(texts)
+    if joined is None:
+        return [letters_only(x) for x in texts]
+    return letters_only(joined, BATCH_CHAR_TABLE).split(SEPARATOR)
+
+def _join(texts):
+    """Join texts with the separator, None if there is nothing to join or any text already contains it"""
+    texts = list(texts)
+    if len(texts) == 0 or any(SEPARATOR in x for x in texts):
+        return None
+    return SEPARATOR.join(texts)
+
+def _map(texts, func):
+    if hasattr(texts, "map"): # pandas Series
+        return texts.map(func)
+    return [func(x) for x in texts]
+
+def _wrap(texts, result):
+    if hasattr(texts, "map"): # pandas Series, keep the index
+        return type(texts)(result, index=texts.index, name=texts.name)
+    return result
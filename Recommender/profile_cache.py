@@ -0,0 +1,102 @@
+# This file contains the cache of computed user profiles of the web app (system.py)
+# How it works
+# For every queried user the per tweet model outputs are kept with the tweet ids, newest first,
+# next to their sign weighted topic sums (see profiles.user_profile)
+# The newest tweet id is the watermark: a repeat query fetches only tweets after it (since_id),
+# scores only those and adds them to the sums, tweets falling out of the window are subtracted
+# Entries are dropped least recently used first once their arrays take more than max_bytes
+
+import threading
+import numpy as np
+from collections import OrderedDict
+from profiles import TOPIC_COLUMNS
+
+ENTRY_OVERHEAD = 512 # bytes of an entry besides its arrays, a rough python object cost
+
+class CachedProfile:
+    def __init__(self, tweet_ids, pos_neg, topics):
+        self.tweet_ids = np.array(tweet_ids, dtype=np.int64).reshape(-1) # newest first
+        self.pos_neg = np.array(pos_neg, dtype=np.float32).reshape(-1)
+        self.topics = np.array(topics, dtype=np.float32).reshape(len(self.tweet_ids), len(TOPIC_COLUMNS))
+        self.sums = _weighted(self.pos_neg, self.topics).sum(axis=0)
+
+    @property
+    def watermark(self):
+        """Id of the newest scored tweet"""
+        return int(self.tweet_ids[0]) if len(self.tweet_ids) > 0 else None
+
+    @property
+    def profile(self):
+        """Sign weighted average topic distribution, the same as profiles.user_profile over the window"""
+        return self.sums / max(len(self.tweet_ids), 1)
+
+    @property
+    def nbytes(self):
+        return self.tweet_ids.nbytes + self.pos_neg.nbytes + self.topics.nbytes + self.sums.nbytes + ENTRY_OVERHEAD
+
+    def add(self, tweet_ids, pos_neg, topics, window=200):
+        """Put newer tweets in front, keep the newest window tweets"""
+        tweet_ids = np.asarray(tweet_ids, dtype=np.int64).reshape(-1)
+        pos_neg = np.asarray(pos_neg, dtype=np.float32).reshape(-1)
+        topics = np.asarray(topics, dtype=np.float32).reshape(len(tweet_ids), len(TOPIC_COLUMNS))
+        self.sums += _weighted(pos_neg, topics).sum(axis=0)
+        self.tweet_ids = np.concatenate([tweet_ids, self.tweet_ids])
+        self.pos_neg = np.concatenate([pos_neg, self.pos_neg])
+        self.topics = np.concatenate([topics, self.topics])
+        if window is not None and len(self.tweet_ids) > window:
+            self.sums -= _weighted(self.pos_neg[window:], self.topics[window:]).sum(axis=0)
+            self.tweet_ids = self.tweet_ids[:window].copy() # copies, so the dropped part is freed
+            self.pos_neg = self.pos_neg[:window].copy()
+            self.topics = self.topics[:window].copy()
+
+class ProfileCache:
+    def __init__(self, max_bytes=64 * 2**20, window=200):
+        self.max_bytes = max_bytes
+        self.window = window # tweets per user the profile is averaged over, like the 200 the web app fetches
+        self.entries = OrderedDict() # userid -> CachedProfile, least recently used first
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+        self.num_scored = 0 # tweets run through the models
+        self.num_reused = 0 # tweets whose outputs came from the cache
+
+    def get(self, userid):
+        """Cached profile of a user, or None"""
+        with self.lock:
+            entry = self.entries.get(userid)
+            if entry is None:
+                self.num_misses += 1
+                return None
+            self.entries.move_to_end(userid)
+            self.num_hits += 1
+            return entry
+
+    def update(self, userid, tweet_ids, pos_neg, topics):
+        """Add the model outputs of tweets newer than the watermark, newest first
+        Return the updated profile, a new one for an unknown user"""
+        with self.lock:
+            entry = self.entries.pop(userid, None)
+            if entry is None:
+                entry = CachedProfile(tweet_ids[:self.window], pos_neg[:self.window], topics[:self.window])
+            else:
+                self.nbytes -= entry.nbytes
+                self.num_reused += min(len(entry.tweet_ids), max(self.window - len(tweet_ids), 0))
+                entry.add(tweet_ids, pos_neg, topics, self.window)
+            self.num_scored += len(tweet_ids)
+            self.entries[userid] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes and len(self.entries) > 1: # the entry just updated always stays
+                _, old = self.entries.popitem(last=False)
+                self.nbytes -= old.nbytes
+                self.num_evictions += 1
+            return entry
+
+    def stats(self):
+        with self.lock:
+            return {"users": len(self.entries), "bytes": self.nbytes, "hits": self.num_hits, "misses": self.num_misses,
+                    "evictions": self.num_evictions, "tweets_scored": self.num_scored, "tweets_reused": self.num_reused}
+
+def _weighted(pos_neg, topics):
+    return (pos_neg.astype(np.float64) * 2 - 1)[:, np.newaxis] * topics.astype(np.float64) * 100
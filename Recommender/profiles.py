@@ -0,0 +1,103 @@
+# This file contains the model-free part of the user database
+# How a user profile is computed
+# every tweet gives a sentiment in [0, 1] and a topic distribution
+# the sentiment is mapped to a sign in [-1, 1] and the topics to [0, 100]
+# the profile is the average of sign weighted topic distributions
+# The running sums and tweet counts are stored next to the averages (data_stats.npz)
+# so that new tweets can be folded in without scoring the old ones again
+
+import os
+import numpy as np
+import pandas as pd
+
+TOPIC_COLUMNS = ['alt.atheism',
+                 'comp.graphics',
+                 'comp.os.ms-windows.misc',
+                 'comp.sys.ibm.pc.hardware',
+                 'comp.sys.mac.hardware',
+                 'comp.windows.x',
+                 'misc.forsale',
+                 'rec.autos',
+                 'rec.motorcycles',
+                 'rec.sport.baseball',
+                 'rec.sport.hockey',
+                 'sci.crypt',
+                 'sci.electronics',
+                 'sci.med',
+                 'sci.space',
+                 'soc.religion.christian',
+                 'talk.politics.guns',
+                 'talk.politics.mideast',
+                 'talk.politics.misc',
+                 'talk.religion.misc']
+
+def user_profile(pos_neg, topics):
+    """Profile of a single user from the model outputs of all the user's tweets"""
+    user_topics = np.zeros(len(TOPIC_COLUMNS))
+    pos_neg = np.array(pos_neg) * 2 - 1 # convert from range [0, 1] to range [-1, 1]
+    topics = np.array(topics) * 100 # convert probability from [0, 1] to [0, 100]
+    for sign, dist in zip(pos_neg, topics):
+        user_topics += sign * dist
+    user_topics /= len(topics) # take average
+    # # process postive or negatives
+    # for sign, topic in zip(pos_neg, topics):
+    #     # if not strong, then ignore
+    #     # if sign > 0.6 and sign < 0.7:
+    #     #     continue
+    #     # else decide the sign
+    #     sign = -1 if sign <= 0.65 else 1
+    #     topic = topic_map[topic] # find target index
+    #     user_topics[topic] += sign
+    # # average the topics
+    # user_topics = [x / len(topics) for x in user_topics]
+    return user_topics
+
+def aggregate_users(userids, pos_neg, topics):
+    """Sign weighted average of topic distributions per user, in one grouped reduction
+    Return (unique userids in order of appearance, sums, counts)"""
+    if len(userids) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, len(TOPIC_COLUMNS))), np.zeros(0, dtype=np.int64)
+    codes, uniques = pd.factorize(pd.Series(userids))
+    order = np.argsort(codes, kind="stable") # tweets sorted by user
+    weighted = (np.asarray(pos_neg).reshape(-1) * 2 - 1)[:, np.newaxis] * np.asarray(topics) * 100
+    weighted = weighted[order]
+    starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0]) # first tweet of each user
+    sums = np.add.reduceat(weighted, starts, axis=0)
+    counts = np.diff(np.r_[starts, len(order)])
+    return np.asarray(uniques), sums, counts
+
+def make_user_table(userids, sums, counts):
+    """Convert topic sums and tweet counts to the user dataframe"""
+    df = pd.DataFrame(sums / counts[:, np.newaxis], columns=TOPIC_COLUMNS)
+    df.insert(0, "ID", userids)
+    return df
+
+
+def fold_in(ids, sums, counts, new_ids, new_sums, new_counts):
+    """Add sums and counts of new tweets into the running totals, inserting unseen users
+    new_ids must be unique, as returned by aggregate_users
+    Return (ids, sums, counts, rows that changed)"""
+    rows = pd.Index(ids).get_indexer(new_ids)
+    known = rows >= 0
+    sums = np.array(sums, dtype=np.float64)
+    counts = np.array(counts, dtype=np.int64)
+    sums[rows[known]] += new_sums[known]
+    counts[rows[known]] += new_counts[known]
+    start = len(ids)
+    ids = np.concatenate([ids, np.asarray(new_ids)[~known]])
+    sums = np.concatenate([sums, new_sums[~known]])
+    counts = np.concatenate([counts, new_counts[~known]])
+    changed = np.concatenate([rows[known], np.arange(start, len(ids))])
+    return ids, sums, counts, changed
+
+def load_stats(path):
+    """Load running topic sums and tweet counts
+    Return (ids, sums, counts)"""
+    with np.load(path) as stats:
+        return stats["ids"], stats["sums"], stats["counts"]
+
+def save_stats(path, ids, sums, counts):
+    """Save running topic sums and tweet counts atomically"""
+    with open(path + ".tmp", "wb") as outFile:
+        np.savez(outFile, ids=ids, sums=sums, counts=counts)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,66 @@
+# This file contains the worker pool behind the json api of the web app (system.py)
+# How it works
+# Twitter calls and model scoring of a request run on a bounded thread pool, the flask thread only waits
+# for the result up to a timeout, so a slow request never holds up the others
+# Requests with the same key (the same user) while one is in flight share its future instead of running again
+# At most max_pending requests are queued or running, more are turned away at once with Overloaded
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+class Overloaded(Exception):
+    pass
+
+class RequestTimeout(Exception):
+    pass
+
+class RequestPool:
+    def __init__(self, num_workers=8, max_pending=64):
+        self.executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="request")
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.in_flight = {} # key -> future of the running request
+        self.num_requests = 0
+        self.num_coalesced = 0
+        self.num_rejected = 0
+        self.num_timeouts = 0
+
+    def submit(self, key, func, *args, **kwargs):
+        """Future of func(*args, **kwargs), shared with a request of the same key still in flight"""
+        with self.lock:
+            self.num_requests += 1
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.num_coalesced += 1
+                return future
+            if len(self.in_flight) >= self.max_pending:
+                self.num_rejected += 1
+                raise Overloaded("{} requests in flight, try again later".format(len(self.in_flight)))
+            future = self.executor.submit(func, *args, **kwargs)
+            self.in_flight[key] = future
+        future.add_done_callback(lambda _: self._done(key, future))
+        return future
+
+    def run(self, key, func, *args, timeout=None, **kwargs):
+        """Result of func(*args, **kwargs), raises RequestTimeout after timeout seconds
+        the work itself goes on, and what it caches serves the next request"""
+        future = self.submit(key, func, *args, **kwargs)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            with self.lock:
+                self.num_timeouts += 1
+            raise RequestTimeout("No answer in {}s, try again later".format(timeout))
+
+    def stats(self):
+        with self.lock:
+            return {"in_flight": len(self.in_flight), "requests": self.num_requests, "coalesced": self.num_coalesced,
+                    "rejected": self.num_rejected, "timeouts": self.num_timeouts}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def _done(self, key, future):
+        with self.lock:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
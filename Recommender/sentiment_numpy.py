@@ -0,0 +1,180 @@
+# This file contains a pure NumPy forward pass of the sentiment CNN
+# so that the sentiment model can run without importing TensorFlow
+# How it works
+# export reads the weights of the Keras model from SentimentAnalysis/Model.ipynb
+# Embedding -> Dropout -> Conv1D -> MaxPooling1D -> Bidirectional(LSTM) -> Dense
+# together with the vocabulary of the Keras tokenizer, and saves them into one npz file
+# NumpySentiment reproduces the tokenizer, pad_sequences and every layer in NumPy
+#
+# To export, run in this folder (needs TensorFlow once):
+#   python sentiment_numpy.py
+# it also checks that both backends give the same outputs
+
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+
+NUMPY_SENTIMENT_PATH = "model_sentiment.npz"
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+def hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0, 1)
+
+ACTIVATIONS = {"sigmoid": sigmoid, "hard_sigmoid": hard_sigmoid, "tanh": np.tanh, "relu": lambda x: np.maximum(x, 0), "linear": lambda x: x}
+
+class NumpySentiment:
+    def __init__(self, path=NUMPY_SENTIMENT_PATH):
+        with np.load(path) as data:
+            self.weights = {k: data[k] for k in data.files if k not in ("config", "words", "word_ids")}
+            self.config = json.loads(str(data["config"]))
+            self.word_index = dict(zip(data["words"].tolist(), data["word_ids"].tolist()))
+        self.pad_len = self.config["pad_len"]
+        tokenizer = self.config["tokenizer"]
+        self.split = tokenizer["split"]
+        self.lower = tokenizer["lower"]
+        self.split_table = str.maketrans({ch: self.split for ch in tokenizer["filters"]})
+        self.num_words = tokenizer["num_words"]
+        self.oov_index = self.word_index.get(tokenizer["oov_token"]) if tokenizer["oov_token"] is not None else None
+
+    def texts_to_sequences(self, texts):
+        """Same as the Keras Tokenizer.texts_to_sequences"""
+        result = []
+        for text in texts:
+            if self.lower:
+                text = text.lower()
+            sequence = []
+            for word in text.translate(self.split_table).split(self.split):
+                if word == "":
+                    continue
+                index = self.word_index.get(word)
+                if index is not None and (not self.num_words or index < self.num_words):
+                    sequence.append(index)
+                elif self.oov_index is not None:
+                    sequence.append(self.oov_index)
+            result.append(sequence)
+        return result
+
+    def pad_sequences(self, sequences, padding="post", maxlen=None):
+        """Same as the Keras pad_sequences with truncating="pre", padding with zeros"""
+        maxlen = maxlen or self.pad_len
+        result = np.zeros((len(sequences), maxlen), dtype=np.int32)
+        for i, sequence in enumerate(sequences):
+            sequence = sequence[-maxlen:] if len(sequence) > 0 else []
+            if padding == "post":
+                result[i, :len(sequence)] = sequence
+            else:
+                result[i, maxlen-len(sequence):] = sequence
+        return result
+
+    def predict(self, data, batch_size=1024):
+        """Forward pass over padded sequences, return shape (num, 1)"""
+        outputs = [self._forward(data[i:i+batch_size]) for i in range(0, len(data), batch_size)]
+        if len(outputs) == 0:
+            return np.zeros((0, 1), dtype=np.float32)
+        return np.concatenate(outputs)
+
+    def _forward(self, data):
+        w = self.weights
+        x = w["embedding"][data] # (batch, steps, embed)
+        # Conv1D, valid padding
+        kernel_size, strides = self.config["conv_kernel_size"], self.config["conv_strides"]
+        windows = np.lib.stride_tricks.sliding_window_view(x, kernel_size, axis=1)[:, ::strides] # (batch, steps, embed, kernel)
+        x = np.einsum("btck,kcf->btf", windows, w["conv_kernel"], optimize=True) + w["conv_bias"]
+        x = ACTIVATIONS[self.config["conv_activation"]](x)
+        # MaxPooling1D, valid padding
+        pool, pool_strides = self.config["pool_size"], self.config["pool_strides"]
+        x = np.lib.stride_tricks.sliding_window_view(x, pool, axis=1)[:, ::pool_strides].max(axis=-1)
+        # Bidirectional LSTM, last hidden states concatenated
+        forward = self._lstm(x, "forward")
+        backward = self._lstm(x[:, ::-1], "backward")
+        x = np.concatenate([forward, backward], axis=1)
+        x = x @ w["dense_kernel"] + w["dense_bias"]
+        return ACTIVATIONS[self.config["dense_activation"]](x).astype(np.float32)
+
+    def _lstm(self, x, direction):
+        """Keras LSTM with gates in order i, f, c, o, return the last hidden state"""
+        w = self.weights
+        kernel, recurrent, bias = w[direction + "_kernel"], w[direction + "_recurrent_kernel"], w[direction + "_bias"]
+        activation = ACTIVATIONS[self.config["lstm_activation"]]
+        recurrent_activation = ACTIVATIONS[self.config["lstm_recurrent_activation"]]
+        units = recurrent.shape[0]
+        inputs = x @ kernel + bias # input projection of all steps at once
+        h = np.zeros((x.shape[0], units), dtype=x.dtype)
+        c = np.zeros((x.shape[0], units), dtype=x.dtype)
+        for t in range(x.shape[1]):
+            z = inputs[:, t] + h @ recurrent
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2*units])
+            c = f * c + i * activation(z[:, 2*units:3*units])
+            o = recurrent_activation(z[:, 3*units:])
+            h = o * activation(c)
+        return h
+
+def export_keras(model, tokenizer, pad_len, path=NUMPY_SENTIMENT_PATH):
+    """Save weights of the Keras sentiment model and the tokenizer vocabulary into one npz"""
+    weights = {}
+    config = {"pad_len": pad_len}
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        layer_config = layer.get_config()
+        if kind == "Embedding":
+            weights["embedding"] = layer.get_weights()[0]
+        elif kind == "Conv1D":
+            assert layer_config["padding"] == "valid"
+            weights["conv_kernel"], weights["conv_bias"] = layer.get_weights()
+            config["conv_kernel_size"] = layer_config["kernel_size"][0]
+            config["conv_strides"] = layer_config["strides"][0]
+            config["conv_activation"] = layer_config["activation"]
+        elif kind == "MaxPooling1D":
+            assert layer_config["padding"] == "valid"
+            config["pool_size"] = layer_config["pool_size"][0]
+            config["pool_strides"] = layer_config["strides"][0]
+        elif kind == "Bidirectional":
+            assert layer_config.get("merge_mode", "concat") == "concat"
+            for direction, sublayer in [("forward", layer.forward_layer), ("backward", layer.backward_layer)]:
+                sub_config = sublayer.get_config()
+                assert not sub_config["return_sequences"]
+                weights[direction + "_kernel"], weights[direction + "_recurrent_kernel"], weights[direction + "_bias"] = sublayer.get_weights()
+                config["lstm_activation"] = sub_config["activation"]
+                config["lstm_recurrent_activation"] = sub_config["recurrent_activation"]
+        elif kind == "Dense":
+            weights["dense_kernel"], weights["dense_bias"] = layer.get_weights()
+            config["dense_activation"] = layer_config["activation"]
+        elif kind != "Dropout": # dropout does nothing at inference
+            raise ValueError("Layer {} not supported".format(kind))
+    config["tokenizer"] = {"num_words": tokenizer.num_words,
+                           "filters": tokenizer.filters,
+                           "lower": tokenizer.lower,
+                           "split": tokenizer.split,
+                           "oov_token": tokenizer.oov_token}
+    # only words the model can see are needed
+    vocab = [(k, v) for k, v in tokenizer.word_index.items() if not tokenizer.num_words or v < tokenizer.num_words or k == tokenizer.oov_token]
+    words = np.array([k for k, _ in vocab], dtype=str)
+    word_ids = np.array([v for _, v in vocab], dtype=np.int64)
+    np.savez(path, config=np.array(json.dumps(config)), words=words, word_ids=word_ids, **weights)
+
+def check_parity(keras_model, numpy_model, texts, tolerance=1e-4):
+    """Run both backends on texts, return the max absolute difference"""
+    expected = np.asarray(keras_model.run(texts)).reshape(-1)
+    found = np.asarray(numpy_model.run(texts)).reshape(-1)
+    difference = float(np.abs(expected - found).max()) if len(texts) > 0 else 0.0
+    print("Max difference over {} texts: {:.2e} - {}".format(len(texts), difference, "OK" if difference <= tolerance else "FAILED"))
+    return difference
+
+if __name__ == "__main__":
+    from model import ModelSentiment
+    model_keras = ModelSentiment(backend="keras")
+    export_keras(model_keras.model, model_keras.tokenizer, model_keras.pad_len)
+    print("Exported to {}".format(NUMPY_SENTIMENT_PATH))
+    model_numpy = ModelSentiment(backend="numpy")
+    tweets_path = os.path.join("..", "DataProcess", "tweets_200_processed.csv")
+    if os.path.exists(tweets_path):
+        texts = pd.read_csv(tweets_path)["Tweet"].astype(str).tolist()[:2000]
+    else:
+        texts = ["I love this so much", "this is the worst day ever", "not bad at all", ""]
+    if check_parity(model_keras, model_numpy, texts) > 1e-4:
+        sys.exit(1)
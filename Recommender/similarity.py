@@ -0,0 +1,88 @@
+# This file contains the similarity engine of the recommender
+# How it works
+# The user matrix is normalized once at load time into a contiguous float32 array
+# so that the cosine similarity against every user is a single matrix-vector product
+# and the top k users are picked with argpartition instead of a full sort
+
+import numpy as np
+
+class SimilarityEngine:
+    def __init__(self, ids, vectors):
+        self.ids = np.asarray(ids)
+        self.matrix = self._normalize(vectors)
+        self.row_map = None # id to row, built on first upsert
+        assert len(self.ids) == len(self.matrix)
+
+    @classmethod
+    def from_unit(cls, ids, matrix):
+        """Engine over rows already scaled to unit length, like unit.npy of the user store
+        a memory mapped matrix is used as it is, and copied only by the first upsert"""
+        engine = cls.__new__(cls)
+        engine.ids = np.asarray(ids)
+        engine.matrix = matrix
+        engine.row_map = None
+        return engine
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, vectors, k=10):
+        """Find the k most similar users for one query vector or a batch of them
+        Return (indices, scores) sorted by descending cosine similarity"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        single = vectors.ndim == 1
+        if single:
+            vectors = vectors[np.newaxis, :]
+        scores = self._normalize(vectors) @ self.matrix.T # cosine similarity, shape (queries, users)
+        indices, scores = self._top_k(scores, k)
+        if single:
+            return indices[0], scores[0]
+        return indices, scores
+
+    def query_ids(self, vectors, k=10):
+        """Same as query, but return user ids instead of row indices"""
+        indices, scores = self.query(vectors, k)
+        return self.ids[indices], scores
+
+    def upsert(self, ids, vectors):
+        """Replace vectors of known users and append new users, in place"""
+        vectors = self._normalize(vectors)
+        if self.row_map is None:
+            self.row_map = row_lookup(self.ids)
+        rows = np.array([self.row_map.get(int(x), -1) for x in ids], dtype=np.int64)
+        known = rows >= 0
+        if not self.matrix.flags.writeable:
+            self.matrix = np.array(self.matrix)
+        self.matrix[rows[known]] = vectors[known]
+        if not known.all():
+            new_ids = np.asarray(ids)[~known]
+            self.row_map.update((int(x), len(self.ids) + i) for i, x in enumerate(new_ids))
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.matrix = np.concatenate([self.matrix, vectors[~known]])
+
+    @staticmethod
+    def _normalize(vectors):
+        """Scale every row to unit length, zero rows stay zero"""
+        vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return np.ascontiguousarray(vectors / norms)
+
+    @staticmethod
+    def _top_k(scores, k):
+        """Select top k columns of each row, sorted in descending order"""
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            empty = np.zeros((scores.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if k < scores.shape[1]:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k] # unordered top k
+        else:
+            part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+def row_lookup(ids):
+    """Map every id to its row"""
+    return {int(x): i for i, x in enumerate(ids)}
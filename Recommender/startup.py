@@ -0,0 +1,35 @@
+# This file contains a small timer for the startup report
+# How it works
+# every slow startup step (imports, unpickling, model graph build) is wrapped in STARTUP.stage
+# and STARTUP.report() shows where the cold start time went
+
+import time
+import threading
+from contextlib import contextmanager
+
+class StartupTimer:
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.stages = [] # (name, seconds, thread name)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Time the wrapped block as one startup stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages.append((name, time.perf_counter() - start, threading.current_thread().name))
+
+    def report(self):
+        """Startup stages as text, slowest first"""
+        with self.lock:
+            stages = sorted(self.stages, key=lambda x: x[1], reverse=True)
+        lines = ["Startup report - {:.2f}s since process start".format(time.perf_counter() - self.created)]
+        for name, seconds, thread in stages:
+            lines.append("{:>8.3f}s  {}  [{}]".format(seconds, name, thread))
+        return "\n".join(lines)
+
+STARTUP = StartupTimer()
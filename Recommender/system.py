@@ -1,41 +1,115 @@
 # This is the server file for the recommendation system
 
-from model import *
-import time
+from startup import STARTUP
+with STARTUP.stage("import model"):
+    from model import *
+from similarity import SimilarityEngine
+from ann import IVFIndex, tune_nprobe, data_fingerprint
+from lookup_cache import LookupCache
+from profile_cache import ProfileCache
+from request_pool import RequestPool, Overloaded, RequestTimeout
+from batch_recommend import batch_top_k, recommend_users
+from user_store import UserStore, current_version, STORE_PATH
+from metrics import METRICS
+import io
+import sys
 import json
-import tweepy
-from flask import Flask, render_template, url_for, redirect, request
+import threading
+sys.path.append(os.path.join("..", "NetworkData"))
+from ratelimit import load_scheduler, RateLimited
+with STARTUP.stage("import tweepy and flask"):
+    import tweepy
+    from flask import Flask, render_template, url_for, redirect, request, jsonify
 app = Flask(__name__)
 
-class TwitterAPI:
-    def __init__(self, tweepy_api):
-        self.api = tweepy_api
-        self.remaining_time = 0
-        self.block_time = 0
-
-    def block(self):
-        """Block this api if rate limit exceeds"""
-        self.remaining_time = 15 * 60 + 5 # for how long to restart
-        self.block_time = time.time() # store block time
-    
-    def update(self):
-        """Refresh the api"""
-        if(self.remaining_time == 0):
-            return
-        self.remaining_time -= (time.time() - self.block_time)
-        self.remaining_time = 0 if self.remaining_time <= 0 else self.remaining_time
+class RecommendError(Exception):
+    """A request without an answer, status is the http status of the json api"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
 
 class WebApp:
-    def __init__(self, auth_path="auth.json", data_path="data.csv"):
-        self.api_queue = []
+    def __init__(self, auth_path="auth.json", data_path="data.csv", store_path=STORE_PATH, ann_path="data.ivf", ann_threshold=100000, updates_path="data_updates.csv", warmup=True,
+                 cache_path="lookup_cache.db", prefetch=True, num_workers=8, request_timeout=30):
+        self.scheduler = None
         self.auth_path = auth_path
         self._init_auths()
-        self.data_path = data_path
-        self._init_users()
-        self.model_senti = ModelSentiment()
-        self.model_topic = ModelTopic()
+        self.data_path = data_path # only read when no user store was published yet
+        self.store_path = store_path
+        self.ann_path = ann_path
+        self.ann_threshold = ann_threshold # use approximate search above this number of users
+        self.updates_path = updates_path # rows changed by build.py --mode update
+        self.updates_offset = 0
+        self.engine_lock = threading.Lock()
+        with STARTUP.stage("load user data"):
+            self._init_users()
+        # twitter lookups are cached, see lookup_cache.py, cache_path None keeps them in memory only
+        self.cache = LookupCache(cache_path)
+        self.profiles = ProfileCache() # model outputs of queried users, only newer tweets are scored again
+        # models are built on first use, so the server can answer before they are loaded
+        self._model_senti = None
+        self._senti_server = None
+        self._model_topic = None
+        self.senti_lock = threading.Lock()
+        self.topic_lock = threading.Lock()
+        # json api requests run on a bounded pool, the same user in flight twice is computed once
+        self.pool = RequestPool(num_workers)
+        self.request_timeout = request_timeout
         self.clear()
         self.test_mode = False
+        if warmup: # load both models in the background instead of on the first request
+            threading.Thread(target=self.warm_up, name="warmup", daemon=True).start()
+        if prefetch and self.scheduler is not None and hasattr(self, "users"): # profiles of every user we can recommend
+            threading.Thread(target=self.prefetch_profiles, name="prefetch", daemon=True).start()
+
+    @property
+    def model_senti(self):
+        if self._model_senti is None:
+            with self.senti_lock:
+                if self._model_senti is None:
+                    self._model_senti = ModelSentiment()
+        return self._model_senti
+
+    @property
+    def senti_server(self):
+        """Batches sentiment calls of concurrent requests"""
+        if self._senti_server is None:
+            model = self.model_senti
+            with self.senti_lock:
+                if self._senti_server is None:
+                    self._senti_server = model.serve()
+        return self._senti_server
+
+    @property
+    def model_topic(self):
+        if self._model_topic is None:
+            with self.topic_lock:
+                if self._model_topic is None:
+                    self._model_topic = ModelTopic()
+        return self._model_topic
+
+    def warm_up(self):
+        """Load both models, then print the startup report"""
+        try:
+            self.senti_server
+            self.model_topic
+        except Exception as e:
+            print("Warm up failed: {}".format(e))
+        print(STARTUP.report())
+
+    def prefetch_profiles(self):
+        """Cache the profiles of all users in the database that are not cached yet, stops at the first rate limit"""
+        userids = self.cache.missing("profile", self.users.ids.tolist())
+        done = 0
+        try:
+            for i in range(0, len(userids), 100): # lookup_users takes at most 100 ids
+                self.cache.put_many("profile", self._fetch_profiles(userids[i:i + 100]))
+                done += len(userids[i:i + 100])
+        except RateLimited as e:
+            print("Profile prefetch stopped: {}".format(e))
+        except tweepy.TweepError as e:
+            print("Profile prefetch stopped, tweepy error: {}".format(e))
+        print("{} of {} missing profiles prefetched".format(done, len(userids)))
 
     def clear(self):
         """Clear all attributes to default"""
@@ -50,220 +124,240 @@ class WebApp:
         self.error_log = None
 
     def run(self):
-        """Run application based on input"""
-        if not hasattr(self, "api_queue") or len(self.api_queue) <= 0:
-            print("No APIs, no output")
-            self.error_log = "No APIs, no output"
-            return
-        if not hasattr(self, "userdata"):
-            print("No user data loaded, no output")
-            self.error_log = "No user data loaded, no output"
+        """Run application based on input, results are kept on the page state"""
+        try:
+            if self.test_mode: # if in test mode
+                result = self.score_tweet(self.test_tweet_str)
+                self.senti_output_str = "Positive" if result["sentiments"][0] > 0.5 else "Negative"
+            else: # else in normal mode
+                if self.userid_str == "" and self.username_str == "":
+                    raise RecommendError("No userid nor username entered, no output")
+                try: # use userid by default
+                    userid = int(self.userid_str) if self.userid_str != "" else None
+                except ValueError as e:
+                    raise RecommendError("Error: {}. No output".format(e))
+                result = self.recommend(userid, self.username_str)
+                self.senti_output_str = " ".join(["Positive" if x > 0.5 else "Negative" for x in result["sentiments"]])
+        except RecommendError as e:
+            print(e)
+            self.error_log = str(e)
             return
-        if self.test_mode: # if in test mode
-            if self.test_tweet_str == "":
-                print("No tweet string input, no output")
-                self.error_log = "No tweet string input, no output"
-                return
-            string = preprocess(self.test_tweet_str)
-            pos_neg = self.model_senti.run(string) # return data is a float number
-            self.senti_output_str = "Positive" if pos_neg > 0.5 else "Negative"
+        self.topic_outputs = result["topics"]
+        self.current_user_data = np.array(result["profile"])
+        self.recommand_list = result["recommendations"]
+        if result["error"] is not None:
+            self.error_log = result["error"]
+
+    def score_tweet(self, text):
+        """Test mode: sentiment, top 5 topics and recommendations for a single tweet, without any page state"""
+        self._check_ready()
+        if text == "":
+            raise RecommendError("No tweet string input, no output")
+        with METRICS.span("preprocess"):
+            string = preprocess(text)
+        with METRICS.span("sentiment"):
+            pos_neg = self.senti_server.run(string) # return data is a float number
+        with METRICS.span("topic"):
             topics = self.model_topic.run(string) # return data is list of possibilities
-            self.current_user_data = (pos_neg * 2 - 1) * np.array(topics) * 100 # get current user data
-            topics = list(enumerate(topics)) # assign index
-            topics.sort(key=lambda x:x[1], reverse=True) # descending order
-            topics = [(self.topics[i], "{:.5f}".format(score)) for (i, score) in topics[:5]] # get topic name
-            self.topic_outputs = topics
-            self._find_similar_5()
-        else: # else in normal mode
-            if self.userid_str == "" and self.username_str == "":
-                print("No userid nor username entered, no output")
-                self.error_log = "No userid nor username entered, no output"
-                return
-            # get current user id
-            if self.userid_str != "": # use userid by default
-                try:
-                    userid = int(self.userid_str)
-                except Exception as e:
-                    print("Error: {}".format(e))
-                    print("No output")
-                    self.error_log = "Error: {}. No output".format(e)
-            else:
-                userid = self._get_userid_by_name(self.username_str)
-            if userid is None: return
-            # get user tweets
-            tweets = self._crawl_user_tweets(userid)
-            if tweets is None: return
-            if tweets == []:
-                print("No accessible tweets found for current user")
-                self.error_log = "No accessible tweets found for current user"
-                return
-            pos_neg = self.model_senti.run(tweets) # return data is a float number
-            self.senti_output_str = " ".join(["Positive" if x > 0.5 else "Negative" for x in pos_neg[:5]])
-            topics = self.model_topic.run(tweets) # return data is list of possibilities
-            topic_processed = [np.argmax(x) for x in topics[:5]] # get index for each tweet
-            self.topic_outputs = zip([self.topics[x] for x in topic_processed], ["{:.5f}".format(np.max(x)) for x in topics[:5]])
-            topics = np.array(topics) * 100
-            pos_neg = 2 * np.array(pos_neg) - 1
-            self.current_user_data = np.zeros(20)
-            for sign, dist in zip(pos_neg, topics):
-                self.current_user_data += sign * dist
-            self.current_user_data /= len(tweets)
-            self._find_similar_5()
+        profile = (pos_neg * 2 - 1) * np.array(topics) * 100 # get current user data
+        topics = list(enumerate(topics)) # assign index
+        topics.sort(key=lambda x:x[1], reverse=True) # descending order
+        topics = [(self.topics[i], "{:.5f}".format(score)) for (i, score) in topics[:5]] # get topic name
+        return self._result(None, [float(pos_neg)], topics, profile)
+
+    def recommend(self, userid=None, username=None):
+        """Normal mode: sentiment and topic of the 5 newest tweets and recommendations for a user, without any page state
+        Safe to call from many threads at once, raises RecommendError when there is no answer"""
+        self._check_ready()
+        if userid is None:
+            with METRICS.span("twitter_userid"):
+                userid = self._get_userid_by_name(username)
+        # get user tweets, only the ones after the newest tweet already scored for this user
+        cached = self.profiles.get(userid)
+        since_id = cached.watermark if cached is not None else None
+        with METRICS.span("twitter_timeline"):
+            tweet_ids, tweets = self._crawl_user_tweets(userid, since_id)
+        if tweets == [] and cached is None:
+            raise RecommendError("No accessible tweets found for current user", 404)
+        if tweets != []:
+            with METRICS.span("sentiment"):
+                pos_neg = self.senti_server.run(tweets) # return data is a float number
+            with METRICS.span("topic"):
+                topics = self.model_topic.run(tweets) # return data is list of possibilities
+        else:
+            pos_neg, topics = [], np.zeros((0, len(self.topics)))
+        METRICS.count("tweets_scored", len(tweets))
+        with METRICS.span("profile_update"):
+            profile = self.profiles.update(userid, tweet_ids, pos_neg, topics)
+        topic_processed = [np.argmax(x) for x in profile.topics[:5]] # get index for each tweet
+        topics = list(zip([self.topics[x] for x in topic_processed], ["{:.5f}".format(np.max(x)) for x in profile.topics[:5]]))
+        return self._result(userid, [float(x) for x in profile.pos_neg[:5]], topics, profile.profile)
+
+    def recommend_batch(self, userids=None, vectors=None, k=10, memory_mb=256):
+        """Top k neighbours for many users of the user store (all of them by default), or for precomputed profile vectors
+        see batch_recommend.py, return (ids, neighbours, scores), ids is None for vectors"""
+        if not hasattr(self, "users"):
+            raise RecommendError("No user data loaded, no output", 503)
+        with self.engine_lock:
+            self._apply_updates()
+            users, engine = self.users, self.engine # a swap during the job does not mix two builds
+        if vectors is not None:
+            return (None,) + batch_top_k(engine, vectors, k, memory_mb=memory_mb)
+        return recommend_users(users.ids, users.vectors, userids, k, memory_mb, engine=engine)
+
+    def _result(self, userid, sentiments, topics, profile):
+        """Answer of score_tweet and recommend, plain types only so it can be sent as json"""
+        result = {"userid": userid, "sentiments": sentiments, "topics": [list(x) for x in topics],
+                  "profile": [float(x) for x in profile], "recommendations": [], "error": None}
+        try:
+            result["recommendations"] = self._find_similar_5(profile)
+        except RecommendError as e: # the scores are still worth showing
+            print(e)
+            result["error"] = str(e)
+        return result
+
+    def _check_ready(self):
+        if self.scheduler is None or len(self.scheduler.credentials) <= 0:
+            raise RecommendError("No APIs, no output", 503)
+        if not hasattr(self, "users"):
+            raise RecommendError("No user data loaded, no output", 503)
 
     def switch_mode(self):
         """Switch between normal mode and test mode"""
         self.test_mode = not self.test_mode
     
     def _init_auths(self):
-        """Load auth apis from json"""
+        """Load auth apis from json, calls are spread over them by the scheduler in NetworkData/ratelimit.py"""
         if not os.path.exists(self.auth_path):
             print("Failed to init apis")
             self.error_log = "Failed to init apis"
             return
-        with open(self.auth_path, "r") as inFile:
-            data = json.load(inFile)
-        for api_info in data:
-            print("Loading api info from " + api_info["id"])
-            auth = tweepy.OAuthHandler(consumer_key=api_info["API_key"], consumer_secret=api_info["API_sec_key"])
-            auth.set_access_token(key=api_info["Access_token"], secret=api_info["Access_sec_token"])
-            tweepyapi = tweepy.API(auth)
-            if(tweepyapi is None):
-                print("Failed to init api for " + api_info["id"])
-                continue
-            api = TwitterAPI(tweepyapi)
-            self.api_queue.append(api)
-            print("Load complete")
-        self._update_api_status()
+        self.scheduler = load_scheduler(self.auth_path)
     
     def _init_users(self):
-        """Load target users from local disk"""
-        if not os.path.exists(self.data_path):
+        """Load target users from local disk, the memory mapped user store, or data.csv before the first store build"""
+        if current_version(self.store_path) is not None:
+            users = UserStore.load(self.store_path)
+        elif os.path.exists(self.data_path):
+            users = UserStore.from_frame(pd.read_csv(self.data_path))
+        else:
             print("Failed to load users")
             self.error_log = "Failed to load users"
             return
-        data = pd.read_csv(self.data_path)
-        self.userdata = data
-        self.topics = data.columns.tolist()[1:] # after ID column
-        print("{} users loaded".format(len(data)))
-
-    def recycle_apis(self):
-        """Put the current api to the end of queue, and start using the next one"""
-        assert len(self.api_queue) >= 1
-        print("Recycling APIs")
-        self._refresh()
-        first = self.api_queue[0]
-        self.api_queue = self.api_queue[1:] + [first]
-        self._update_api_status()
-        return self.api_queue[0].remaining_time
-
-    def _refresh(self):
-        """Refresh all api block time"""
-        for api in self.api_queue:
-            api.update()
-
-    def _update_api_status(self):
-        """Update api status string"""
-        num_working = 0
-        for api in self.api_queue:
-            if api.remaining_time <= 0:
-                num_working += 1
-        if len(self.api_queue) == 0:
-            string = "No API found"
-        elif len(self.api_queue) == num_working:
-            string = "Total {} APIs, all working".format(len(self.api_queue))
-        elif num_working <= 0:
-            string = "Total {} APIs, all blocked".format(len(self.api_queue))
+        self._use_users(users)
+        print("{} users loaded".format(len(users)))
+
+    def _use_users(self, users):
+        """Search the given users from now on"""
+        self.users = users
+        self.topics = list(users.columns)
+        if len(users) > self.ann_threshold:
+            self.engine = self._init_ann(users)
         else:
-            string = "Total {} APIs, {} working, {} blocked".format(len(self.api_queue), num_working, len(self.api_queue) - num_working)
-        self.api_status_str = string
-
-    def _find_similar_5(self):
-        """Most most similar 5 people from database"""
-        if self.current_user_data is None:
-            print("No current user data, no recommend")
-            self.error_log = "No current user data, no recommend"
+            self.engine = SimilarityEngine.from_unit(users.ids, users.unit) # normalized by the build
+        # updates so far are already part of the users
+        self.updates_offset = os.path.getsize(self.updates_path) if os.path.exists(self.updates_path) else 0
+
+    def _apply_updates(self):
+        """Switch to a newly published user store, then upsert rows appended to the updates log since last check
+        without reloading"""
+        version = current_version(self.store_path)
+        if version is not None and version != self.users.version: # atomic swap, the old mapping stays valid
+            self._use_users(UserStore.load(self.store_path))
+            print("User store {} loaded - {} users".format(version, len(self.users)))
+        if not os.path.exists(self.updates_path):
+            return
+        size = os.path.getsize(self.updates_path)
+        if size < self.updates_offset: # log was reset by a full build
+            self.updates_offset = 0
+        if size == self.updates_offset:
+            return
+        with open(self.updates_path, "rb") as inFile:
+            inFile.seek(self.updates_offset)
+            data = inFile.read(size - self.updates_offset)
+        data = data[:data.rfind(b"\n") + 1] # leave a partly written last line for next time
+        self.updates_offset += len(data)
+        lines = [x for x in data.decode().splitlines() if x != "" and not x.startswith("ID,")]
+        if len(lines) == 0:
             return
-        saved_data = self.userdata[self.topics].to_numpy() # get matrix
-        # calculate euclidean distance
-        # result = np.apply_along_axis(lambda x: np.linalg.norm(x-self.current_user_data), 1, saved_data) # return an array
-        # calculate angle between two vectors
-        result = np.apply_along_axis(lambda x: self._calc_angle(x, self.current_user_data), 1, saved_data)
-        result = result.argsort()[:10] # top 10 nearest index
-        result = self.userdata["ID"].iloc[result].tolist() # get ids
-        self.recommand_list = self._get_user_profiles(result)
-
-    # credit: https://kite.com/python/answers/how-to-get-the-angle-between-two-vectors-in-python
-    def _calc_angle(self, vector1, vector2):
-        assert len(vector1) == len(vector2)
-        unit1 = vector1 / np.linalg.norm(vector1)
-        unit2 = vector2 / np.linalg.norm(vector2)
-        dot_product = np.dot(unit1, unit2)
-        return np.arccos(dot_product)
+        updates = pd.read_csv(io.StringIO("\n".join(lines)), header=None, names=["ID"] + self.topics)
+        self.engine.upsert(updates["ID"].to_numpy(), updates[self.topics].to_numpy())
+        print("{} user updates applied".format(len(updates)))
+
+    def _init_ann(self, users):
+        """Load approximate search index from disk, or build it if missing or outdated"""
+        ids, vectors = users.ids, users.vectors
+        fingerprint = users.fingerprint or data_fingerprint(ids, vectors)
+        if os.path.exists(os.path.join(self.ann_path, "meta.json")):
+            index = IVFIndex.load(self.ann_path)
+            if index.fingerprint == fingerprint:
+                print("Approximate search index loaded")
+                return index
+        print("Building approximate search index")
+        index = IVFIndex().build(ids, vectors)
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), min(200, len(vectors)), replace=False)]
+        recall = tune_nprobe(index, SimilarityEngine.from_unit(ids, users.unit), sample)
+        print("Index nprobe = {} - Sample recall = {:.3f}".format(index.nprobe, recall))
+        index.fingerprint = fingerprint
+        index.save(self.ann_path)
+        return index
+
+    @property
+    def api_status_str(self):
+        """Api status shown on the page"""
+        if self.scheduler is None:
+            return "No API found"
+        return self.scheduler.status()
+
+    def _find_similar_5(self, user_data):
+        """Profiles of the most similar people from database"""
+        with METRICS.span("similarity"), self.engine_lock: # updates change the engine in place
+            self._apply_updates()
+            result, _ = self.engine.query_ids(user_data, k=10) # top 10 nearest by angle
+        with METRICS.span("twitter_profiles"):
+            return self._get_user_profiles(result.tolist())
 
     def _get_user_profiles(self, userid_list):
-        """Get user profiles"""
-        result = []
+        """Get user profiles, only the ones not cached are looked up"""
+        return self._twitter(self.cache.lookup_many, "profile", userid_list, self._fetch_profiles)
+
+    def _twitter(self, lookup, *args):
+        """Run a twitter lookup, rate limits and tweepy errors become RecommendError"""
         try:
-            users = self.api_queue[0].api.lookup_users(user_ids=userid_list)
-            for user in users:
-                userdata = {}
-                userdata["img"] = "".join(user.profile_image_url_https.rsplit("_normal", 1)) # get high resolution image
-                userdata["name"] = user.name
-                userdata["screen_name"] = user.screen_name
-                userdata["id"] = user.id
-                result.append(userdata)
-        except tweepy.RateLimitError:
-            self.api_queue[0].block() # block current api
-            remaining = self.recycle_apis() # recycle apis
-            if(remaining > 0): # if all apis are blocked, then wait
-                print("All APIs are blocked, sleeping for {:.2f}s".format(remaining))
-                time.sleep(remaining + 1)
-            return self._get_user_profiles(userid_list)
+            return lookup(*args)
+        except RateLimited as e: # a web request must not sleep for the rate limit window
+            raise RecommendError("{}, try again later".format(e), 429)
         except tweepy.TweepError as e:
-            print("Tweepy error: {}".format(e))
-            self.error_log = "Tweepy error: {}".format(e)
-            return []
-        else:
-            return result
+            raise RecommendError("Tweepy error: {}".format(e), 502)
+
+    def _fetch_profiles(self, userid_list):
+        """Look up at most 100 users, dict of userid -> profile for the users found"""
+        result = {}
+        for user in self.scheduler.call("lookup_users", block=False, user_ids=userid_list):
+            userdata = {}
+            userdata["img"] = "".join(user.profile_image_url_https.rsplit("_normal", 1)) # get high resolution image
+            userdata["name"] = user.name
+            userdata["screen_name"] = user.screen_name
+            userdata["id"] = user.id
+            result[user.id] = userdata
+        return result
 
     def _get_userid_by_name(self, username):
-        """Get userid by username"""
-        try:
-            u = self.api_queue[0].api.get_user(screen_name=username)
-        except tweepy.RateLimitError:
-            self.api_queue[0].block() # block current api
-            remaining = self.recycle_apis() # recycle apis
-            if(remaining > 0): # if all apis are blocked, then wait
-                print("All APIs are blocked, sleeping for {:.2f}s".format(remaining))
-                time.sleep(remaining + 1)
-            return self._get_userid_by_name(username)
-        except tweepy.TweepError as e:
-            print("Tweepy error: {}".format(e))
-            self.error_log = "Tweepy error: {}".format(e)
-            return None
-        else:
-            return u.id
+        """Get userid by username, screen names are not case sensitive"""
+        return self._twitter(self.cache.lookup, "userid", username.lower(), lambda name: self.scheduler.call("get_user", block=False, screen_name=name).id)
 
-    def _crawl_user_tweets(self, userid):
-        """Fetch user's recent 400 english tweets, by userid"""
-        try:
-            tweets = self.api_queue[0].api.user_timeline(user_id=userid, count=200, tweet_mode="extended", lang="en") # fetch recent 200 english tweets
-            tweets = [preprocess(x.full_text) for x in tweets]
-            # tweets.sort(key=len, reverse=True)
-            # tweets = tweets[:5]
-        except tweepy.RateLimitError:
-            self.api_queue[0].block() # block current api
-            remaining = self.recycle_apis() # recycle apis
-            if(remaining > 0): # if all apis are blocked, then wait
-                print("All APIs are blocked, sleeping for {:.2f}s".format(remaining))
-                time.sleep(remaining + 1)
-            return self._crawl_user_tweets(userid)
-        except tweepy.TweepError as e:
-            print("Tweepy error: {}".format(e))
-            self.error_log = "Tweepy error: {}".format(e)
-            return None
-        else:
-            return tweets
+    def _crawl_user_tweets(self, userid, since_id=None):
+        """Fetch user's recent 200 english tweets after since_id, by userid
+        Return (tweet ids, cleaned texts), newest first"""
+        # tweets.sort(key=len, reverse=True)
+        # tweets = tweets[:5]
+        return self._twitter(self.cache.lookup, "timeline", "{}>{}".format(userid, since_id or 0), lambda _: self._fetch_tweets(userid, since_id))
+
+    def _fetch_tweets(self, userid, since_id=None):
+        options = {} if since_id is None else {"since_id": since_id}
+        tweets = self.scheduler.call("user_timeline", block=False, user_id=userid, count=200, tweet_mode="extended", lang="en", **options) # fetch recent 200 english tweets
+        with METRICS.span("preprocess"):
+            return [x.id for x in tweets], clean_texts([x.full_text for x in tweets])
 
 webapp = WebApp(os.path.join("..", "NetworkData", "auth.json"))
 
@@ -272,6 +366,51 @@ def main():
     global webapp
     return render_template('server.html', webapp=webapp)
 
+# where the startup time went
+@app.route('/startup')
+def startup():
+    return STARTUP.report(), 200, {"Content-Type": "text/plain"}
+
+# hits and misses of the twitter lookup and profile caches, and the api request pool
+@app.route('/cache')
+def cache():
+    return json.dumps({"lookups": webapp.cache.stats(), "profiles": webapp.profiles.stats(), "requests": webapp.pool.stats()}, indent=2), 200, {"Content-Type": "application/json"}
+
+# stateless recommendation for any number of concurrent clients
+# /api/recommend?user=<userid or screen name>, or /api/recommend?tweet=<text> for a single tweet
+@app.route('/api/recommend')
+def api_recommend():
+    with METRICS.span("request"):
+        result, status = recommend_answer(request.args.get("user", "").strip().lstrip("@"), request.args.get("tweet", ""))
+    METRICS.count("requests", status=status)
+    return jsonify(result), status
+
+def recommend_answer(user, tweet):
+    """Json answer and http status of /api/recommend"""
+    try:
+        if tweet != "":
+            return webapp.pool.run(("tweet", tweet), webapp.score_tweet, tweet, timeout=webapp.request_timeout), 200
+        elif user.isdigit():
+            return webapp.pool.run(("userid", int(user)), webapp.recommend, int(user), timeout=webapp.request_timeout), 200
+        elif user != "":
+            return webapp.pool.run(("username", user.lower()), webapp.recommend, None, user, timeout=webapp.request_timeout), 200
+        return {"error": "No user nor tweet given"}, 400
+    except RecommendError as e:
+        return {"error": str(e)}, e.status
+    except Overloaded as e:
+        return {"error": str(e)}, 503
+    except RequestTimeout as e:
+        return {"error": str(e)}, 504
+
+# latency of every request stage, request counters and cache state, in Prometheus text format
+@app.route('/metrics')
+def metrics():
+    lookups = webapp.cache.stats()["namespaces"]
+    gauges = {"lookup_cache_events": {(("namespace", ns), ("event", event)): value for ns, counters in lookups.items() for event, value in counters.items()},
+              "profile_cache": {(("value", k),): v for k, v in webapp.profiles.stats().items()},
+              "request_pool": {(("value", k),): v for k, v in webapp.pool.stats().items()}}
+    return METRICS.render(gauges), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
 # function for running the application
 @app.route('/execute')
 def run():
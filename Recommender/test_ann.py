@@ -0,0 +1,80 @@
+# Tests for the approximate nearest neighbour index
+# run with: python -m pytest test_ann.py
+
+import numpy as np
+from similarity import SimilarityEngine
+from ann import IVFIndex, measure_recall, tune_nprobe, data_fingerprint
+
+def make_data(num=5000, dim=20, seed=0):
+    """Clustered vectors, shaped like the user topic vectors"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(40, dim)) * 3
+    vectors = centers[rng.integers(0, len(centers), num)] + rng.normal(size=(num, dim))
+    ids = np.arange(num, dtype=np.int64) * 7 + 1000
+    return ids, vectors, rng
+
+def test_recall_grows_with_nprobe():
+    ids, vectors, rng = make_data()
+    exact = SimilarityEngine(ids, vectors)
+    index = IVFIndex().build(ids, vectors)
+    queries = vectors[:100] + rng.normal(size=(100, vectors.shape[1])) * 0.1
+    index.nprobe = 16
+    assert measure_recall(index, exact, queries)[0] >= 0.9
+    index.nprobe = index.nlist # probing every list is an exact search
+    assert measure_recall(index, exact, queries)[0] == 1.0
+
+def test_tune_nprobe_reaches_target_on_random_data():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(5000, 20)) # worst case, no cluster structure
+    ids = np.arange(5000)
+    exact = SimilarityEngine(ids, vectors)
+    index = IVFIndex(nprobe=1).build(ids, vectors)
+    recall = tune_nprobe(index, exact, vectors[:100], target=0.95)
+    assert recall >= 0.95
+
+def test_query_never_pads_results():
+    ids, vectors, rng = make_data()
+    index = IVFIndex(nlist=500, nprobe=1).build(ids, vectors)
+    found, scores = index.query(rng.normal(size=(200, vectors.shape[1])), k=10)
+    assert np.isfinite(scores).all()
+    for row in found:
+        assert len(np.unique(row)) == 10
+
+def test_save_load_and_add(tmp_path):
+    ids, vectors, rng = make_data()
+    index = IVFIndex().build(ids, vectors)
+    index.fingerprint = data_fingerprint(ids, vectors)
+    index.save(str(tmp_path))
+    loaded = IVFIndex.load(str(tmp_path))
+    assert isinstance(loaded.vectors, np.memmap)
+    assert loaded.fingerprint == index.fingerprint
+    queries = vectors[:20]
+    assert (loaded.query(queries)[0] == index.query(queries)[0]).all()
+    # inserted vectors are found right away, before compaction
+    new_ids = np.array([1, 2, 3])
+    new_vectors = rng.normal(size=(3, vectors.shape[1])) * 5
+    loaded.add(new_ids, new_vectors)
+    for userid, vector in zip(new_ids, new_vectors):
+        assert loaded.query_ids(vector, k=1)[0][0] == userid
+
+def test_fingerprint_detects_changed_data():
+    ids, vectors, _ = make_data(num=100)
+    changed = vectors.copy()
+    changed[5, 3] += 1
+    assert data_fingerprint(ids, vectors) != data_fingerprint(ids, changed)
+
+def test_upsert_in_place(tmp_path):
+    ids, vectors, rng = make_data()
+    exact = SimilarityEngine(ids, vectors)
+    index = IVFIndex().build(ids, vectors)
+    index.save(str(tmp_path))
+    index = IVFIndex.load(str(tmp_path)) # memory mapped, copied on first write
+    moved = rng.normal(size=(2, vectors.shape[1])) * 5
+    upsert_ids = np.array([ids[10], 99]) # one known id, one new id
+    for engine in [exact, index]:
+        engine.upsert(upsert_ids, moved)
+        assert len(engine) == len(ids) + 1
+        for userid, vector in zip(upsert_ids, moved):
+            found = engine.query_ids(vector, k=10)[0]
+            assert found[0] == userid
+            assert len(np.unique(found)) == 10
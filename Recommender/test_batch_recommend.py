@@ -0,0 +1,59 @@
+# Tests for the batch recommender, compared against one SimilarityEngine query per user
+# run with: python -m pytest test_batch_recommend.py
+
+import numpy as np
+import pandas as pd
+from similarity import SimilarityEngine
+from profiles import TOPIC_COLUMNS, make_user_table
+from batch_recommend import block_size, batch_top_k, top_k_rows, recommend_users, write_results, read_results, SAMPLE_COLUMNS
+
+def make_data(num_users, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(10**9, num_users, replace=False)
+    return make_user_table(ids, rng.normal(size=(num_users, len(TOPIC_COLUMNS))), np.ones(num_users, dtype=np.int64))
+
+def test_block_size_follows_the_memory_cap():
+    assert block_size(1000, memory_mb=1) == 65
+    assert block_size(10**8, memory_mb=1) == 1 # never less than one row
+    assert block_size(0) > 0
+
+def test_threshold_top_k_matches_a_full_partition():
+    rng = np.random.default_rng(1)
+    scores = rng.normal(size=(50, 5 * SAMPLE_COLUMNS)).astype(np.float32)
+    scores[3, :SAMPLE_COLUMNS] = -10 # the first columns bound nothing useful, still correct
+    scores[4, -20:] = 50 + np.arange(20) # best columns all at the end
+    for k in (1, 10, 25):
+        top, top_scores = top_k_rows(scores, k)
+        expected, expected_scores = SimilarityEngine._top_k(scores, k)
+        assert np.array_equal(top, expected) and np.array_equal(top_scores, expected_scores)
+
+def test_matches_single_queries_without_the_user_itself():
+    data = make_data(3000)
+    engine = SimilarityEngine(data["ID"].to_numpy(), data[TOPIC_COLUMNS].to_numpy())
+    userids = data["ID"].to_numpy()[::7]
+    ids, neighbours, scores = recommend_users(data["ID"], data[TOPIC_COLUMNS], np.r_[userids, 5], k=10, memory_mb=1) # 5 is unknown
+    assert np.array_equal(ids, userids)
+    for userid, row, row_scores in zip(ids, neighbours, scores):
+        expected, expected_scores = engine.query_ids(data.loc[data["ID"] == userid, TOPIC_COLUMNS].to_numpy()[0], k=11)
+        assert expected[0] == userid
+        assert np.array_equal(row, expected[1:])
+        assert np.allclose(row_scores, expected_scores[1:])
+
+def test_vectors_and_small_databases():
+    data = make_data(4)
+    engine = SimilarityEngine(data["ID"].to_numpy(), data[TOPIC_COLUMNS].to_numpy())
+    ids, neighbours, scores = recommend_users(data["ID"], data[TOPIC_COLUMNS], k=5, engine=engine)
+    assert (neighbours[:, :3] >= 0).all() and (neighbours[:, 3:] == -1).all() # only 3 other users
+    assert np.isnan(scores[:, 3:]).all()
+    assert all(userid not in row for userid, row in zip(ids, neighbours))
+    vectors = data[TOPIC_COLUMNS].to_numpy() * 3 # scale does not change cosine similarity
+    found, _ = batch_top_k(engine, vectors, k=2)
+    assert np.array_equal(found[:, 0], data["ID"].to_numpy())
+
+def test_write_and_read_npz(tmp_path):
+    data = make_data(50)
+    ids, neighbours, scores = recommend_users(data["ID"].to_numpy(), data[TOPIC_COLUMNS].to_numpy(), k=3)
+    path = str(tmp_path / "recommendations.npz")
+    write_results(path, ids, neighbours, scores)
+    read_ids, read_neighbours, read_scores = read_results(path)
+    assert np.array_equal(read_ids, ids) and np.array_equal(read_neighbours, neighbours) and np.array_equal(read_scores, scores)
@@ -0,0 +1,47 @@
+# Tests for the micro-batching inference worker
+# run with: python -m pytest test_batching.py
+
+import threading
+import numpy as np
+import pytest
+from batching import MicroBatcher
+
+class FakeModel:
+    """Output is the text length, remembers every batch it was called with"""
+    def __init__(self):
+        self.calls = []
+
+    def run(self, texts):
+        self.calls.append(len(texts))
+        return np.array([[len(x)] for x in texts], dtype=np.float32)
+
+def test_concurrent_requests_share_batches():
+    model = FakeModel()
+    batcher = MicroBatcher(model.run, max_batch=64, max_wait_ms=50)
+    results = {}
+    def request(i):
+        results[i] = batcher.run(["x" * i, "y" * (i + 1)])
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+    for i in range(20):
+        assert results[i].ravel().tolist() == [i, i + 1]
+    assert len(model.calls) < 20 and sum(model.calls) == 40
+    stats = batcher.stats()
+    assert stats["requests"] == 20 and stats["batches"] == len(model.calls)
+    assert sum(stats["batch_sizes"].values()) == len(model.calls)
+
+def test_single_string_and_errors():
+    model = FakeModel()
+    batcher = MicroBatcher(model.run, max_wait_ms=1)
+    assert batcher.run("abc").tolist() == [3]
+    def broken(texts):
+        raise ValueError("bad batch")
+    failing = MicroBatcher(broken, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        failing.run(["a"])
+    batcher.close()
+    failing.close()
@@ -0,0 +1,122 @@
+# Tests for the sharded build, with fake models so no model files are needed
+# run with: python -m pytest test_build.py
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from build import ShardedBuild, build_batched, preprocess
+from profiles import TOPIC_COLUMNS
+
+class FakeSentiment:
+    """Same output shape as ModelSentiment.run, depends only on the text"""
+    def run(self, texts):
+        return np.array([[(len(x) % 7) / 7] for x in texts])
+
+class FakeTopic:
+    """Same output shape as ModelTopic.run, depends only on the text"""
+    def run(self, texts):
+        out = np.array([[(len(x) * (j + 1)) % 11 + 1 for j in range(len(TOPIC_COLUMNS))] for x in texts], dtype=float)
+        return out / out.sum(axis=1, keepdims=True)
+
+class CrashingSentiment(FakeSentiment):
+    """Dies on the second shard a worker builds, like a worker killed mid run"""
+    def __init__(self):
+        self.num_calls = 0
+
+    def run(self, texts):
+        self.num_calls += 1
+        if self.num_calls > 1:
+            raise RuntimeError("worker killed")
+        return super().run(texts)
+
+def fake_models():
+    return FakeSentiment(), FakeTopic()
+
+def crashing_models():
+    return CrashingSentiment(), FakeTopic()
+
+def make_tweets(path, num_users=30, num_tweets=400, seed=0):
+    rng = np.random.default_rng(seed)
+    userids = rng.choice(np.arange(num_users) * 7919 + 12, num_tweets)
+    words = ["space", "launch", "vote", "game", "church", "code", "python", "rocket", "team"]
+    tweets = [" ".join(rng.choice(words, rng.integers(1, 12))) for _ in range(num_tweets)]
+    pd.DataFrame({"User ID": userids, "Tweet": tweets}).to_csv(path, index=False)
+
+def expected_table(path):
+    """The non-sharded build of the same tweets"""
+    tweets_data = pd.read_csv(path)
+    tweets_data["Tweet"] = tweets_data["Tweet"].apply(preprocess)
+    return build_batched(tweets_data, *fake_models())
+
+def assert_same_users(df, expected):
+    df = df.set_index("ID").sort_index()
+    expected = expected.set_index("ID").sort_index()
+    assert df.index.tolist() == expected.index.tolist()
+    assert np.allclose(df[TOPIC_COLUMNS].to_numpy(), expected[TOPIC_COLUMNS].to_numpy())
+
+def shard_mtimes(build):
+    return {i: os.stat(build._path("shard", int(i), "npz")).st_mtime_ns for i in build._load_manifest()["done"]}
+
+def test_partition_covers_every_tweet_once(tmp_path):
+    make_tweets(tmp_path / "tweets.csv")
+    build = ShardedBuild(str(tmp_path / "tweets.csv"), shard_dir=str(tmp_path / "shards"), num_shards=4)
+    os.makedirs(build.shard_dir)
+    build._partition(range(4))
+    parts = [pd.read_pickle(build._path("input", i, "pkl")) for i in range(4)]
+    assert sum(len(x) for x in parts) == len(pd.read_csv(tmp_path / "tweets.csv"))
+    users = [set(x["User ID"]) for x in parts]
+    assert all(len(users[i] & users[j]) == 0 for i in range(4) for j in range(i + 1, 4)) # a user lives in one shard
+
+def test_partition_reads_the_tweet_sink(tmp_path):
+    make_tweets(tmp_path / "tweets.csv")
+    tweets_data = pd.read_csv(tmp_path / "tweets.csv")
+    tweets_data.to_json(tmp_path / "tweets.jsonl", orient="records", lines=True) # layout of DataProcess/tweet_sink.py
+    build = ShardedBuild(str(tmp_path / "tweets.jsonl"), shard_dir=str(tmp_path / "shards"), num_shards=2)
+    os.makedirs(build.shard_dir)
+    build._partition(range(2))
+    parts = pd.concat([pd.read_pickle(build._path("input", i, "pkl")) for i in range(2)]).sort_index()
+    assert parts["User ID"].tolist() == tweets_data["User ID"].tolist()
+    assert parts["Tweet"].tolist() == tweets_data["Tweet"].tolist()
+
+def test_rerun_skips_finished_shards(tmp_path):
+    path = str(tmp_path / "tweets.csv")
+    make_tweets(path)
+    build = ShardedBuild(path, shard_dir=str(tmp_path / "shards"), num_shards=3, workers=1, model_factory=crashing_models)
+    with pytest.raises(RuntimeError):
+        build.run()
+    with open(build.manifest_path) as inFile:
+        assert list(json.load(inFile)["done"].keys()) == ["0"] # checkpointed before the crash
+    finished = shard_mtimes(build)
+
+    build = ShardedBuild(path, shard_dir=str(tmp_path / "shards"), num_shards=3, workers=2, model_factory=fake_models)
+    df, sums, counts = build.run()
+    mtimes = shard_mtimes(build)
+    assert sorted(mtimes.keys()) == ["0", "1", "2"]
+    assert mtimes["0"] == finished["0"] # not built again
+    assert_same_users(df, expected_table(path))
+    assert counts.sum() == 400
+    assert not any(x.endswith(".pkl") for x in os.listdir(build.shard_dir)) # inputs removed once built
+
+    # lost output is built again, the other shards are kept
+    os.remove(build._path("shard", 1, "npz"))
+    df, _, _ = build.run()
+    after = shard_mtimes(build)
+    assert after["0"] == mtimes["0"] and after["2"] == mtimes["2"] and after["1"] != mtimes["1"]
+    assert_same_users(df, expected_table(path))
+
+def test_outdated_manifest_builds_everything_again(tmp_path):
+    path = str(tmp_path / "tweets.csv")
+    make_tweets(path, seed=1)
+    build = ShardedBuild(path, shard_dir=str(tmp_path / "shards"), num_shards=2, workers=2, model_factory=fake_models)
+    build.run()
+    make_tweets(path, num_users=40, num_tweets=500, seed=2) # new input
+    assert build._load_manifest()["done"] == {}
+    df, _, counts = build.run()
+    assert_same_users(df, expected_table(path))
+    assert counts.sum() == 500
+    # another shard count does not reuse the shards either
+    assert ShardedBuild(path, shard_dir=str(tmp_path / "shards"), num_shards=3)._load_manifest()["done"] == {}
+    merged, _, _ = build.merge()
+    assert_same_users(merged, df)
@@ -0,0 +1,80 @@
+# Tests for the twitter lookup cache of the web app
+# run with: python -m pytest test_lookup_cache.py
+
+import pytest
+from lookup_cache import LookupCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class Fetch:
+    """Counts the ids it was asked for"""
+    def __init__(self):
+        self.asked = []
+
+    def __call__(self, userids):
+        self.asked.append(list(userids))
+        return {x: {"id": x, "name": "user{}".format(x)} for x in userids if x != 404}
+
+def test_lookup_is_fetched_once_until_it_expires():
+    clock = Clock()
+    cache = LookupCache(ttl={"userid": 60}, clock=clock)
+    calls = []
+    fetch = lambda name: calls.append(name) or 42
+    assert cache.lookup("userid", "bob", fetch) == 42
+    assert cache.lookup("userid", "bob", fetch) == 42
+    assert calls == ["bob"]
+    clock.now += 61
+    assert cache.lookup("userid", "bob", fetch) == 42
+    assert calls == ["bob", "bob"]
+    assert cache.stats()["namespaces"]["userid"] == {"hits": 1, "disk_hits": 0, "misses": 2, "expired": 1, "evictions": 0}
+
+def test_errors_are_not_cached():
+    cache = LookupCache()
+    def fail(name):
+        raise ConnectionError("down")
+    with pytest.raises(ConnectionError):
+        cache.lookup("userid", "bob", fail)
+    assert cache.get("userid", "bob") is None
+
+def test_least_recently_used_is_evicted():
+    cache = LookupCache(maxsize=2)
+    cache.put("profile", 1, "a")
+    cache.put("profile", 2, "b")
+    assert cache.get("profile", 1) == "a" # 2 is now the oldest
+    cache.put("profile", 3, "c")
+    assert cache.get("profile", 2) is None
+    assert cache.get("profile", 1) == "a" and cache.get("profile", 3) == "c"
+    assert cache.stats()["namespaces"]["profile"]["evictions"] == 1
+
+def test_lookup_many_fetches_only_missing_ids_in_order():
+    cache = LookupCache()
+    fetch = Fetch()
+    assert [x["id"] for x in cache.lookup_many("profile", [3, 1, 2], fetch)] == [3, 1, 2]
+    assert [x["id"] for x in cache.lookup_many("profile", [5, 1, 404, 3, 5], fetch)] == [5, 1, 3, 5] # 404 is not found
+    assert fetch.asked == [[3, 1, 2], [5, 404]]
+    assert cache.missing("profile", [1, 2, 404, 7]) == [404, 7]
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    clock = Clock()
+    cache = LookupCache(path, ttl={"timeline": 100, "profile": 1000}, clock=clock)
+    cache.put("timeline", 7, ["hello world", "second tweet"])
+    cache.lookup_many("profile", list(range(1000)), Fetch())
+    cache.close()
+    clock.now += 50
+    cache = LookupCache(path, maxsize=10, ttl={"timeline": 100, "profile": 1000}, clock=clock)
+    assert cache.missing("profile", list(range(1200))) == [404] + list(range(1000, 1200)) # 404 was never found
+    fetch = Fetch()
+    assert cache.lookup("timeline", 7, fetch) == ["hello world", "second tweet"]
+    assert cache.lookup_many("profile", [999, 0], fetch)[0] == {"id": 999, "name": "user999"}
+    assert fetch.asked == []
+    assert cache.stats()["namespaces"]["profile"]["disk_hits"] == 2
+    cache.close()
+    clock.now += 60 # timelines expired, profiles did not
+    cache = LookupCache(path, ttl={"timeline": 100, "profile": 1000}, clock=clock)
+    assert cache.get("timeline", 7) is None and cache.get("profile", 5) == {"id": 5, "name": "user5"}
@@ -0,0 +1,78 @@
+# Tests for the request metrics and their Prometheus text output
+# run with: python -m pytest test_metrics.py
+
+import re
+import time
+import numpy as np
+from metrics import Metrics, Histogram, BUCKETS
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_spans_fill_histograms_and_quantiles():
+    clock = Clock()
+    metrics = Metrics(clock=clock)
+    for i in range(1, 101): # 1ms to 100ms
+        with metrics.span("sentiment"):
+            clock.now += i / 1000
+    summary = metrics.summary()["sentiment"]
+    assert summary["count"] == 100
+    assert abs(summary["mean"] - 0.0505) < 1e-9
+    assert abs(summary["p50"] - 0.0505) < 1e-9 and abs(summary["p95"] - 0.09505) < 1e-9 and abs(summary["p99"] - 0.09901) < 1e-9
+
+def test_span_records_when_the_stage_fails():
+    metrics = Metrics()
+    try:
+        with metrics.span("twitter_timeline"):
+            raise ValueError("rate limited")
+    except ValueError:
+        pass
+    assert metrics.summary()["twitter_timeline"]["count"] == 1
+
+def test_quantiles_follow_recent_samples():
+    histogram = Histogram(num_recent=10)
+    for _ in range(100):
+        histogram.observe(1.0)
+    for _ in range(10):
+        histogram.observe(0.001)
+    assert histogram.quantiles() == [0.001, 0.001, 0.001]
+    assert histogram.count == 110
+
+def test_render_prometheus_text():
+    metrics = Metrics()
+    metrics.observe("similarity", 0.003)
+    metrics.observe("similarity", 7.0)
+    metrics.observe("similarity", 100.0)
+    metrics.count("requests", status=200)
+    metrics.count("requests", status=200)
+    metrics.count("requests", status=504)
+    text = metrics.render({"request_pool": {(("value", "in_flight"),): 3}})
+    lines = text.splitlines()
+    assert 'recommender_stage_seconds_bucket{stage="similarity",le="0.0025"} 0' in lines
+    assert 'recommender_stage_seconds_bucket{stage="similarity",le="0.005"} 1' in lines
+    assert 'recommender_stage_seconds_bucket{stage="similarity",le="10.0"} 2' in lines
+    assert 'recommender_stage_seconds_bucket{stage="similarity",le="+Inf"} 3' in lines
+    assert 'recommender_stage_seconds_count{stage="similarity"} 3' in lines
+    assert 'recommender_stage_recent_seconds{stage="similarity",quantile="0.5"} 7.0' in lines
+    assert 'recommender_requests_total{status="200"} 2' in lines and 'recommender_requests_total{status="504"} 1' in lines
+    assert 'recommender_request_pool{value="in_flight"} 3' in lines
+    sample = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? [-+.0-9eInfa]+$')
+    assert all(x.startswith("# ") or sample.match(x) for x in lines)
+    assert len([x for x in lines if x.startswith("recommender_stage_seconds_bucket")]) == len(BUCKETS) + 1
+
+def test_disabled_metrics_cost_almost_nothing():
+    metrics = Metrics(enabled=False)
+    assert metrics.span("a") is metrics.span("b")
+    with metrics.span("sentiment"):
+        pass
+    metrics.count("requests", status=200)
+    assert metrics.summary() == {} and metrics.render().strip().endswith("summary")
+    start = time.perf_counter()
+    for _ in range(100000):
+        with metrics.span("sentiment"):
+            pass
+    assert (time.perf_counter() - start) / 100000 < 5e-6 # a few hundred ns per span
@@ -0,0 +1,56 @@
+# Tests for the shared text preprocessing, compared against the original per-character implementations
+# run with: python -m pytest test_preprocessing.py
+
+import re
+import random
+import pytest
+import preprocessing
+
+CHR_RANGE = list(range(97, 123)) + list(range(65, 91)) + [ord(' '), ord('\'')]
+
+def original_preprocess(text):
+    text = re.sub(r"(\u00a9|\u00ae|[\u2000-\u3300]|\ud83c[\ud000-\udfff]|\ud83d[\ud000-\udfff]|\ud83e[\ud000-\udfff])", "", text)
+    text = re.sub(r"[^\x00-\x7f]", "", text)
+    text = re.sub(r"(@|#)([A-Z]|[a-z]|[0-9]|_)+", "", text)
+    text = re.sub(r"(http|https)://([A-Z]|[a-z]|[0-9]|/|\.)+", "", text)
+    return text.strip().lower()
+
+def original_letters(raw_string):
+    raw_string = re.sub(r"(@|#)([A-Z]|[a-z]|[0-9]|_)+", "", raw_string)
+    raw_string = re.sub(r"(http|https)://([A-Z]|[a-z]|[0-9]|/|\.)+", "", raw_string)
+    return "".join([ch.lower() if ord(ch) in CHR_RANGE else ' ' for ch in list(raw_string)]).strip()
+
+def make_texts(num=2000, seed=0):
+    rng = random.Random(seed)
+    alphabet = "abcXYZ @#_:/.http\n\t'é\U0001F600©12 running cats "
+    texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60))) for _ in range(num)]
+    return texts + ["Check https://t.co/x1Ab @bob #Tag I'm RUNNING!! \U0001F600", ""]
+
+def test_clean_text_matches_original():
+    texts = make_texts()
+    expected = [original_preprocess(x) for x in texts]
+    assert [preprocessing.clean_text(x) for x in texts] == expected
+    assert preprocessing.clean_texts(texts) == expected
+
+def test_count_words_matches_original():
+    texts = make_texts()
+    expected = [len(original_letters(x).split()) for x in texts]
+    assert [preprocessing.count_words(x) for x in texts] == expected
+    assert preprocessing.count_words_texts(texts) == expected
+
+def test_process_sentiment_matches_original():
+    snowball = pytest.importorskip("nltk.stem.snowball")
+    stemmer = snowball.SnowballStemmer("english")
+    texts = make_texts()
+    expected = [" ".join([stemmer.stem(w) for w in original_letters(x).split()]) for x in texts]
+    assert [preprocessing.process_sentiment(x) for x in texts] == expected
+    assert preprocessing.process_sentiment_texts(texts) == expected
+
+def test_batch_keeps_series_index_and_handles_separator():
+    pd = pytest.importorskip("pandas")
+    texts = pd.Series(["A @b c", "http://x.io D"], index=[7, 3], name="Tweet")
+    result = preprocessing.clean_texts(texts)
+    assert result.index.tolist() == [7, 3] and result.name == "Tweet"
+    assert result.tolist() == ["a  c", "d"]
+    assert preprocessing.clean_texts([]) == [] and preprocessing.count_words_texts([]) == []
+    assert preprocessing.count_words_texts(["a\x00b c"]) == [3] # falls back to one text at a time
@@ -0,0 +1,48 @@
+# Tests for the computed profile cache of the web app, against profiles.user_profile over the same tweets
+# run with: python -m pytest test_profile_cache.py
+
+import numpy as np
+from profiles import user_profile, TOPIC_COLUMNS
+from profile_cache import ProfileCache, CachedProfile
+
+def model_outputs(num, seed):
+    rng = np.random.default_rng(seed)
+    topics = rng.dirichlet(np.ones(len(TOPIC_COLUMNS)), size=num).astype(np.float32)
+    return rng.random(num).astype(np.float32), topics
+
+def test_incremental_updates_match_a_full_rescore():
+    pos_neg, topics = model_outputs(500, 0)
+    tweet_ids = np.arange(500, 0, -1) # newest first
+    cache = ProfileCache(window=200)
+    start = 450 # the user had 50 tweets at the first query, then new ones arrive in small groups
+    entry = cache.update(7, tweet_ids[start:], pos_neg[start:], topics[start:])
+    assert entry.watermark == 50
+    for end in (440, 300, 299, 299, 100, 0):
+        entry = cache.update(7, tweet_ids[end:start], pos_neg[end:start], topics[end:start])
+        start = end
+        window = slice(start, start + 200)
+        assert entry.watermark == tweet_ids[start]
+        assert len(entry.tweet_ids) == len(tweet_ids[window])
+        assert np.allclose(entry.profile, user_profile(pos_neg[window], topics[window]))
+    stats = cache.stats()
+    assert stats["tweets_scored"] == 500 and stats["hits"] == 0 and stats["misses"] == 0
+
+def test_get_counts_hits_and_misses():
+    cache = ProfileCache()
+    assert cache.get(1) is None
+    pos_neg, topics = model_outputs(10, 1)
+    cache.update(1, np.arange(10, 0, -1), pos_neg, topics)
+    assert cache.get(1).watermark == 10
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_least_recently_used_users_are_evicted_by_size():
+    pos_neg, topics = model_outputs(100, 2)
+    size = CachedProfile(np.arange(100), pos_neg, topics).nbytes
+    cache = ProfileCache(max_bytes=3 * size)
+    for userid in range(3):
+        cache.update(userid, np.arange(100), pos_neg, topics)
+    cache.get(0) # 1 is now the least recently used
+    cache.update(3, np.arange(100), pos_neg, topics)
+    assert cache.get(1) is None
+    assert all(cache.get(x) is not None for x in (0, 2, 3))
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] == 3 * size
@@ -0,0 +1,59 @@
+# Tests for the user profile aggregation, no models needed
+# run with: python -m pytest test_profiles.py
+
+import numpy as np
+from profiles import TOPIC_COLUMNS, user_profile, aggregate_users, make_user_table, fold_in, load_stats, save_stats
+
+def make_outputs(num=600, seed=0):
+    """Fake model outputs, shaped like ModelSentiment.run and ModelTopic.run"""
+    rng = np.random.default_rng(seed)
+    userids = rng.choice([44196397, 12, 846137120209190912, 5162861, 989], num) # tweets of a user are not contiguous
+    pos_neg = rng.random((num, 1))
+    topics = rng.random((num, len(TOPIC_COLUMNS)))
+    topics /= topics.sum(axis=1, keepdims=True)
+    return userids, pos_neg, topics
+
+def test_grouped_reduction_matches_per_user_loop():
+    userids, pos_neg, topics = make_outputs()
+    uniques, sums, counts = aggregate_users(userids, pos_neg, topics)
+    table = make_user_table(uniques, sums, counts)
+    # users keep their order of first appearance, like unique() in build_per_user
+    assert table["ID"].tolist() == list(dict.fromkeys(userids.tolist()))
+    for userid, row in zip(table["ID"], table[TOPIC_COLUMNS].to_numpy()):
+        mask = userids == userid
+        assert np.allclose(row, user_profile(pos_neg[mask], topics[mask]))
+    assert counts.sum() == len(userids)
+
+def test_single_tweet_users():
+    userids, pos_neg, topics = make_outputs(num=3)
+    userids = np.array([3, 1, 2])
+    uniques, sums, counts = aggregate_users(userids, pos_neg, topics)
+    assert uniques.tolist() == [3, 1, 2]
+    assert (counts == 1).all()
+    assert np.allclose(sums[1], user_profile(pos_neg[1:2], topics[1:2]))
+
+def test_empty_input():
+    uniques, sums, counts = aggregate_users([], np.zeros((0, 1)), np.zeros((0, 0)))
+    assert len(uniques) == 0 and sums.shape == (0, len(TOPIC_COLUMNS)) and len(counts) == 0
+    assert len(make_user_table(uniques, sums, counts)) == 0
+
+def test_fold_in_matches_full_aggregation():
+    userids, pos_neg, topics = make_outputs()
+    full_ids, full_sums, full_counts = aggregate_users(userids, pos_neg, topics)
+    half = len(userids) // 2
+    ids, sums, counts = aggregate_users(userids[:half], pos_neg[:half], topics[:half])
+    new_ids, new_sums, new_counts = aggregate_users(userids[half:], pos_neg[half:], topics[half:])
+    new_ids, new_sums, new_counts = np.r_[new_ids, 7], np.r_[new_sums, new_sums[:1]], np.r_[new_counts, 1] # one unseen user
+    ids, sums, counts, changed = fold_in(ids, sums, counts, new_ids, new_sums, new_counts)
+    assert ids[-1] == 7 and len(changed) == len(new_ids)
+    order = [ids.tolist().index(x) for x in full_ids]
+    assert np.allclose(sums[order], full_sums)
+    assert (counts[order] == full_counts).all()
+
+def test_stats_round_trip(tmp_path):
+    userids, pos_neg, topics = make_outputs()
+    ids, sums, counts = aggregate_users(userids, pos_neg, topics)
+    path = str(tmp_path / "data_stats.npz")
+    save_stats(path, ids, sums, counts)
+    loaded = load_stats(path)
+    assert (loaded[0] == ids).all() and np.allclose(loaded[1], sums) and (loaded[2] == counts).all()
@@ -0,0 +1,74 @@
+# Tests for the worker pool behind the json api, coalescing, timeouts and the pending limit
+# run with: python -m pytest test_request_pool.py
+
+import time
+import threading
+import pytest
+from request_pool import RequestPool, Overloaded, RequestTimeout
+
+class SlowWork:
+    """Blocks until released, counts how often it ran per key"""
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, key):
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+        self.release.wait(10)
+        return "result of {}".format(key)
+
+def test_same_key_in_flight_runs_once():
+    pool = RequestPool(num_workers=4)
+    work = SlowWork()
+    results = []
+    threads = [threading.Thread(target=lambda k=k: results.append(pool.run(k, work, k, timeout=10))) for k in ["a"] * 10 + ["b"] * 5]
+    for x in threads:
+        x.start()
+    time.sleep(0.1)
+    work.release.set()
+    for x in threads:
+        x.join()
+    assert sorted(results) == ["result of a"] * 10 + ["result of b"] * 5
+    assert work.calls == {"a": 1, "b": 1}
+    assert pool.stats() == {"in_flight": 0, "requests": 15, "coalesced": 13, "rejected": 0, "timeouts": 0}
+    assert pool.run("a", work, "a") == "result of a" # done requests are not reused
+    assert work.calls["a"] == 2
+    pool.close()
+
+def test_timeout_leaves_the_work_running():
+    pool = RequestPool(num_workers=2)
+    work = SlowWork()
+    with pytest.raises(RequestTimeout):
+        pool.run("a", work, "a", timeout=0.05)
+    future = pool.submit("a", work, "a") # still in flight, so it is shared
+    work.release.set()
+    assert future.result(10) == "result of a" and work.calls == {"a": 1}
+    assert pool.stats()["timeouts"] == 1
+    pool.close()
+
+def test_too_many_pending_requests_are_rejected():
+    pool = RequestPool(num_workers=2, max_pending=3)
+    work = SlowWork()
+    futures = [pool.submit(k, work, k) for k in "abc"]
+    with pytest.raises(Overloaded):
+        pool.submit("d", work, "d")
+    assert pool.submit("a", work, "a") is futures[0] # joining a request in flight is always fine
+    work.release.set()
+    assert [x.result(10) for x in futures] == ["result of a", "result of b", "result of c"]
+    assert pool.stats()["rejected"] == 1
+    pool.close()
+
+def test_errors_reach_every_waiting_caller():
+    pool = RequestPool()
+    release = threading.Event()
+    def fail():
+        release.wait(10)
+        raise ValueError("no tweets")
+    futures = [pool.submit("a", fail) for _ in range(3)]
+    release.set()
+    for x in futures:
+        with pytest.raises(ValueError):
+            x.result(10)
+    pool.close()
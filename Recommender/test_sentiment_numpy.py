@@ -0,0 +1,67 @@
+# Tests for the NumPy backend of the sentiment model
+# run with: python -m pytest test_sentiment_numpy.py
+# the parity test builds a small Keras model with the architecture of SentimentAnalysis/Model.ipynb
+# and is skipped when tensorflow is not installed
+
+import json
+import numpy as np
+import pytest
+from sentiment_numpy import NumpySentiment, export_keras
+
+class FakeTokenizer:
+    """Attributes of the Keras Tokenizer that export_keras reads"""
+    def __init__(self, words, num_words, oov_token=None):
+        self.word_index = {word: i + 1 for i, word in enumerate(words)}
+        self.num_words = num_words
+        self.filters = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+        self.lower = True
+        self.split = " "
+        self.oov_token = oov_token
+
+def build_keras(tf, max_features=50, pad_len=45):
+    model = tf.keras.Sequential()
+    model.add(tf.keras.Input(shape=(pad_len,)))
+    model.add(tf.keras.layers.Embedding(max_features, 16))
+    model.add(tf.keras.layers.Dropout(0.2))
+    model.add(tf.keras.layers.Conv1D(24, 5, padding='valid', activation='relu', strides=1))
+    model.add(tf.keras.layers.MaxPooling1D(pool_size=4))
+    model.add(tf.keras.layers.Bidirectional(tf.keras.layers.LSTM(8)))
+    model.add(tf.keras.layers.Dense(1, activation="sigmoid"))
+    return model
+
+def test_forward_pass_matches_keras(tmp_path):
+    tf = pytest.importorskip("tensorflow")
+    tf.keras.utils.set_random_seed(0)
+    model = build_keras(tf)
+    rng = np.random.default_rng(0)
+    for weight in model.weights: # spread weights so the outputs are not all near 0.5
+        weight.assign(rng.normal(scale=0.5, size=weight.shape).astype(np.float32))
+    path = str(tmp_path / "model_sentiment.npz")
+    export_keras(model, FakeTokenizer(["w{}".format(i) for i in range(80)], num_words=50), 45, path)
+    numpy_model = NumpySentiment(path)
+    data = rng.integers(0, 50, size=(64, 45)).astype(np.int32)
+    data[:8, 20:] = 0 # padded rows
+    expected = model.predict(data, verbose=0)
+    found = numpy_model.predict(data)
+    assert found.shape == (64, 1)
+    assert np.abs(expected - found).max() < 1e-4
+
+def make_numpy_model(tmp_path, oov_token=None):
+    """Export tiny random weights without tensorflow, the forward pass is not checked here"""
+    tokenizer = FakeTokenizer(["good", "bad", "day", "rare"], num_words=4, oov_token=oov_token)
+    path = str(tmp_path / "model_sentiment.npz")
+    config = {"pad_len": 6, "tokenizer": {"num_words": 4, "filters": tokenizer.filters, "lower": True, "split": " ", "oov_token": oov_token}}
+    vocab = [(k, v) for k, v in tokenizer.word_index.items() if v < 4 or k == oov_token]
+    np.savez(path, config=np.array(json.dumps(config)), words=np.array([k for k, _ in vocab]), word_ids=np.array([v for _, v in vocab]))
+    return NumpySentiment(path)
+
+def test_tokenizer_and_padding_follow_keras_rules(tmp_path):
+    model = make_numpy_model(tmp_path)
+    # lower case, filters split words, index >= num_words and unknown words are dropped
+    assert model.texts_to_sequences(["Good,BAD day! rare unknown", ""]) == [[1, 2, 3], []]
+    padded = model.pad_sequences([[1, 2, 3], [1] * 4 + [2] * 4, []], padding="post", maxlen=6)
+    assert padded.tolist() == [[1, 2, 3, 0, 0, 0], [1, 1, 2, 2, 2, 2], [0] * 6] # truncating keeps the end
+
+def test_tokenizer_with_oov_token(tmp_path):
+    model = make_numpy_model(tmp_path, oov_token="day")
+    assert model.texts_to_sequences(["good rare unknown"]) == [[1, 3, 3]]
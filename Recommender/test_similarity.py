@@ -0,0 +1,51 @@
+# Tests for the similarity engine, compared against the angle ranking it replaced in system.py
+# run with: python -m pytest test_similarity.py
+
+import numpy as np
+from similarity import SimilarityEngine
+
+def calc_angle(vector1, vector2):
+    """WebApp._calc_angle before the engine"""
+    assert len(vector1) == len(vector2)
+    unit1 = vector1 / np.linalg.norm(vector1)
+    unit2 = vector2 / np.linalg.norm(vector2)
+    dot_product = np.dot(unit1, unit2)
+    return np.arccos(dot_product)
+
+def original_top_k(matrix, vector, k):
+    """Old _find_similar_5, angle to every user then a full argsort"""
+    result = np.apply_along_axis(lambda x: calc_angle(x, vector), 1, matrix)
+    return result.argsort()[:k]
+
+def make_data(num=500, dim=20, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.arange(num) * 3 + 100, rng.normal(size=(num, dim)) * 50, rng
+
+def test_query_matches_angle_ranking():
+    ids, matrix, rng = make_data()
+    engine = SimilarityEngine(ids, matrix)
+    for _ in range(20):
+        vector = rng.normal(size=matrix.shape[1]) * 50
+        indices, scores = engine.query(vector, k=10)
+        assert indices.tolist() == original_top_k(matrix, vector, 10).tolist()
+        assert np.all(np.diff(scores) <= 0) # descending similarity
+    found_ids, _ = engine.query_ids(vector, k=10)
+    assert found_ids.tolist() == ids[original_top_k(matrix, vector, 10)].tolist()
+
+def test_batch_query_matches_single_queries():
+    ids, matrix, rng = make_data()
+    engine = SimilarityEngine(ids, matrix)
+    vectors = rng.normal(size=(8, matrix.shape[1]))
+    indices, scores = engine.query(vectors, k=5)
+    assert indices.shape == (8, 5) and scores.shape == (8, 5)
+    for i, vector in enumerate(vectors):
+        assert indices[i].tolist() == original_top_k(matrix, vector, 5).tolist()
+
+def test_k_at_least_the_number_of_users():
+    ids, matrix, rng = make_data(num=7)
+    engine = SimilarityEngine(ids, matrix)
+    vector = rng.normal(size=matrix.shape[1])
+    for k in (7, 50):
+        indices, scores = engine.query(vector, k=k)
+        assert indices.tolist() == original_top_k(matrix, vector, 7).tolist() # all users, best first
+        assert len(scores) == 7
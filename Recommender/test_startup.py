@@ -0,0 +1,21 @@
+# Tests for lazy imports and the startup report
+# run with: python -m pytest test_startup.py
+
+import sys
+import subprocess
+from startup import StartupTimer
+
+def test_report_lists_stages_slowest_first():
+    timer = StartupTimer()
+    with timer.stage("fast"):
+        pass
+    with timer.stage("slow"):
+        sum(range(200000))
+    lines = timer.report().splitlines()
+    assert len(lines) == 3
+    assert "slow" in lines[1] and "fast" in lines[2]
+
+def test_model_import_skips_heavy_libraries():
+    code = "import sys, model; print(','.join(m for m in ('sklearn', 'tensorflow', 'nltk') if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == ""
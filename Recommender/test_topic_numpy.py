@@ -0,0 +1,117 @@
+# Tests for the sparse NumPy path of the topic model
+# run with: python -m pytest test_topic_numpy.py
+# the sklearn parity test fits a small pipeline like TopicExtraction/text_classification.ipynb
+# and is skipped when sklearn is not installed
+
+import re
+import json
+import string
+import numpy as np
+import pytest
+from collections import Counter
+from preprocessing import stem
+from topic_numpy import NumpyTopic, export_pipeline
+
+nltk_tokenize = pytest.importorskip("nltk.tokenize.destructive").NLTKWordTokenizer().tokenize
+
+TEXTS = ["The game last night was great, can't wait for the next one!",
+         "New GPU drivers for linux (version 3.2) are out... finally",
+         "space launch today. it's \"amazing\" says dr. smith",
+         "I don't think the u.s. team will win the game",
+         "", "!!! ???"]
+
+def split_sentences(text):
+    """Stand-in for punkt: a period after a word of 3+ letters ends the sentence, so "dr." and "u.s." do not"""
+    return [x for x in re.split(r"(?<=[a-z]{3}\.)\s+", text) if x]
+
+def reference_tokens(text, splitter=split_sentences):
+    """word_tokenize with the given sentence splitter, then stem"""
+    return [stem(x) for sentence in splitter(text.lower()) for x in nltk_tokenize(sentence)]
+
+def make_model(tmp_path, texts=TEXTS, stop_words=("the", "for", "i", "will", "it", "!", ".", ","), splitter=split_sentences):
+    """Vocabulary of all tokens in texts, random idf and log probabilities"""
+    words = sorted({x for text in texts for x in reference_tokens(text, splitter)} - set(stop_words))
+    rng = np.random.default_rng(0)
+    log_prob = np.log(rng.dirichlet(np.ones(len(words)), size=4))
+    path = str(tmp_path / "model_topic.npz")
+    config = {"lowercase": True, "binary": False, "sublinear_tf": False, "use_idf": True, "norm": "l2"}
+    np.savez(path, config=np.array(json.dumps(config)), words=np.array(words), word_ids=np.arange(len(words)),
+             stop_words=np.array(sorted(stop_words)), idf=rng.uniform(1, 5, len(words)),
+             feature_log_prob=log_prob, class_log_prior=np.log(np.full(4, 0.25)), targets=np.array(list("abcd")))
+    return NumpyTopic(path, sentence_splitter=splitter)
+
+def dense_reference(model, texts, splitter=split_sentences):
+    """Tf-idf and naive Bayes written out document by document"""
+    result = []
+    for text in texts:
+        counts = Counter(x for x in reference_tokens(text, splitter) if x not in model.stop_words and x in model.vocabulary)
+        row = np.zeros(len(model.idf))
+        for word, count in counts.items():
+            row[model.vocabulary[word]] = count * model.idf[model.vocabulary[word]]
+        if row.any():
+            row /= np.linalg.norm(row)
+        jll = model.class_log_prior + model.feature_log_prob @ row
+        result.append(np.exp(jll - np.logaddexp.reduce(jll)))
+    return np.array(result)
+
+def test_single_sentences_match_dense_reference(tmp_path):
+    model = make_model(tmp_path)
+    texts = [TEXTS[0], TEXTS[1], TEXTS[3], TEXTS[4], TEXTS[5]] # no sentence breaks inside
+    found = model.predict_proba(texts)
+    assert found.shape == (5, 4)
+    assert np.allclose(found, dense_reference(model, texts), atol=1e-12)
+    assert np.allclose(found[3], 0.25) # no words, prior only
+
+def test_sentence_ends_split_the_final_period(tmp_path):
+    model = make_model(tmp_path)
+    # the splitter ends a sentence after "today." but not after "dr."
+    found = model.predict_proba([TEXTS[2]])
+    assert np.allclose(found, dense_reference(model, [TEXTS[2]]), atol=1e-12)
+    assert np.allclose(found, dense_reference(model, ["space launch today . it's \"amazing\" says dr. smith"]), atol=1e-12)
+    _, indices, _ = model.transform([TEXTS[2]])
+    words = {v: k for k, v in model.vocabulary.items()}
+    assert {"today", "dr."} <= {words[i] for i in indices}
+
+def test_matches_word_tokenize_with_punkt(tmp_path):
+    from nltk import word_tokenize, sent_tokenize
+    try:
+        sent_tokenize("punkt data installed?")
+    except LookupError:
+        pytest.skip("punkt data is not installed")
+    texts = TEXTS + ["Mr. Brown met Dr. Smith at 5 p.m. in the U.S. today. Then they left.", "It costs $3.50. \"Really?\" she said."]
+    model = make_model(tmp_path, texts, splitter=sent_tokenize)
+    model.sentence_splitter = None # the default, loads nltk sent_tokenize
+    words = {v: k for k, v in model.vocabulary.items()}
+    for text in texts:
+        _, indices, _ = model.transform([text])
+        expected = {stem(x) for x in word_tokenize(text.lower())} - model.stop_words
+        assert {words[i] for i in indices} == expected & set(model.vocabulary)
+    assert np.allclose(model.predict_proba(texts), dense_reference(model, texts, sent_tokenize), atol=1e-12)
+    assert "dr." in model.vocabulary and "today" in model.vocabulary
+
+def test_batches_and_empty_input(tmp_path):
+    model = make_model(tmp_path)
+    model.batch_size = 2
+    texts = TEXTS * 3
+    assert np.allclose(model.predict_proba(texts), np.tile(model.predict_proba(TEXTS), (3, 1)))
+    assert model.predict_proba([]).shape == (0, 4)
+
+def test_matches_sklearn_pipeline(tmp_path):
+    pytest.importorskip("sklearn")
+    from sklearn.pipeline import Pipeline
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    train = ["the hockey game was great", "nhl playoffs start tonight", "linux kernel drivers released",
+             "my gpu drivers crash", "nasa launch to orbit", "the shuttle orbit is stable"] * 5
+    labels = [0, 0, 1, 1, 2, 2] * 5
+    pipeline = Pipeline([
+        ('vectorizer', TfidfVectorizer(stop_words=["the", "is", "my", "to"] + list(string.punctuation), tokenizer=reference_tokens)),
+        ('classifier', MultinomialNB(alpha=0.01))
+    ])
+    pipeline.fit(train, labels)
+    path = str(tmp_path / "model_topic.npz")
+    export_pipeline(pipeline, ["hockey", "linux", "space"], path)
+    model = NumpyTopic(path, sentence_splitter=split_sentences)
+    texts = ["hockey drivers crash in orbit!", "great launch, the nhl shuttle. my gpu is stable", "", "unknown words only"]
+    assert np.allclose(model.predict_proba(texts), pipeline.predict_proba(texts), atol=1e-10)
+    assert model.targets == ["hockey", "linux", "space"]
@@ -0,0 +1,77 @@
+# Tests for the versioned, memory mapped user store
+# run with: python -m pytest test_user_store.py
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from profiles import TOPIC_COLUMNS, make_user_table
+from similarity import SimilarityEngine
+from user_store import UserStore, publish_store, publish_table, current_version
+from build import publish
+
+def make_table(num_users, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(10**12, num_users, replace=False)
+    sums = rng.normal(size=(num_users, len(TOPIC_COLUMNS))) * 50
+    sums[0] = 0 # a user with a neutral profile
+    return make_user_table(ids, sums, np.ones(num_users, dtype=np.int64))
+
+def test_round_trip_is_memory_mapped(tmp_path):
+    path = str(tmp_path / "data.store")
+    df = make_table(500)
+    assert current_version(path) is None
+    assert publish_table(df, path) == "v000001"
+    store = UserStore.load(path)
+    assert isinstance(store.vectors, np.memmap) and isinstance(store.unit, np.memmap)
+    assert store.version == "v000001" and store.columns == TOPIC_COLUMNS and len(store) == 500
+    assert np.array_equal(store.ids, df["ID"].to_numpy())
+    assert np.allclose(store.to_frame()[TOPIC_COLUMNS].to_numpy(), df[TOPIC_COLUMNS].to_numpy(), atol=1e-4)
+    engine = SimilarityEngine(df["ID"].to_numpy(), df[TOPIC_COLUMNS].to_numpy())
+    mapped = SimilarityEngine.from_unit(store.ids, store.unit)
+    queries = df[TOPIC_COLUMNS].to_numpy()[:20]
+    assert np.array_equal(mapped.query_ids(queries, k=10)[0], engine.query_ids(queries, k=10)[0])
+
+def test_upsert_copies_the_mapped_matrix(tmp_path):
+    path = str(tmp_path / "data.store")
+    df = make_table(50)
+    publish_table(df, path)
+    store = UserStore.load(path)
+    engine = SimilarityEngine.from_unit(store.ids, store.unit)
+    vector = np.zeros(len(TOPIC_COLUMNS))
+    vector[3] = 1
+    engine.upsert([df["ID"][5], 42], np.array([vector, vector]))
+    assert set(engine.query_ids(vector, k=2)[0].tolist()) == {df["ID"][5], 42}
+    assert np.array_equal(UserStore.load(path).unit, store.unit) # the file is not changed
+
+def test_new_version_swaps_and_old_readers_keep_working(tmp_path):
+    path = str(tmp_path / "data.store")
+    publish_table(make_table(30, seed=1), path)
+    old = UserStore.load(path)
+    for seed in range(2, 6):
+        publish_table(make_table(40 + seed, seed=seed), path)
+    assert current_version(path) == "v000005"
+    assert sorted(x for x in os.listdir(path) if x.startswith("v")) == ["v000003", "v000004", "v000005"] # older ones pruned
+    assert len(UserStore.load(path)) == 45
+    assert len(old) == 30 and np.isfinite(np.asarray(old.unit)).all() # still mapped after its folder was removed
+
+def test_unknown_format_is_rejected(tmp_path):
+    path = str(tmp_path / "data.store")
+    publish_store([1, 2], np.ones((2, 3)), ["a", "b", "c"], path)
+    header_path = os.path.join(path, "v000001", "header.json")
+    with open(header_path) as inFile:
+        header = json.load(inFile)
+    header["version"] = 99
+    with open(header_path, "w") as outFile:
+        json.dump(header, outFile)
+    with pytest.raises(ValueError):
+        UserStore.load(path)
+
+def test_build_publishes_the_store(tmp_path):
+    df = make_table(20)
+    counts = np.full(20, 3)
+    store_path = str(tmp_path / "data.store")
+    publish(df, df[TOPIC_COLUMNS].to_numpy() * 3, counts, str(tmp_path / "data.csv"), str(tmp_path / "data_stats.npz"), store_path)
+    store = UserStore.load(store_path)
+    assert np.array_equal(store.ids, pd.read_csv(str(tmp_path / "data.csv"))["ID"].to_numpy())
@@ -0,0 +1,181 @@
+# This file contains a sparse NumPy path for the topic model (TfidfVectorizer + MultinomialNB)
+# so that topic inference does not run word_tokenize and sklearn for every document
+# How it works
+# export reads the fitted vocabulary and idf of the vectorizer, and the log probabilities of the classifier
+# Every document is split into sentences with punkt, same as word_tokenize does
+# Inside a sentence tokens never cross whitespace, so every distinct whitespace separated chunk is tokenized once
+# with the regex word tokenizer of nltk, stemmed through the stem cache, stop words removed and mapped to feature ids
+# and that result is cached. Only the last chunk of a sentence is tokenized as the end of the text,
+# so the tokens are exactly those of word_tokenize
+# All documents of a call are counted into one CSR matrix, tf-idf weighted and l2 normalized in bulk
+# then the class posteriors are one sparse matrix product plus log-sum-exp
+#
+# To export, run in this folder (needs sklearn once):
+#   python topic_numpy.py
+# it also checks that both backends give the same outputs and times them
+
+import os
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from preprocessing import stem
+
+NUMPY_TOPIC_PATH = "model_topic.npz"
+CHUNK_CACHE_SIZE = 500000
+
+class NumpyTopic:
+    def __init__(self, path=NUMPY_TOPIC_PATH, batch_size=4096, sentence_splitter=None):
+        with np.load(path) as data:
+            self.config = json.loads(str(data["config"]))
+            self.vocabulary = dict(zip(data["words"].tolist(), data["word_ids"].tolist()))
+            self.stop_words = frozenset(data["stop_words"].tolist())
+            self.idf = data["idf"]
+            self.feature_log_prob = data["feature_log_prob"] # (classes, features)
+            self.class_log_prior = data["class_log_prior"]
+            self.targets = data["targets"].tolist()
+        self.batch_size = batch_size
+        self.sentence_splitter = sentence_splitter # nltk sent_tokenize unless given
+        self.word_tokenizer = None
+        self._chunk_features = lru_cache(maxsize=CHUNK_CACHE_SIZE)(self._features)
+
+    def predict_proba(self, texts):
+        """Same as predict_proba of the sklearn pipeline, return shape (num, classes)"""
+        texts = list(texts)
+        outputs = [self._posteriors(self.transform(texts[i:i+self.batch_size])) for i in range(0, len(texts), self.batch_size)]
+        if len(outputs) == 0:
+            return np.zeros((0, len(self.class_log_prior)))
+        return np.concatenate(outputs)
+
+    def transform(self, texts):
+        """Tf-idf matrix of texts in CSR form, (data, indices, indptr)"""
+        if self.sentence_splitter is None:
+            from nltk.tokenize import sent_tokenize
+            self.sentence_splitter = sent_tokenize
+        rows, features = [], []
+        for i, text in enumerate(texts):
+            if self.config["lowercase"]:
+                text = text.lower()
+            for sentence in self.sentence_splitter(text):
+                chunks = sentence.split()
+                for j, chunk in enumerate(chunks):
+                    ids = self._chunk_features(chunk, j == len(chunks) - 1)
+                    features.extend(ids)
+                    rows.extend([i] * len(ids))
+        num_features = len(self.idf)
+        # count every (row, feature) pair, sorted keys give the CSR layout directly
+        keys, counts = np.unique(np.asarray(rows, dtype=np.int64) * num_features + np.asarray(features, dtype=np.int64), return_counts=True)
+        rows, indices = np.divmod(keys, num_features)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(texts)))])
+        data = counts.astype(np.float64)
+        if self.config["binary"]:
+            data[:] = 1
+        elif self.config["sublinear_tf"]:
+            data = np.log(data) + 1
+        if self.config["use_idf"]:
+            data *= self.idf[indices]
+        if self.config["norm"] == "l2":
+            norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=len(texts)))
+            data /= norms[rows]
+        elif self.config["norm"] == "l1":
+            norms = np.bincount(rows, weights=np.abs(data), minlength=len(texts))
+            data /= norms[rows]
+        return data, indices, indptr
+
+    def _posteriors(self, matrix):
+        """Joint log likelihood as one sparse product, then log-sum-exp"""
+        data, indices, indptr = matrix
+        num = len(indptr) - 1
+        jll = np.tile(self.class_log_prior, (num, 1))
+        nonempty = np.flatnonzero(np.diff(indptr))
+        if len(nonempty) > 0:
+            weighted = data[:, None] * self.feature_log_prob.T[indices] # (nnz, classes)
+            jll[nonempty] += np.add.reduceat(weighted, indptr[nonempty], axis=0)
+        jll -= jll.max(axis=1, keepdims=True)
+        probs = np.exp(jll)
+        probs /= probs.sum(axis=1, keepdims=True)
+        return probs
+
+    def _features(self, chunk, last):
+        """Feature ids of one whitespace separated chunk, last if it ends its sentence"""
+        if self.word_tokenizer is None:
+            from nltk.tokenize.destructive import NLTKWordTokenizer
+            self.word_tokenizer = NLTKWordTokenizer()
+        if last:
+            tokens = self.word_tokenizer.tokenize(chunk)
+        else: # inside a sentence, the tokenizer must not see the chunk as the end of the text
+            tokens = self.word_tokenizer.tokenize(chunk + " _")[:-1]
+        ids = []
+        for token in tokens:
+            token = stem(token)
+            if token in self.stop_words:
+                continue
+            index = self.vocabulary.get(token)
+            if index is not None:
+                ids.append(index)
+        return tuple(ids)
+
+def export_pipeline(pipeline, targets, path=NUMPY_TOPIC_PATH):
+    """Save the fitted TfidfVectorizer + MultinomialNB pipeline into one npz"""
+    vectorizer = pipeline.steps[0][1]
+    classifier = pipeline.steps[-1][1]
+    assert vectorizer.analyzer == "word" and tuple(vectorizer.ngram_range) == (1, 1)
+    assert vectorizer.strip_accents is None and vectorizer.preprocessor is None
+    config = {"lowercase": vectorizer.lowercase,
+              "binary": vectorizer.binary,
+              "sublinear_tf": vectorizer.sublinear_tf,
+              "use_idf": vectorizer.use_idf,
+              "norm": vectorizer.norm}
+    vocab = sorted(vectorizer.vocabulary_.items(), key=lambda x: x[1])
+    idf = vectorizer.idf_ if vectorizer.use_idf else np.ones(len(vocab))
+    stop_words = sorted(vectorizer.get_stop_words() or [])
+    np.savez(path, config=np.array(json.dumps(config)),
+             words=np.array([k for k, _ in vocab], dtype=str),
+             word_ids=np.array([v for _, v in vocab], dtype=np.int64),
+             stop_words=np.array(stop_words, dtype=str),
+             idf=np.asarray(idf, dtype=np.float64),
+             feature_log_prob=np.asarray(classifier.feature_log_prob_, dtype=np.float64),
+             class_log_prior=np.asarray(classifier.class_log_prior_, dtype=np.float64),
+             targets=np.array(targets, dtype=str))
+
+def check_parity(sklearn_model, numpy_model, texts, tolerance=1e-6):
+    """Run both backends on texts, return the share of texts within tolerance, 1.0 when they agree"""
+    expected = np.asarray(sklearn_model.run(texts))
+    found = np.asarray(numpy_model.run(texts))
+    difference = np.abs(expected - found).max(axis=1) if len(texts) > 0 else np.zeros(0)
+    within = float(np.mean(difference <= tolerance)) if len(texts) > 0 else 1.0
+    same_topic = float(np.mean(expected.argmax(axis=1) == found.argmax(axis=1))) if len(texts) > 0 else 1.0
+    print("{:.2%} of {} texts within {:.0e}, same top topic for {:.2%}, max difference {:.2e}".format(
+        within, len(texts), tolerance, same_topic, difference.max() if len(texts) > 0 else 0.0))
+    return within
+
+def benchmark(models, texts, repeat=3):
+    """Best time of run over texts for every model, in seconds"""
+    result = {}
+    for name, model in models.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model.run(texts)
+            times.append(time.perf_counter() - start)
+        result[name] = min(times)
+        print("{:>8}: {:.3f}s for {} texts".format(name, result[name], len(texts)))
+    return result
+
+if __name__ == "__main__":
+    from model import ModelTopic
+    model_sklearn = ModelTopic(backend="sklearn")
+    export_pipeline(model_sklearn.model, model_sklearn.targets)
+    print("Exported to {}".format(NUMPY_TOPIC_PATH))
+    model_numpy = ModelTopic(backend="numpy")
+    tweets_path = os.path.join("..", "DataProcess", "tweets_200_processed.csv")
+    if os.path.exists(tweets_path):
+        texts = pd.read_csv(tweets_path)["Tweet"].astype(str).tolist()
+    else:
+        texts = ["the game last night was great", "new gpu drivers for linux are out", "space launch today!", ""] * 10000
+    failed = check_parity(model_sklearn, model_numpy, texts[:5000]) < 1.0
+    benchmark({"sklearn": model_sklearn, "numpy": model_numpy}, texts)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,113 @@
+# This file contains the binary user database written by build.py and read by the web app (system.py)
+# How it works
+# Every build is published as a new version folder: ids.npy (int64), vectors.npy (float32 profiles, the data.csv values),
+# unit.npy (the same rows scaled to unit length, ready for SimilarityEngine) and header.json with the topic columns
+# The CURRENT file names the live version and is replaced atomically, so a reader sees the old build or the new one,
+# never a half written one, and old versions stay on disk for readers that still map them
+# Arrays are loaded with mmap, so opening takes the same time for any number of users
+# and every worker process shares one copy in the page cache
+# run with: python user_store.py data.csv (converts an existing data.csv)
+
+import os
+import sys
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from ann import data_fingerprint
+from similarity import SimilarityEngine
+
+STORE_FORMAT = "user-store"
+STORE_VERSION = 1
+STORE_PATH = "data.store"
+KEEP_VERSIONS = 3 # the live one and two before it, for readers that have not switched yet
+
+class UserStore:
+    def __init__(self, ids, vectors, unit, columns, version=None, fingerprint=None):
+        self.ids = ids
+        self.vectors = vectors
+        self.unit = unit # vectors with rows scaled to unit length, zero rows stay zero
+        self.columns = columns
+        self.version = version
+        self.fingerprint = fingerprint # data_fingerprint of ids and vectors, see ann.py
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path=STORE_PATH, mmap=True):
+        """Open the live version, memory mapped by default"""
+        version = current_version(path)
+        if version is None:
+            raise FileNotFoundError("No published user store in {}".format(path))
+        folder = os.path.join(path, version)
+        with open(os.path.join(folder, "header.json"), "r") as inFile:
+            header = json.load(inFile)
+        if header.get("format") != STORE_FORMAT or header.get("version") != STORE_VERSION:
+            raise ValueError("{} is not a {} version {} folder".format(folder, STORE_FORMAT, STORE_VERSION))
+        mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(folder, name + ".npy"), mmap_mode=mode) for name in ("ids", "vectors", "unit")]
+        return cls(*arrays, header["columns"], version, header.get("fingerprint"))
+
+    @classmethod
+    def from_frame(cls, df):
+        """In memory store of a user table with an ID column and one column per topic, like data.csv"""
+        columns = [x for x in df.columns if x != "ID"]
+        vectors = df[columns].to_numpy(dtype=np.float32)
+        return cls(df["ID"].to_numpy(dtype=np.int64), vectors, SimilarityEngine._normalize(vectors), columns)
+
+    def to_frame(self):
+        """The user table as in data.csv"""
+        df = pd.DataFrame(np.asarray(self.vectors), columns=self.columns)
+        df.insert(0, "ID", np.asarray(self.ids))
+        return df
+
+def current_version(path=STORE_PATH):
+    """Name of the live version folder, None if nothing was published"""
+    try:
+        with open(os.path.join(path, "CURRENT"), "r") as inFile:
+            return inFile.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def publish_store(ids, vectors, columns, path=STORE_PATH, keep=KEEP_VERSIONS):
+    """Write a new version and make it the live one, return its name"""
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), len(columns))
+    if not os.path.exists(path):
+        os.makedirs(path)
+    versions = _versions(path)
+    version = "v{:06d}".format(int(versions[-1][1:]) + 1 if len(versions) > 0 else 1)
+    tmp_path = os.path.join(path, version + ".tmp")
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "ids.npy"), ids)
+    np.save(os.path.join(tmp_path, "vectors.npy"), vectors)
+    np.save(os.path.join(tmp_path, "unit.npy"), SimilarityEngine._normalize(vectors))
+    header = {"format": STORE_FORMAT, "version": STORE_VERSION, "columns": list(columns), "num_users": len(ids),
+              "fingerprint": data_fingerprint(ids, vectors)}
+    with open(os.path.join(tmp_path, "header.json"), "w") as outFile:
+        json.dump(header, outFile)
+    os.replace(tmp_path, os.path.join(path, version))
+    with open(os.path.join(path, "CURRENT.tmp"), "w") as outFile:
+        outFile.write(version)
+        outFile.flush()
+        os.fsync(outFile.fileno())
+    os.replace(os.path.join(path, "CURRENT.tmp"), os.path.join(path, "CURRENT"))
+    for old in _versions(path)[:-keep]:
+        shutil.rmtree(os.path.join(path, old), ignore_errors=True) # a reader mapping it keeps its pages on linux
+    return version
+
+def publish_table(df, path=STORE_PATH):
+    """Publish a user table with an ID column and one column per topic, like data.csv"""
+    columns = [x for x in df.columns if x != "ID"]
+    return publish_store(df["ID"].to_numpy(), df[columns].to_numpy(), columns, path)
+
+def _versions(path):
+    return sorted(x for x in os.listdir(path) if x.startswith("v") and not x.endswith(".tmp"))
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "data.csv"
+    version = publish_table(pd.read_csv(csv_path))
+    print("{} published as {}/{}".format(csv_path, STORE_PATH, version))
@@ -1,26 +1,13 @@
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-import re
+import sys
 import pickle
 import numpy as np
 import tensorflow as tf
-from nltk.stem.snowball import SnowballStemmer
 tf.config.set_visible_devices([], 'GPU') # force use CPU, in case no GPU available
 
-stemmer = SnowballStemmer("english")
-ch_range = list(range(97, 123)) + list(range(65, 91)) + [ord(' '), ord('\'')]
-def process_str(raw_string):
-    global ch_range
-    global stemmer
-    # first remove url, @username, etc
-    raw_string = re.sub(r"(@|#)([A-Z]|[a-z]|[0-9]|_)+", "", raw_string)
-    raw_string = re.sub(r"(http|https)://([A-Z]|[a-z]|[0-9]|/|\.)+", "", raw_string)
-    # remove characters other than [a-z][A-Z][0-9]['!?] or empty space
-    new_string = "".join([ch.lower() if ord(ch) in ch_range else ' ' for ch in list(raw_string)])
-    # remove extra space, and also convert plural form to singular
-    new_string = new_string.strip()
-    new_string = " ".join([stemmer.stem(word) for word in new_string.split()])
-    return new_string
+sys.path.append(os.path.join("..", "Recommender"))
+from preprocessing import process_sentiment as process_str # same preprocessing as the training data
 
 with open(os.path.join("dataset", "sentiment140", "data.pickle"), "rb") as inFile:
     data = pickle.load(inFile)
@@ -0,0 +1,351 @@
+# This file contains the benchmark suite of the whole pipeline, run on synthetic data (synthetic.py) without network
+# How it works
+# Every case times one hot path of a stage at a few scales:
+#   crawl       graph insertion of the crawl engine (EdgeListGraph.add_edge, then to_csr)
+#   network     community detection (louvain) and centrality inside the communities
+#   tweets      tweet filtering of the crawler (score_tweets, select_tweets)
+#   models      preprocess, ModelSentiment.run and ModelTopic.run on the NumPy backends with random weights
+#   build       aggregation of the model outputs into user profiles
+#   recommend   the similarity search of _find_similar_5, one query at a time like the web app
+# A case is run warmup times untimed, then repeat times with the garbage collector off, like timeit
+# Results go to a json file with the environment (git commit, python, numpy, cpu) and the settings,
+# compare reads two of them and lists every case that got slower by more than the threshold
+# run with: python bench.py run --scales small medium
+#           python bench.py compare results/before.json results/after.json
+
+import os
+import gc
+import sys
+import time
+import json
+import shutil
+import fnmatch
+import platform
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import synthetic
+from synthetic import ROOT
+
+RESULTS_FORMAT = "mooner-benchmark"
+RESULTS_VERSION = 1
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# tweets = tweet_users * tweets_per_user, the models score the first model_tweets of them
+SCALES = {"small": {"nodes": 2000, "tweet_users": 40, "tweets_per_user": 50, "model_tweets": 500, "db_users": 10000, "queries": 50},
+          "medium": {"nodes": 20000, "tweet_users": 400, "tweets_per_user": 50, "model_tweets": 5000, "db_users": 100000, "queries": 50},
+          "large": {"nodes": 200000, "tweet_users": 4000, "tweets_per_user": 50, "model_tweets": 20000, "db_users": 1000000, "queries": 50}}
+DEFAULT_SCALES = ("small", "medium")
+
+class Fixtures:
+    """Synthetic data of one scale, made on first use and shared by the cases"""
+    def __init__(self, sizes, seed=0):
+        self.sizes = sizes
+        self.seed = seed
+        self.cache = {}
+        self.workdir = None
+
+    def get(self, name):
+        if name not in self.cache:
+            self.cache[name] = getattr(self, "_make_" + name)()
+        return self.cache[name]
+
+    def close(self):
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+    def _make_network(self):
+        return synthetic.follower_edges(self.sizes["nodes"], seed=self.seed)
+
+    def _make_tweets(self):
+        return synthetic.tweets_table(self.sizes["tweet_users"], self.sizes["tweets_per_user"], seed=self.seed)
+
+    def _make_clean_texts(self):
+        from preprocessing import clean_texts
+        return clean_texts(self.get("tweets")["Tweet"].tolist()[:self.sizes["model_tweets"]])
+
+    def _make_users(self):
+        return synthetic.user_table(self.sizes["db_users"], seed=self.seed)
+
+    def _make_models(self):
+        """ModelSentiment and ModelTopic on the NumPy backend, they read their npz files from the working directory"""
+        from model import ModelSentiment, ModelTopic
+        from sentiment_numpy import NUMPY_SENTIMENT_PATH
+        from topic_numpy import NUMPY_TOPIC_PATH
+        if self.workdir is None:
+            self.workdir = tempfile.mkdtemp(prefix="mooner-bench-")
+        synthetic.sentiment_model(os.path.join(self.workdir, NUMPY_SENTIMENT_PATH), seed=self.seed)
+        synthetic.topic_model(os.path.join(self.workdir, NUMPY_TOPIC_PATH), seed=self.seed)
+        with working_directory(self.workdir):
+            senti, topic = ModelSentiment(backend="numpy"), ModelTopic(backend="numpy")
+        _, splitter = synthetic.sentence_splitter()
+        if splitter is not None:
+            topic.model.sentence_splitter = splitter
+        return senti, topic
+
+@contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+# every setup takes the fixtures and returns (function to time, number of items it handles)
+
+def setup_graph_insert(data):
+    from graph_store import EdgeListGraph
+    edges, _, _ = data.get("network")
+    pairs = list(zip(edges["source"].tolist(), edges["target"].tolist()))
+    def run():
+        graph = EdgeListGraph()
+        for a, b in pairs: # one call per fetched follower, as the crawl engine does
+            graph.add_edge(a, b)
+        return graph.to_csr()
+    return run, len(pairs)
+
+def setup_louvain(data):
+    from communities import louvain
+    _, graph, _ = data.get("network")
+    return lambda: louvain(graph, seed=data.seed), graph.number_of_nodes()
+
+def setup_pagerank(data):
+    from centrality import community_centrality
+    _, graph, truth = data.get("network")
+    return lambda: community_centrality(graph, truth, "pagerank"), graph.number_of_nodes()
+
+def setup_degree_centrality(data):
+    from centrality import degree_centrality
+    _, graph, truth = data.get("network")
+    return lambda: degree_centrality(graph, truth), graph.number_of_nodes()
+
+def setup_tweet_filter(data):
+    from tweet_quality import score_tweets, select_tweets
+    tweets = data.get("tweets")
+    return lambda: select_tweets(score_tweets(tweets)), len(tweets)
+
+def setup_preprocess(data):
+    from model import preprocess
+    texts = data.get("tweets")["Tweet"].tolist()
+    return lambda: [preprocess(x) for x in texts], len(texts)
+
+def setup_clean_texts(data):
+    from preprocessing import clean_texts
+    texts = data.get("tweets")["Tweet"].tolist()
+    return lambda: clean_texts(texts), len(texts)
+
+def setup_sentiment(data):
+    senti, _ = data.get("models")
+    texts = data.get("clean_texts")
+    return lambda: senti.run(texts), len(texts)
+
+def setup_topic(data):
+    _, topic = data.get("models")
+    texts = data.get("clean_texts")
+    return lambda: topic.run(texts), len(texts)
+
+def setup_aggregate(data):
+    from profiles import TOPIC_COLUMNS, aggregate_users, make_user_table
+    userids = data.get("tweets")["User ID"].to_numpy()
+    rng = np.random.default_rng(data.seed)
+    pos_neg = rng.random((len(userids), 1)).astype(np.float32) # model outputs, as build.profile_tweets passes them
+    topics = rng.dirichlet(np.ones(len(TOPIC_COLUMNS)), size=len(userids))
+    return lambda: make_user_table(*aggregate_users(userids, pos_neg, topics)), len(userids)
+
+def setup_similarity(data):
+    from similarity import SimilarityEngine
+    users = data.get("users")
+    vectors = users.drop(columns="ID").to_numpy(dtype=np.float32)
+    engine = SimilarityEngine(users["ID"].to_numpy(), vectors)
+    queries = vectors[np.random.default_rng(data.seed).choice(len(vectors), data.sizes["queries"], replace=False)]
+    def run():
+        for query in queries: # one web request each, as in WebApp._find_similar_5
+            engine.query_ids(query, k=10)
+    return run, len(queries)
+
+# name, stage, unit of one item, setup
+CASES = [("graph_insert", "crawl", "edge", setup_graph_insert),
+         ("louvain", "network", "node", setup_louvain),
+         ("pagerank", "network", "node", setup_pagerank),
+         ("degree_centrality", "network", "node", setup_degree_centrality),
+         ("tweet_filter", "tweets", "tweet", setup_tweet_filter),
+         ("preprocess", "models", "tweet", setup_preprocess),
+         ("clean_texts", "models", "tweet", setup_clean_texts),
+         ("sentiment", "models", "tweet", setup_sentiment),
+         ("topic", "models", "tweet", setup_topic),
+         ("aggregate", "build", "tweet", setup_aggregate),
+         ("similarity", "recommend", "query", setup_similarity)]
+
+def select_cases(patterns=None):
+    """Cases whose name or stage matches one of the glob patterns, all of them by default"""
+    if not patterns:
+        return list(CASES)
+    return [x for x in CASES if any(fnmatch.fnmatch(x[0], p) or fnmatch.fnmatch(x[1], p) for p in patterns)]
+
+def measure(func, repeat=5, warmup=1):
+    """Seconds of every timed call"""
+    for _ in range(warmup):
+        func()
+    times = []
+    enabled = gc.isenabled()
+    try:
+        for _ in range(repeat):
+            gc.collect()
+            gc.disable()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+            if enabled:
+                gc.enable()
+    finally:
+        if enabled:
+            gc.enable()
+    return times
+
+def run_benchmarks(scales=DEFAULT_SCALES, patterns=None, repeat=5, warmup=1, seed=0, sizes=SCALES, log=print):
+    """Time the selected cases at every scale, return the results dict that save_results writes"""
+    results = []
+    for scale in scales:
+        data = Fixtures(sizes[scale], seed)
+        try:
+            for name, stage, unit, setup in select_cases(patterns):
+                result = {"case": name, "stage": stage, "scale": scale, "unit": unit}
+                try:
+                    func, items = setup(data)
+                except ImportError as e: # an optional package of that stage is missing
+                    result["skipped"] = str(e)
+                    log("{:<18} {:<7} skipped: {}".format(name, scale, e))
+                    results.append(result)
+                    continue
+                times = measure(func, repeat, warmup)
+                result.update({"items": items, "times": times, "best": min(times), "median": float(np.median(times)),
+                               "per_item_us": min(times) / max(items, 1) * 1e6})
+                log("{:<18} {:<7} best {:9.4f}s  median {:9.4f}s  {:10.2f}us per {}".format(
+                    name, scale, result["best"], result["median"], result["per_item_us"], unit))
+                results.append(result)
+        finally:
+            data.close()
+    splitter, _ = synthetic.sentence_splitter()
+    settings = {"scales": {x: sizes[x] for x in scales}, "cases": patterns or "all", "repeat": repeat, "warmup": warmup,
+                "seed": seed, "sentence_splitter": splitter}
+    return {"format": RESULTS_FORMAT, "version": RESULTS_VERSION, "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "environment": environment(), "settings": settings, "results": results}
+
+def environment():
+    return {"git_commit": _git("rev-parse", "HEAD"), "git_dirty": bool(_git("status", "--porcelain")),
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "platform": platform.platform(), "machine": platform.machine(), "processor": platform.processor(),
+            "cpu_count": os.cpu_count()}
+
+def _git(*args):
+    try:
+        return subprocess.run(("git",) + args, cwd=ROOT, capture_output=True, text=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def save_results(results, path=None):
+    """Write results atomically, to results/<commit>.json by default, return the path"""
+    if path is None:
+        commit = results["environment"]["git_commit"][:10] or "unknown"
+        path = os.path.join(RESULTS_PATH, commit + ("-dirty" if results["environment"]["git_dirty"] else "") + ".json")
+    folder = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(path + ".tmp", "w") as outFile:
+        json.dump(results, outFile, indent=1)
+    os.replace(path + ".tmp", path)
+    return path
+
+def load_results(path):
+    with open(path, "r") as inFile:
+        results = json.load(inFile)
+    if results.get("format") != RESULTS_FORMAT or results.get("version") != RESULTS_VERSION:
+        raise ValueError("{} is not a {} version {} file".format(path, RESULTS_FORMAT, RESULTS_VERSION))
+    return results
+
+def compare(base, new, threshold=0.1, min_seconds=0.001, metric="best"):
+    """One row per case and scale: case, scale, base seconds, new seconds, ratio, status
+    status is regression when new is more than threshold slower and the difference is over min_seconds (timer noise),
+    faster for the same the other way, ok, or added / removed / skipped"""
+    def timed(results):
+        return {(x["case"], x["scale"]): x for x in results["results"]}
+    before, after = timed(base), timed(new)
+    rows = []
+    for key in list(before) + [x for x in after if x not in before]:
+        old, now = before.get(key), after.get(key)
+        if old is None or now is None:
+            rows.append(key + (None, None, None, "added" if old is None else "removed"))
+        elif metric not in old or metric not in now:
+            rows.append(key + (old.get(metric), now.get(metric), None, "skipped"))
+        else:
+            ratio = now[metric] / old[metric] if old[metric] > 0 else float("inf")
+            status = "ok"
+            if abs(now[metric] - old[metric]) > min_seconds:
+                if ratio > 1 + threshold:
+                    status = "regression"
+                elif ratio < 1 / (1 + threshold):
+                    status = "faster"
+            rows.append(key + (old[metric], now[metric], ratio, status))
+    return rows
+
+def environment_changes(base, new):
+    """Environment fields and data settings that differ, timings of other machines, libraries or data are not comparable"""
+    keys = ("python", "numpy", "pandas", "machine", "processor", "cpu_count")
+    changes = {x: (base["environment"].get(x), new["environment"].get(x)) for x in keys
+               if base["environment"].get(x) != new["environment"].get(x)}
+    for key in ("seed", "sentence_splitter"):
+        if base["settings"].get(key) != new["settings"].get(key):
+            changes[key] = (base["settings"].get(key), new["settings"].get(key))
+    for scale in set(base["settings"]["scales"]) & set(new["settings"]["scales"]):
+        if base["settings"]["scales"][scale] != new["settings"]["scales"][scale]:
+            changes[scale + " sizes"] = (base["settings"]["scales"][scale], new["settings"]["scales"][scale])
+    return changes
+
+def print_comparison(rows):
+    print("{:<18} {:<7} {:>10} {:>10} {:>7}  {}".format("case", "scale", "base (s)", "new (s)", "ratio", "status"))
+    for case, scale, old, now, ratio, status in rows:
+        cells = ["{:10.4f}".format(x) if x is not None else "{:>10}".format("-") for x in (old, now)]
+        change = "{:6.2f}x".format(ratio) if ratio is not None else "{:>7}".format("-")
+        print("{:<18} {:<7} {} {} {}  {}".format(case, scale, cells[0], cells[1], change, status.upper() if status == "regression" else status))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the Mooner pipeline on synthetic data")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="time the cases and save the results as json")
+    run_parser.add_argument("--scales", nargs="+", default=list(DEFAULT_SCALES), choices=list(SCALES))
+    run_parser.add_argument("--cases", nargs="+", default=None, help="glob patterns of case or stage names, e.g. louvain 'models'")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--warmup", type=int, default=1)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default=None, help="defaults to results/<git commit>.json")
+    compare_parser = commands.add_parser("compare", help="list the cases that got slower, exit code 1 if any")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="allowed slow down, 0.1 is 10%%")
+    compare_parser.add_argument("--min-seconds", type=float, default=0.001, help="smaller differences are timer noise")
+    compare_parser.add_argument("--metric", default="best", choices=["best", "median"])
+    commands.add_parser("list", help="list the cases and scales")
+    args = parser.parse_args()
+    if args.command == "run":
+        results = run_benchmarks(args.scales, args.cases, args.repeat, args.warmup, args.seed)
+        print("Saved to {}".format(save_results(results, args.output)))
+    elif args.command == "compare":
+        base, new = load_results(args.base), load_results(args.new)
+        for key, (old, now) in environment_changes(base, new).items():
+            print("Warning: {} differs, {} -> {}".format(key, old, now))
+        rows = compare(base, new, args.threshold, args.min_seconds, args.metric)
+        print_comparison(rows)
+        regressions = [x for x in rows if x[-1] == "regression"]
+        if len(regressions) > 0:
+            print("{} regressions over {:.0%}".format(len(regressions), args.threshold))
+            sys.exit(1)
+    else:
+        for name, stage, unit, _ in CASES:
+            print("{:<18} {:<10} per {}".format(name, stage, unit))
+        for scale, sizes in SCALES.items():
+            print("{:<7} {}".format(scale, ", ".join("{}={}".format(k, v) for k, v in sizes.items())))
@@ -0,0 +1,134 @@
+# This file contains the synthetic data of the benchmarks, nothing is fetched from twitter
+# Every generator takes a seed and gives the same data for the same arguments on any machine
+#   follower_edges  source,target table like NetworkData/fetchcontent.csv, over a graph with planted communities
+#   tweets_table    User ID,Tweet table like DataProcess/tweets_200_processed.csv, with tags, urls, retweets and repeats
+#   user_table      ID plus one column per topic like Recommender/data.csv
+#   sentiment_model and topic_model write random weights in the npz formats of Recommender/sentiment_numpy.py
+#   and Recommender/topic_numpy.py, with the layer sizes of SentimentAnalysis/Model.ipynb
+
+import os
+import re
+import sys
+import json
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("NetworkData", "DataProcess", "Recommender"):
+    if os.path.join(ROOT, folder) not in sys.path:
+        sys.path.insert(0, os.path.join(ROOT, folder))
+
+from communities import planted_partition
+from profiles import TOPIC_COLUMNS
+from preprocessing import stem
+
+COMMON_WORDS = ("the be to of and a in that have i it for not on with he as you do at this but his by from they we say her "
+                "she or an will my one all would there their what so up out if about who get which go me when make can like "
+                "time no just him know take people into year your good some could them see other than then now look only "
+                "come its over think also back after use two how our work first well way even new want because any these "
+                "give day most us game team music love happy great today night win vote space launch car price").split()
+SYLLABLES = ("ba be bi bo bu da de di do ka ke ki ko la le li lo ma me mi mo na ne ni no pa pe pi po ra re ri ro "
+             "sa se si so ta te ti to va ve vi za ze zi ing er ed ly tion").split()
+STOP_WORDS = ("the", "be", "to", "of", "and", "a", "in", "that", "it", "for", "on", "with", "as", "at", "i")
+
+# SentimentAnalysis/Model.ipynb: Embedding(20000, 128) -> Conv1D(256, 5) -> MaxPooling1D(4) -> Bidirectional(LSTM(80)) -> Dense(1)
+SENTIMENT_LAYERS = {"num_words": 20000, "embedding": 128, "filters": 256, "kernel_size": 5, "pool_size": 4, "units": 80, "pad_len": 45}
+
+def vocabulary(size=5000, seed=0):
+    """Common english words followed by made up words of 2 to 4 syllables, most frequent first"""
+    rng = np.random.default_rng(seed)
+    words = list(COMMON_WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES, rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+def follower_edges(num_nodes, num_communities=None, avg_degree=12, mixing=0.1, seed=0):
+    """Edge table like fetchcontent.csv, every edge once in crawl order (shuffled)
+    Return (edges, CSRGraph, community of every node in graph order)"""
+    num_communities = num_communities or max(2, num_nodes // 500)
+    graph, truth = planted_partition(num_nodes, num_communities, avg_degree, mixing, seed)
+    sources, targets = graph.edges()
+    order = np.random.default_rng(seed).permutation(len(sources))
+    return pd.DataFrame({"source": sources[order], "target": targets[order]}), graph, truth
+
+def tweets_table(num_users, tweets_per_user=50, seed=0, retweet_share=0.15, repeat_share=0.05):
+    """User ID, Tweet table, word counts from 1 to 30 so the quality filter drops some tweets"""
+    rng = np.random.default_rng(seed)
+    words = np.array(vocabulary(seed=seed))
+    weights = 1 / np.arange(1, len(words) + 1) # zipf, a few words make most of the text
+    weights /= weights.sum()
+    userids = np.sort(rng.choice(2**40, size=num_users, replace=False)) + 10**6
+    num_tweets = num_users * tweets_per_user
+    lengths = rng.integers(1, 31, num_tweets)
+    tokens = words[rng.choice(len(words), size=lengths.sum(), p=weights)]
+    bounds = np.r_[0, np.cumsum(lengths)]
+    kinds = rng.random((num_tweets, 4)) # retweet, mention, hashtag, url
+    tweets = []
+    for i in range(num_tweets):
+        text = " ".join(tokens[bounds[i]:bounds[i+1]])
+        if kinds[i, 1] < 0.3:
+            text = "@user{} {}".format(i % 997, text)
+        if kinds[i, 2] < 0.2:
+            text += " #{}".format(tokens[bounds[i]])
+        if kinds[i, 3] < 0.1:
+            text += " https://t.co/x{:05d}".format(i % 99991)
+        if kinds[i, 0] < retweet_share:
+            text = "RT @user{}: {}".format(i % 89, text)
+        if i % tweets_per_user > 0 and rng.random() < repeat_share: # the same tweet again, differently cased
+            text = tweets[-1].upper() + "!"
+        tweets.append(text.capitalize() if kinds[i, 3] > 0.5 else text)
+    return pd.DataFrame({"User ID": np.repeat(userids, tweets_per_user), "Tweet": tweets})
+
+def user_table(num_users, seed=0):
+    """ID plus one column per topic, sign weighted averages in [-100, 100] as build.py writes them"""
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(2**40, size=num_users, replace=False)) + 10**6
+    topics = rng.dirichlet(np.full(len(TOPIC_COLUMNS), 0.3), size=num_users) * 100 * rng.uniform(-0.5, 1, (num_users, 1))
+    df = pd.DataFrame(topics.astype(np.float32), columns=TOPIC_COLUMNS)
+    df.insert(0, "ID", ids)
+    return df
+
+def sentiment_model(path, seed=0, layers=SENTIMENT_LAYERS):
+    """Random weights for NumpySentiment, the vocabulary is the one tweets_table draws from"""
+    rng = np.random.default_rng(seed)
+    words = vocabulary(seed=seed)
+    embed, filters, units = layers["embedding"], layers["filters"], layers["units"]
+    config = {"pad_len": layers["pad_len"], "conv_kernel_size": layers["kernel_size"], "conv_strides": 1, "conv_activation": "relu",
+              "pool_size": layers["pool_size"], "pool_strides": layers["pool_size"], "lstm_activation": "tanh",
+              "lstm_recurrent_activation": "sigmoid", "dense_activation": "sigmoid",
+              "tokenizer": {"num_words": layers["num_words"], "filters": '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n', "lower": True,
+                            "split": " ", "oov_token": None}}
+    def normal(*shape):
+        return rng.normal(scale=0.1, size=shape).astype(np.float32)
+    weights = {"embedding": normal(layers["num_words"], embed), "conv_kernel": normal(layers["kernel_size"], embed, filters),
+               "conv_bias": normal(filters), "dense_kernel": normal(2 * units, 1), "dense_bias": normal(1)}
+    for direction in ("forward", "backward"):
+        weights[direction + "_kernel"] = normal(filters, 4 * units)
+        weights[direction + "_recurrent_kernel"] = normal(units, 4 * units)
+        weights[direction + "_bias"] = normal(4 * units)
+    np.savez(path, config=np.array(json.dumps(config)), words=np.array(words), word_ids=np.arange(1, len(words) + 1), **weights)
+    return path
+
+def topic_model(path, seed=0):
+    """Random log probabilities for NumpyTopic over the stems of the tweets_table vocabulary, one class per topic"""
+    rng = np.random.default_rng(seed)
+    words = sorted({stem(x) for x in vocabulary(seed=seed)} - set(STOP_WORDS))
+    config = {"lowercase": True, "binary": False, "sublinear_tf": False, "use_idf": True, "norm": "l2"}
+    np.savez(path, config=np.array(json.dumps(config)), words=np.array(words), word_ids=np.arange(len(words)),
+             stop_words=np.array(sorted(STOP_WORDS)), idf=rng.uniform(1, 8, len(words)),
+             feature_log_prob=np.log(rng.dirichlet(np.full(len(words), 0.5), size=len(TOPIC_COLUMNS))),
+             class_log_prior=np.log(np.full(len(TOPIC_COLUMNS), 1 / len(TOPIC_COLUMNS))), targets=np.array(TOPIC_COLUMNS))
+    return path
+
+def sentence_splitter():
+    """nltk sent_tokenize when the punkt data is installed, else a regex stand-in, return (name, function or None)"""
+    try:
+        from nltk.tokenize import sent_tokenize
+        sent_tokenize("punkt data installed?")
+        return "punkt", None # NumpyTopic loads it by itself
+    except (ImportError, LookupError):
+        return "regex", lambda text: [x for x in re.split(r"(?<=[a-z]{3}[.!?])\s+", text) if x]
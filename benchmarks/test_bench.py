@@ -0,0 +1,69 @@
+# Tests for the benchmark suite, every case runs once on tiny synthetic data
+# run with: python -m pytest test_bench.py
+
+import json
+import numpy as np
+import pytest
+import bench
+import synthetic
+from bench import run_benchmarks, save_results, load_results, compare, environment_changes
+
+TINY = {"tiny": {"nodes": 300, "tweet_users": 6, "tweets_per_user": 10, "model_tweets": 20, "db_users": 500, "queries": 3}}
+
+def test_generators_are_reproducible():
+    edges, graph, truth = synthetic.follower_edges(300, seed=1)
+    again, _, _ = synthetic.follower_edges(300, seed=1)
+    assert list(edges.columns) == ["source", "target"]
+    assert edges.equals(again)
+    assert len(truth) == graph.number_of_nodes()
+    tweets = synthetic.tweets_table(5, 20, seed=1)
+    assert list(tweets.columns) == ["User ID", "Tweet"]
+    assert tweets.equals(synthetic.tweets_table(5, 20, seed=1))
+    assert not tweets.equals(synthetic.tweets_table(5, 20, seed=2))
+    assert tweets["Tweet"].str.startswith("RT @").any()
+    users = synthetic.user_table(50)
+    assert users.columns[0] == "ID" and users.shape == (50, 21)
+    assert users["ID"].is_unique
+
+def test_every_case_runs(tmp_path):
+    lines = []
+    results = run_benchmarks(["tiny"], repeat=2, warmup=0, sizes=TINY, log=lines.append)
+    assert [x["case"] for x in results["results"]] == [x[0] for x in bench.CASES]
+    for result in results["results"]:
+        assert "skipped" not in result, result
+        assert len(result["times"]) == 2 and result["best"] == min(result["times"])
+        assert result["items"] > 0
+    assert results["settings"]["scales"] == TINY
+    path = save_results(results, str(tmp_path / "run.json"))
+    assert load_results(path) == json.loads(json.dumps(results))
+
+def test_cases_are_picked_by_name_or_stage():
+    assert [x[0] for x in bench.select_cases(["louvain"])] == ["louvain"]
+    assert [x[0] for x in bench.select_cases(["network"])] == ["louvain", "pagerank", "degree_centrality"]
+    assert [x[0] for x in bench.select_cases(["*_centrality", "topic"])] == ["degree_centrality", "topic"]
+
+def make_results(times, seed=0):
+    return {"format": bench.RESULTS_FORMAT, "version": bench.RESULTS_VERSION, "environment": {"python": "3", "cpu_count": 1},
+            "settings": {"seed": seed, "scales": {"small": {"nodes": 10}}},
+            "results": [{"case": case, "scale": "small", "best": best, "median": best} for case, best in times.items()]}
+
+def test_compare_flags_regressions_over_threshold():
+    base = make_results({"a": 1.0, "b": 1.0, "c": 1.0, "d": 0.0001, "gone": 1.0})
+    new = make_results({"a": 1.05, "b": 1.5, "c": 0.5, "d": 0.0005, "new": 1.0})
+    rows = {row[0]: row for row in compare(base, new, threshold=0.1, min_seconds=0.001)}
+    assert rows["a"][-1] == "ok"
+    assert rows["b"][-1] == "regression" and rows["b"][4] == pytest.approx(1.5)
+    assert rows["c"][-1] == "faster"
+    assert rows["d"][-1] == "ok" # 5x slower, but under the noise floor
+    assert rows["gone"][-1] == "removed" and rows["new"][-1] == "added"
+    assert compare(base, new, threshold=0.6)[1][-1] == "ok"
+
+def test_compare_warns_about_other_environments(tmp_path):
+    base, new = make_results({"a": 1.0}), make_results({"a": 1.0}, seed=1)
+    new["environment"]["cpu_count"] = 8
+    assert environment_changes(base, new) == {"cpu_count": (1, 8), "seed": (0, 1)}
+    path = str(tmp_path / "other.json")
+    with open(path, "w") as outFile:
+        json.dump({"format": "something else"}, outFile)
+    with pytest.raises(ValueError):
+        load_results(path)